@@ -0,0 +1,92 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from time import perf_counter
+
+
+class ActionScheduler(object):
+    """ Runs actions (e.g. programming an instrument) in a single background
+    thread, such that they overlap with the waits of the measurement. The
+    actions run one at a time, in the order in which they are submitted; the
+    result of an action is collected with result, which waits for the action
+    to complete and raises the exception of the action if it failed.
+
+    The scheduler does not guard the instruments: the instruments that are
+    used by a pending action should not be used by the caller until the
+    result of that action has been collected.
+
+    :param enabled: whether to run the actions in the background; if False,
+        the actions are run immediately when they are submitted
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ActionScheduler") if enabled else None
+
+        self.futures = dict()
+
+        self.number_run = 0
+        self.wait_time = 0.
+
+    def submit(self, key, function, *args, **kwargs):
+        """ Schedule an action.
+
+        :param key: the key by which the result of the action is collected
+        :param function: the function to run
+        """
+        if key in self.futures:
+            log.warning(f"Discarding the result of the earlier action {key}")
+            self.discard(key)
+
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(function(*args, **kwargs))
+            except Exception as exception:
+                future.set_exception(exception)
+        else:
+            future = self.executor.submit(function, *args, **kwargs)
+
+        self.futures[key] = future
+        self.number_run += 1
+
+    def pending(self, key):
+        """ Whether an action with the given key was submitted and its result
+        was not yet collected.
+        """
+        return key in self.futures
+
+    def result(self, key):
+        """ Wait for the action with the given key to complete and return its
+        result.
+        """
+        future = self.futures.pop(key)
+
+        start = perf_counter()
+        try:
+            return future.result()
+        finally:
+            self.wait_time += perf_counter() - start
+
+    def discard(self, key):
+        """ Wait for the action with the given key to complete and discard its
+        result; a failure of the action is logged.
+        """
+        future = self.futures.pop(key)
+        wait([future])
+
+        if future.exception() is not None:
+            log.error(f"Background action {key} failed", exc_info=future.exception())
+
+    def shutdown(self):
+        """ Wait for all actions to complete (discarding their results) and
+        stop the background thread.
+        """
+        for key in list(self.futures.keys()):
+            self.discard(key)
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,225 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import csv
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyqtgraph as pg
+from pymeasure.display.curves import ResultsCurve
+from pymeasure.experiment import Results
+
+from .ColumnarResults import ColumnarWriter, iter_columnar, read_columnar, read_metadata
+from .RunningStatistics import RunningStatistics
+
+
+class ResultsAggregator(object):
+    """ Running mean and standard error of two columns of a results file per
+    pulse number and probe configuration. The rows are read incrementally
+    from the file (only the rows that were added since the previous update,
+    and only the required columns), such that the memory use scales with the
+    number of pulses instead of the number of rows.
+
+    :param filename: the (text) results file
+    :param block_size: the maximum number of bytes that is read at once
+    """
+
+    GROUP_COLUMNS = ["Pulse number", "Probe configuration"]
+
+    def __init__(self, filename, block_size=2**23):
+        self.filename = filename
+        self.block_size = block_size
+        self.reset()
+
+    def reset(self, x=None, y=None):
+        """ Forget the aggregated rows and aggregate the given columns.
+        """
+        self.x, self.y = x, y
+        self.labels = None
+        self.offset = 0
+        self.groups = dict()
+
+    def _read_labels(self, file):
+        """ Read the column labels that follow the header, and set the offset
+        to the first row.
+        """
+        while True:
+            line = file.readline()
+            if not line.endswith(b"\n"):
+                return False
+            if not line.startswith(Results.COMMENT.encode()):
+                break
+
+        self.labels = next(csv.reader([line.decode()]))
+        self.offset = file.tell()
+        return True
+
+    def _read_blocks(self):
+        """ Read the complete rows that were added since the previous read.
+
+        :return: a generator of DataFrames with the required columns
+        """
+        columns = list(dict.fromkeys(self.GROUP_COLUMNS + [self.x, self.y]))
+
+        with open(self.filename, "rb") as file:
+            if self.labels is None and not self._read_labels(file):
+                return
+
+            if any(column not in self.labels for column in columns):
+                return
+
+            file.seek(self.offset)
+            while True:
+                block = file.read(self.block_size)
+                end = block.rfind(b"\n") + 1
+                if end == 0:
+                    return
+
+                self.offset += end
+                file.seek(self.offset)
+
+                yield pd.read_csv(BytesIO(block[:end]), header=None, names=self.labels,
+                                  usecols=columns, comment=Results.COMMENT)
+
+    def _add(self, frame):
+        pulse = frame["Pulse number"].to_numpy(dtype=float)
+        probe = np.nan_to_num(frame["Probe configuration"].to_numpy(dtype=float), nan=-1)
+        x = frame[self.x].to_numpy(dtype=float)
+        y = frame[self.y].to_numpy(dtype=float)
+
+        # Only the rows in which the y-column is filled are aggregated
+        valid = np.isfinite(y)
+        keys, inverse = np.unique(np.column_stack([pulse[valid], probe[valid]]),
+                                  axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+
+        # Rows of a single pulse and probe are consecutive
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        x, y = x[valid][order], y[valid][order]
+
+        for i, key in enumerate(map(tuple, keys)):
+            if key not in self.groups:
+                self.groups[key] = (RunningStatistics(), RunningStatistics())
+            statistics_x, statistics_y = self.groups[key]
+            statistics_x.add(x[bounds[i]:bounds[i + 1]])
+            statistics_y.add(y[bounds[i]:bounds[i + 1]])
+
+    def update(self, x, y):
+        """ Aggregate the rows that were added since the previous update.
+
+        :param x: the column of the x-values
+        :param y: the column of the y-values
+        :return: arrays with the mean x-values, the mean y-values and the
+            standard errors of the y-values of the groups
+        """
+        if (x, y) != (self.x, self.y):
+            self.reset(x, y)
+
+        try:
+            for frame in self._read_blocks():
+                self._add(frame)
+        except OSError:
+            log.exception(f"Could not read {self.filename}")
+
+        statistics = list(self.groups.values())
+        return (
+            np.array([statistics_x.mean for statistics_x, _ in statistics]),
+            np.array([statistics_y.mean for _, statistics_y in statistics]),
+            np.array([statistics_y.standard_error() for _, statistics_y in statistics]),
+        )
+
+
+class ColumnarAggregator(ResultsAggregator):
+    """ Running mean and standard error of two columns of binary (columnar)
+    results per pulse number and probe configuration, for measurements that
+    only write binary results. Only the chunks that were written since the
+    previous update are read, and only the required columns.
+
+    :param path: the folder with the columnar results
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        super().__init__(None)
+
+    def reset(self, x=None, y=None):
+        super().reset(x, y)
+        self.chunks = 0
+
+    def _read_blocks(self):
+        columns = list(dict.fromkeys(self.GROUP_COLUMNS + [self.x, self.y]))
+
+        if not (self.path / ColumnarWriter.METADATA).is_file():
+            return
+        if any(column not in read_metadata(self.path)["columns"] for column in columns):
+            return
+
+        for chunk in iter_columnar(self.path, columns, start=self.chunks):
+            self.chunks += 1
+            yield pd.DataFrame(chunk)
+
+    def read_raw(self, x, y):
+        """ Read all rows of the given columns.
+        """
+        if not (self.path / ColumnarWriter.METADATA).is_file():
+            return np.empty(0), np.empty(0)
+
+        data = read_columnar(self.path, [x, y])
+        return data[x], data[y]
+
+
+class AggregatedResultsCurve(ResultsCurve):
+    """ Results curve that shows, for every pulse number and probe
+    configuration, the mean of the rows with the standard error as error bar,
+    instead of every single row. The raw rows are shown if raw is set (these
+    are then all loaded into memory, as for a normal results curve).
+
+    The rows of measurements that only write binary results are read from the
+    binary results next to the (header-only) text results file; these are
+    shown once they are written (at least every checkpoint interval).
+
+    :param results: the pymeasure Results object
+    :param x: the column of the x-values
+    :param y: the column of the y-values
+    :param raw: whether to show the raw rows
+    """
+
+    def __init__(self, results, x, y, raw=False, **kwargs):
+        super().__init__(results, x, y, **kwargs)
+        self.raw = raw
+
+        if getattr(results.procedure, "AAG_results_format", "text") == "binary":
+            self.aggregator = ColumnarAggregator(
+                Path(results.data_filename).with_suffix(".columns"))
+        else:
+            self.aggregator = ResultsAggregator(results.data_filename)
+
+        self.error_bars = pg.ErrorBarItem(pen=kwargs.get("pen", None))
+        self.error_bars.setParentItem(self)
+
+    def setPen(self, *args, **kwargs):
+        super().setPen(*args, **kwargs)
+        if hasattr(self, "error_bars"):
+            self.error_bars.setOpts(pen=self.opts["pen"])
+
+    def update(self):
+        """ Update the curve with the rows that were added to the results.
+        """
+        if self.raw:
+            self.error_bars.setVisible(False)
+            if isinstance(self.aggregator, ColumnarAggregator):
+                self.setData(*self.aggregator.read_raw(self.x, self.y))
+            else:
+                super().update()
+            return
+
+        x, y, error = self.aggregator.update(self.x, self.y)
+        self.setData(x, y)
+
+        error = np.nan_to_num(error)
+        self.error_bars.setData(x=x, y=y, top=error, bottom=error)
+        self.error_bars.setVisible(True)
@@ -0,0 +1,201 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class CachedDAQ(object):
+    """ Write-through cache around a zhinst data server session. Every node
+    that is written or read is remembered, such that redundant set and get
+    calls are not sent to the device:
+
+    - a set is skipped if the same value was already written to the node;
+    - a get returns the last value that was confirmed by the device;
+    - the remaining sets and gets are sent to the device as a single batch.
+
+    Because the device can coerce the written values (e.g. the time-constant),
+    a written node is only confirmed by reading it back from the device.
+
+    The cached nodes are subscribed to, such that the device reports when they
+    change (e.g. by the auto-ranger or from the front-panel); the changes are
+    picked up with every poll and with check_for_changes. Writing a trigger
+    node (e.g. the auto-range node) invalidates the nodes it affects.
+
+    All other methods (e.g. poll, sync, getSample) are passed on to the
+    wrapped session.
+
+    :param daq: the zhinst data server session
+    :param watch: whether to subscribe to the cached nodes to be notified of
+        changes on the device
+    """
+
+    # Nodes that trigger an action on the device (and are thus never cached)
+    # with the nodes that are changed by that action
+    TRIGGER_NODES = {
+        "sigins/0/autorange": ("sigins/0/range",),
+        "sigins/1/autorange": ("sigins/1/range",),
+        "currins/0/autorange": ("currins/0/range",),
+    }
+
+    def __init__(self, daq, watch=True):
+        self.daq = daq
+        self.watch = watch
+
+        self.requested = dict()
+        self.confirmed = dict()
+        self.watched = set()
+
+        self.number_skipped = 0
+        self.number_sent = 0
+
+    def __getattr__(self, name):
+        return getattr(self.daq, name)
+
+    @staticmethod
+    def _key(path):
+        return path.strip().lower()
+
+    def _trigger(self, key):
+        for trigger, affected in self.TRIGGER_NODES.items():
+            if key.endswith("/" + trigger):
+                device = key[:-len(trigger)]
+                return [device + node for node in affected]
+        return None
+
+    def _watch(self, keys):
+        if not self.watch:
+            return
+
+        keys = [key for key in keys if key not in self.watched]
+        if len(keys) > 0:
+            self.daq.subscribe(keys)
+            self.watched.update(keys)
+
+    def invalidate(self, path=None):
+        """ Forget the cached value of a node, or of all nodes if no path is
+        given.
+        """
+        if path is None:
+            self.requested.clear()
+            self.confirmed.clear()
+        else:
+            key = self._key(path)
+            self.requested.pop(key, None)
+            self.confirmed.pop(key, None)
+
+    def set(self, settings):
+        """ Write the settings that differ from the cached values in a single
+        transaction.
+
+        :param settings: a list of (path, value) tuples
+        """
+        changes = list()
+        invalidated = list()
+
+        for path, value in settings:
+            key = self._key(path)
+            affected = self._trigger(key)
+
+            if affected is not None:
+                invalidated.extend(affected)
+            elif self.requested.get(key, None) == value:
+                self.number_skipped += 1
+                continue
+
+            changes.append((path, value))
+
+        if len(changes) == 0:
+            return
+
+        self.daq.set(changes)
+        self.number_sent += len(changes)
+
+        for path, value in changes:
+            key = self._key(path)
+            if self._trigger(key) is not None:
+                continue
+
+            self.requested[key] = value
+            self.confirmed.pop(key, None)
+
+        for key in invalidated:
+            self.invalidate(key)
+
+        self._watch([self._key(path) for path, value in changes
+                     if self._trigger(self._key(path)) is None])
+
+    def setInt(self, path, value):
+        self.set([(path, int(value))])
+
+    def setDouble(self, path, value):
+        self.set([(path, float(value))])
+
+    def get_values(self, paths):
+        """ Get the values of several nodes; the nodes that have no confirmed
+        value are read from the device in a single transaction.
+
+        :param paths: a list of node paths
+        :return: a dictionary with the value for every given path
+        """
+        keys = [self._key(path) for path in paths]
+        missing = [key for key in keys if key not in self.confirmed]
+        values = dict()
+
+        if len(missing) > 0:
+            data = self.daq.get(",".join(missing), True)
+            self.number_sent += len(missing)
+
+            for key in missing:
+                values[key] = data[key]["value"][-1]
+
+                # The state of a trigger node (e.g. whether the auto-ranger
+                # is still running) is never cached
+                if self._trigger(key) is not None:
+                    continue
+
+                self.confirmed[key] = values[key]
+                self.requested.setdefault(key, self.confirmed[key])
+
+            self._watch([key for key in missing if self._trigger(key) is None])
+
+        self.number_skipped += len(keys) - len(missing)
+        values.update({key: self.confirmed[key] for key in keys if key not in values})
+
+        return {path: values[key] for path, key in zip(paths, keys)}
+
+    def getInt(self, path):
+        return int(self.get_values([path])[path])
+
+    def getDouble(self, path):
+        return float(self.get_values([path])[path])
+
+    def _update(self, data):
+        """ Update the cached values from the node changes in polled data.
+        """
+        for path, value in data.items():
+            key = self._key(path)
+            if key not in self.watched or "value" not in value:
+                continue
+
+            if len(value["value"]) == 0:
+                continue
+
+            new_value = value["value"][-1]
+            if key not in self.confirmed:
+                # Confirmation of a value that was written by us
+                self.confirmed[key] = new_value
+            elif self.confirmed[key] != new_value:
+                log.debug(f"Node {key} changed on the device to {new_value}")
+                self.confirmed[key] = new_value
+                self.requested.pop(key, None)
+
+    def poll(self, *args, **kwargs):
+        data = self.daq.poll(*args, **kwargs)
+        self._update(data)
+        return data
+
+    def check_for_changes(self):
+        """ Pick up the changes of the cached nodes that the device reported
+        since the last poll.
+        """
+        if len(self.watched) > 0:
+            self.poll(0, 0, 0, True)
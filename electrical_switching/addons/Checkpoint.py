@@ -0,0 +1,53 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+class Checkpoint(object):
+    """ Position of the measurement loop (the last completed cycle), stored
+    in a JSON file next to the results, such that an interrupted measurement
+    can be resumed. The file is replaced atomically, so that it always
+    contains a complete checkpoint, also if the software crashes while
+    writing it.
+
+    :param path: the checkpoint file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.number_saved = 0
+
+    def load(self):
+        """ Load the checkpoint.
+
+        :return: a dictionary with the stored state, or None if there is no
+            (readable) checkpoint
+        """
+        if not self.path.is_file():
+            return None
+
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            log.exception(f"Could not read the checkpoint {self.path}")
+            return None
+
+    def save(self, **state):
+        """ Store the state (which has to be JSON serializable), together with
+        the current date and time.
+        """
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump({
+                "date": datetime.now().isoformat(timespec="seconds"),
+                **state,
+            }, file, indent=1)
+        os.replace(temporary, self.path)
+
+        self.number_saved += 1
@@ -0,0 +1,46 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from threading import Lock
+import time
+
+
+class SystemClock(object):
+    """ Clock that uses the wall-clock time and actually sleeps.
+    """
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, duration):
+        if duration > 0:
+            time.sleep(duration)
+
+
+class VirtualClock(object):
+    """ Clock that does not actually sleep, but advances a virtual time
+    instead. This allows a (simulated) measurement to run without waiting for
+    the delays it requests.
+
+    :param start: the virtual time (s) to start at; defaults to the current
+        wall-clock time.
+    """
+
+    def __init__(self, start=None):
+        self._lock = Lock()
+        self._now = time.time() if start is None else start
+
+    def time(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, duration):
+        if duration > 0:
+            self.advance(duration)
+
+    def advance(self, duration):
+        """ Advance the virtual time by duration (s).
+        """
+        with self._lock:
+            self._now += duration
@@ -0,0 +1,175 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class ColumnarWriter(object):
+    """ Writes results to a folder with typed, compressed columns. The rows
+    are collected in an in-memory buffer and written as a single chunk (a
+    compressed NumPy .npz file with one array per column) once the buffer is
+    full or the writer is flushed or closed. A metadata file describes the
+    columns, their types, and the chunks.
+
+    :param path: the folder to write the results to; created if needed
+    :param columns: the list of column names
+    :param dtypes: dictionary with the NumPy dtype for (some of) the columns;
+        other columns are stored as 64-bit floats
+    :param buffer_size: the number of rows after which the buffer is written
+    :param parameters: dictionary with parameters stored in the metadata
+    """
+
+    METADATA = "metadata.json"
+
+    def __init__(self, path, columns, dtypes=None, buffer_size=10000, parameters=None):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.dtypes = {column: np.dtype("f8") for column in self.columns}
+        if dtypes is not None:
+            self.dtypes.update({key: np.dtype(value) for key, value in dtypes.items()})
+        self.buffer_size = buffer_size
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.metadata = {
+            "columns": self.columns,
+            "dtypes": {column: self.dtypes[column].str for column in self.columns},
+            "parameters": {} if parameters is None else
+            {key: str(value) for key, value in parameters.items()},
+            "chunks": [],
+            "rows": 0,
+        }
+
+        # Continue an existing file
+        if (self.path / self.METADATA).is_file():
+            existing = read_metadata(self.path)
+            if existing["columns"] != self.columns:
+                raise ValueError(f"Existing results in {self.path} have other columns")
+            self.metadata["chunks"] = existing["chunks"]
+            self.metadata["rows"] = existing["rows"]
+
+        self._clear_buffer()
+        self._write_metadata()
+
+    def _clear_buffer(self):
+        self.buffer = {column: list() for column in self.columns}
+        self.buffered = 0
+
+    def _write_metadata(self):
+        temporary = self.path / (self.METADATA + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump(self.metadata, file, indent=1)
+        os.replace(temporary, self.path / self.METADATA)
+
+    def append(self, row):
+        """ Add a single row (a dictionary with the column names as keys) to
+        the buffer; missing columns are stored as nan (or the empty value of
+        the column type).
+        """
+        for column in self.columns:
+            self.buffer[column].append(row.get(column, np.nan))
+        self.buffered += 1
+
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def extend(self, rows):
+        """ Add several rows to the buffer.
+        """
+        for row in rows:
+            self.append(row)
+
+    def _array(self, column):
+        dtype = self.dtypes[column]
+        values = self.buffer[column]
+
+        if dtype.kind in "iub":
+            # Integer columns cannot contain nan; store those as -1
+            values = [-1 if isinstance(v, float) and np.isnan(v) else v for v in values]
+        elif dtype.kind == "U":
+            values = ["" if isinstance(v, float) and np.isnan(v) else str(v) for v in values]
+
+        return np.asarray(values, dtype=dtype)
+
+    def flush(self):
+        """ Write the buffered rows as a new chunk.
+        """
+        if self.buffered == 0:
+            return
+
+        name = "chunk_%06d.npz" % len(self.metadata["chunks"])
+        arrays = {"c%d" % i: self._array(column) for i, column in enumerate(self.columns)}
+
+        temporary = self.path / (name + ".tmp")
+        with open(temporary, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary, self.path / name)
+
+        self.metadata["chunks"].append({"file": name, "rows": self.buffered})
+        self.metadata["rows"] += self.buffered
+        self._write_metadata()
+
+        self._clear_buffer()
+
+    def close(self):
+        """ Write the remaining buffered rows.
+        """
+        self.flush()
+
+
+def read_metadata(path):
+    """ Read the metadata of columnar results.
+
+    :param path: the folder with the columnar results
+    """
+    with open(Path(path) / ColumnarWriter.METADATA, "r") as file:
+        return json.load(file)
+
+
+def iter_columnar(path, columns=None, start=0):
+    """ Iterate over the chunks of columnar results; only the requested
+    columns are read from disk.
+
+    :param path: the folder with the columnar results
+    :param columns: the list of columns to read; all columns if None
+    :param start: the number of chunks to skip (e.g. that were read before)
+    :return: a generator of dictionaries with an array for every column
+    """
+    metadata = read_metadata(path)
+    keys = {column: "c%d" % i for i, column in enumerate(metadata["columns"])}
+
+    if columns is None:
+        columns = metadata["columns"]
+
+    unknown = [column for column in columns if column not in keys]
+    if len(unknown) > 0:
+        raise KeyError(f"Unknown columns: {unknown}")
+
+    for chunk in metadata["chunks"][start:]:
+        with np.load(Path(path) / chunk["file"], allow_pickle=False) as data:
+            yield {column: data[keys[column]] for column in columns}
+
+
+def read_columnar(path, columns=None):
+    """ Read columnar results; only the requested columns are read from disk.
+
+    :param path: the folder with the columnar results
+    :param columns: the list of columns to read; all columns if None
+    :return: a dictionary with an array for every column
+    """
+    metadata = read_metadata(path)
+    if columns is None:
+        columns = metadata["columns"]
+
+    chunks = list(iter_columnar(path, columns))
+    if len(chunks) == 0:
+        return {column: np.empty(0, dtype=metadata["dtypes"][column])
+                for column in columns}
+
+    return {column: np.concatenate([chunk[column] for chunk in chunks])
+            for column in columns}
@@ -0,0 +1,136 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import numpy as np
+
+from .Clock import SystemClock
+
+
+class DemodulatorStream(object):
+    """ Streaming acquisition of demodulator samples from a zhinst data
+    server session. Instead of requesting single samples with getSample,
+    the demodulators are subscribed to and the buffered samples are polled
+    in blocks. The device timestamps are converted to host time (seconds
+    since the epoch), such that they can be stored as "Timestamp (s)".
+
+    :param daq: the zhinst data server session (or an object with the same
+        interface)
+    :param device: the device id (e.g. "dev4285")
+    :param demods: the indices of the demodulators to stream
+    :param poll_length: the duration (s) of a single poll
+    :param timeout: the timeout (ms) of a single poll
+    :param clock: the clock that provides the host time
+    """
+
+    def __init__(self, daq, device, demods=(0,), poll_length=0.1, timeout=500,
+                 clock=None):
+        self.daq = daq
+        self.clock = SystemClock() if clock is None else clock
+        self.device = device
+        self.demods = tuple(demods)
+        self.poll_length = poll_length
+        self.timeout = timeout
+
+        self.paths = {
+            "/%s/demods/%d/sample" % (device, demod): demod for demod in self.demods
+        }
+
+        self.clockbase = None
+        self.time_offset = None
+
+    def subscribe(self):
+        """ Subscribe to the demodulator sample nodes and discard any data that
+        was buffered before the subscription.
+        """
+        self.clockbase = float(self.daq.getInt("/%s/clockbase" % self.device))
+        self.time_offset = None
+
+        self.daq.subscribe(list(self.paths.keys()))
+        self.daq.sync()
+
+    def unsubscribe(self):
+        """ Stop streaming the demodulator samples.
+        """
+        self.daq.unsubscribe(list(self.paths.keys()))
+
+    def read(self):
+        """ Poll a single block of samples.
+
+        :return: a dictionary with, for every demodulator index, a dictionary
+            with the arrays "timestamp" (s), "x" (V) and "y" (V). Demodulators
+            without new samples have empty arrays.
+        """
+        data = self.daq.poll(self.poll_length, self.timeout, 0, True)
+        received = self.clock.time()
+
+        block = dict()
+        for path, demod in self.paths.items():
+            sample = data.get(path, None)
+
+            if sample is None or len(sample["timestamp"]) == 0:
+                block[demod] = {
+                    "timestamp": np.empty(0),
+                    "x": np.empty(0),
+                    "y": np.empty(0),
+                }
+                continue
+
+            timestamp = np.asarray(sample["timestamp"], dtype=float) / self.clockbase
+
+            # Anchor the device clock to the host clock on the first block;
+            # the last sample in the block arrived (approximately) just now.
+            if self.time_offset is None:
+                self.time_offset = received - timestamp[-1]
+
+            block[demod] = {
+                "timestamp": timestamp + self.time_offset,
+                "x": np.asarray(sample["x"], dtype=float),
+                "y": np.asarray(sample["y"], dtype=float),
+            }
+
+        return block
+
+    @staticmethod
+    def aligned(block, reference):
+        """ Match the samples of all demodulators in a block to the samples of
+        a reference demodulator. For every reference sample, the sample of
+        another demodulator that is nearest in time (within half a sample
+        interval) is selected; if there is none, nan is used.
+
+        :param block: a block of samples as returned by read
+        :param reference: the index of the reference demodulator
+        :return: a block with the same structure in which all demodulators
+            have the timestamps of the reference demodulator
+        """
+        timestamps = block[reference]["timestamp"]
+        if len(timestamps) > 1:
+            tolerance = np.min(np.diff(timestamps)) / 2
+        else:
+            tolerance = np.inf
+
+        result = dict()
+        for demod, samples in block.items():
+            if demod == reference:
+                result[demod] = samples
+                continue
+
+            x = np.full(len(timestamps), np.nan)
+            y = np.full(len(timestamps), np.nan)
+
+            other = samples["timestamp"]
+            if len(other) > 0 and len(timestamps) > 0:
+                # Select the nearest of the two neighbouring samples
+                after = np.clip(np.searchsorted(other, timestamps), 0, len(other) - 1)
+                before = np.maximum(after - 1, 0)
+                nearest = np.where(
+                    np.abs(other[before] - timestamps) < np.abs(other[after] - timestamps),
+                    before, after)
+
+                match = np.abs(other[nearest] - timestamps) <= tolerance
+                x[match] = samples["x"][nearest[match]]
+                y[match] = samples["y"][nearest[match]]
+
+            result[demod] = {"timestamp": timestamps, "x": x, "y": y}
+
+        return result
@@ -0,0 +1,221 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from collections import ChainMap
+from pathlib import Path
+
+import pyqtgraph as pg
+from pymeasure.display.Qt import QtCore, QtGui
+from pymeasure.display.widgets import SequenceEvaluationException
+from pymeasure.display.windows import ManagedWindow
+
+from .AggregatedResultsCurve import AggregatedResultsCurve
+from .ResultBatcher import BatchResults
+from .SequencePlanner import SequencePlanner
+from .TimeEstimator import TimeEstimator
+
+
+class MainWindow(ManagedWindow):
+    """ The main window of the electrical switching measurements, with the
+    estimated duration of the measurement, curves that aggregate the rows per
+    pulse, and a sequencer that queues the measurements in a planned order.
+
+    :param procedure_class: the MeasurementProcedure class
+    """
+
+    def __init__(self, procedure_class):
+        super(MainWindow, self).__init__(
+            procedure_class=procedure_class,
+            inputs=(
+                "AAC_folder",
+                "AAD_filename_base",
+                "AAE_yaml_config_file",
+                "AAF_simulation",
+                "AAG_results_format",
+                "AAH_results_batch_size",
+                "AAI_results_batch_interval",
+                "AAJ_phase_timing",
+                "AAK_resume_results_file",
+                "AAL_checkpoint_interval",
+                "AAM_keep_connections",
+                "number_of_repeats",
+                "pulse_amplitude",
+                "pulse_compliance",
+                "pulse_length",
+                "pulse_burst_length",
+                "pulse_delay",
+                "pulse_number_of_bursts",
+                "pulse_hardware_timed",
+                "probe_delay",
+                "probe_amplitude",
+                "probe_frequency",
+                "probe_time_constant",
+                "probe_duration",
+                "probe_streaming",
+                "probe_sample_rate",
+                "probe_raw_capture",
+                "probe_harmonics",
+                "probe_pipelined",
+                "probe_adaptive",
+                "probe_target_error",
+                "probe_min_duration",
+                "probe_target_ry",
+                "probe_settling_detection",
+                "probe_settling_tolerance",
+                "probe_series_resistance",
+                "probe_current",
+                "temperature_control",
+                "temperature_sp",
+                "temperature_poll_interval",
+                "temperature_max_age",
+                "temperature_interpolate",
+                "field_control",
+                "field_mT",
+                "field_handover",
+                "sequence_reorder",
+                "sequence_reorder_probes",
+            ),
+            x_axis="Pulse number",
+            y_axis="Probe 1 x (V)",
+            displays=(
+                "pulse_amplitude",
+                "pulse_compliance",
+                "pulse_length",
+                "pulse_burst_length",
+                "temperature_sp",
+                "field_mT",
+            ),
+            sequencer=True,
+            inputs_in_scrollarea=True,
+        )
+
+        self.estimator = TimeEstimator(self)
+
+        self.inputs.AAG_results_format.setToolTip(
+            "With \"binary\", the text results file only contains the header (the "
+            "parameters); the plot shows the rows once they are written to the binary "
+            "results, which is at least every checkpoint interval.")
+
+        # Toggle between the rows aggregated per pulse and the raw rows
+        self.raw_view_box = QtGui.QCheckBox("Show raw rows")
+        self.raw_view_box.stateChanged.connect(self.set_raw_view)
+        dock = QtGui.QDockWidget("Plot")
+        dock.setWidget(self.raw_view_box)
+        dock.setFeatures(QtGui.QDockWidget.NoDockWidgetFeatures)
+        self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, dock)
+
+        # Queue sequences through the sequence planner
+        self.sequencer.queue_button.clicked.disconnect()
+        self.sequencer.queue_button.clicked.connect(self.queue_sequence)
+
+        self.manager.failed.connect(self.failed)
+
+    def new_curve(self, results, color=None, **kwargs):
+        """ Create a curve that shows the mean and standard error of the rows
+        per pulse and probe configuration (or the raw rows if selected).
+        """
+        if color is None:
+            color = pg.intColor(self.browser.topLevelItemCount() % 8)
+        kwargs.setdefault("pen", pg.mkPen(color=color, width=2))
+        kwargs.setdefault("antialias", False)
+
+        curve = AggregatedResultsCurve(
+            results,
+            x=self.plot_widget.plot_frame.x_axis,
+            y=self.plot_widget.plot_frame.y_axis,
+            raw=self.raw_view_box.isChecked(),
+            **kwargs
+        )
+        curve.setSymbol(None)
+        curve.setSymbolBrush(None)
+        return curve
+
+    def set_raw_view(self):
+        raw = self.raw_view_box.isChecked()
+        for item in self.plot.items:
+            if isinstance(item, AggregatedResultsCurve):
+                item.raw = raw
+                item.update()
+
+    def queue_sequence(self):
+        """ Queue the measurements of the sequencer in the order planned by
+        the sequence planner, which also lets consecutive measurements hand the
+        magnetic field over to each other.
+        """
+        self.sequencer.queue_button.setEnabled(False)
+
+        try:
+            sequence = self.sequencer._generate_sequence_from_tree()
+        except SequenceEvaluationException:
+            log.error("Evaluation of one of the sequence strings went wrong, no sequence queued.")
+        else:
+            procedures = list()
+            for entry in sequence:
+                procedure = self.make_procedure()
+                procedure.set_parameters(dict(ChainMap(*entry[::-1])))
+                procedures.append(procedure)
+
+            planner = SequencePlanner(
+                reorder=all(procedure.sequence_reorder for procedure in procedures),
+                handover=all(procedure.field_handover for procedure in procedures),
+            )
+            procedures = planner.plan(procedures)
+
+            log.info("Queuing %d measurements based on the entered sequences." % len(procedures))
+            for procedure in procedures:
+                QtGui.QApplication.processEvents()
+                self.queue(procedure=procedure)
+        finally:
+            self.sequencer.queue_button.setEnabled(True)
+
+    def finished(self, experiment):
+        super().finished(experiment)
+
+        # Ramp down a magnetic field that was handed over to a measurement
+        # that is no longer queued, and close the instrument connections once
+        # the queue is empty
+        if not self.manager.experiments.has_next():
+            self.procedure_class.close_connections()
+
+    # The queue is stopped after an abort or a failure
+    def abort_returned(self, experiment):
+        super().abort_returned(experiment)
+        self.procedure_class.close_connections()
+
+    def failed(self, experiment):
+        self.procedure_class.close_connections()
+
+    def closeEvent(self, event):
+        """ Stop a running measurement, such that it brings the instruments in
+        a safe state, and close the instrument connections when the window is
+        closed.
+        """
+        if self.manager.is_running():
+            self.manager.abort()
+            self.manager._worker.join()
+
+        self.procedure_class.close_connections()
+        super().closeEvent(event)
+
+    def queue(self, *args, procedure=None):
+        if procedure is None:
+            procedure = self.make_procedure()
+
+        # A resumed measurement appends to the results of the interrupted one
+        filename = procedure.find_results_filename()
+        if procedure.AAK_resume_results_file and not Path(filename).is_file():
+            log.error(f"Cannot resume {filename}: the file does not exist")
+            return
+
+        procedure.results_filename = filename
+        results = BatchResults(procedure, filename)
+
+        # manual define a curve to deal with nan values
+        curve = self.new_curve(results, connect="finite")
+        curve.setSymbol("o")
+        curve.setSymbolPen(curve.pen)
+
+        experiment = self.new_experiment(results, curve)
+
+        self.manager.queue(experiment)
@@ -0,0 +1,127 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import json
+from array import array
+
+import numpy as np
+
+from .Clock import SystemClock
+
+
+class _NullSpan(object):
+    """ Span that does nothing; shared by all spans of a disabled timer.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.timer.clock.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, self.timer.clock.time() - self.start)
+        return False
+
+
+class PhaseTimer(object):
+    """ Records the durations of named phases (spans) of the measurement:
+
+        with timer.span("probe settling"):
+            ...
+
+    Spans can be nested; the duration of a span includes that of the spans
+    within it. If the timer is disabled, span returns a shared object that
+    does nothing, such that the instrumentation costs (almost) nothing.
+
+    :param clock: the clock that provides the time
+    :param enabled: whether to record the spans
+    """
+
+    def __init__(self, clock=None, enabled=True):
+        self.clock = SystemClock() if clock is None else clock
+        self.enabled = enabled
+        self.durations = dict()
+        self.start = self.clock.time()
+
+    def span(self, name):
+        """ Context manager that records the duration of its body as a span
+        with the given name.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, duration):
+        """ Record a duration (s) for the given name.
+        """
+        if name not in self.durations:
+            self.durations[name] = array("d")
+        self.durations[name].append(duration)
+
+    def summary(self):
+        """ Summarize the recorded spans.
+
+        :return: a dictionary with, for every name, the number of spans and
+            the total, mean, median, 90th and 99th percentile, and maximum
+            duration (s), and the fraction of the elapsed time
+        """
+        elapsed = self.clock.time() - self.start
+
+        summary = dict()
+        for name, durations in self.durations.items():
+            durations = np.frombuffer(durations, dtype=float)
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+
+            summary[name] = {
+                "count": len(durations),
+                "total": float(durations.sum()),
+                "mean": float(durations.mean()),
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(durations.max()),
+                "fraction": float(durations.sum() / elapsed) if elapsed > 0 else np.nan,
+            }
+
+        return summary
+
+    def log_summary(self, logger=log):
+        """ Log the summary, with the phases ordered by their total duration.
+        """
+        summary = self.summary()
+        if len(summary) == 0:
+            return
+
+        logger.info("Phase timing (total, fraction of run, count, p50, p90, p99):")
+        for name, s in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+            logger.info(f"  {name:28s} {s['total']:10.3f} s {s['fraction']:6.1%} "
+                        f"{s['count']:8d} {s['p50']:9.4f} s {s['p90']:9.4f} s "
+                        f"{s['p99']:9.4f} s")
+
+    def write(self, path, **info):
+        """ Write the summary to a JSON file.
+
+        :param path: the file to write
+        :param info: additional information that is stored with the summary
+        """
+        with open(path, "w") as file:
+            json.dump({
+                **info,
+                "elapsed": self.clock.time() - self.start,
+                "phases": self.summary(),
+            }, file, indent=1)
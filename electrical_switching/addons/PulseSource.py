@@ -0,0 +1,180 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from math import ceil
+
+
+class PulseSource(object):
+    """ Session around the Keithley 6221 that keeps the waveform armed between
+    bursts. The waveform properties that were programmed are remembered; when
+    a burst is configured, only the properties that differ are written, and
+    the waveform is only aborted and re-armed if something changed.
+
+    All waveforms are programmed without offset, such that the output is at
+    zero while the waveform is armed but not running; the waveform is
+    programmed and armed before the pulse lines are connected to the sample.
+    Hardware-timed bursts therefore use an arbitrary waveform (one pulse
+    followed by zeros) instead of an offset square wave.
+
+    If programming fails, the state of the instrument is considered unknown
+    and the next configuration reprograms all properties.
+
+    :param k6221: the Keithley6221 instrument
+    """
+
+    # Range of the waveform frequency (Hz) and the number of points of an
+    # arbitrary waveform, which are written in chunks (as in pymeasure)
+    MIN_FREQUENCY = 1e-3
+    MAX_FREQUENCY = 1e5
+    MAX_ARBITRARY_POINTS = 65536
+    ARBITRARY_CHUNK = 100
+
+    # Maximum relative deviation of the period of a hardware-timed burst
+    # from the requested period (pulse length plus delay)
+    PERIOD_TOLERANCE = 1e-3
+
+    def __init__(self, k6221):
+        self.k6221 = k6221
+        self.programmed = dict()
+        self.armed = False
+
+        self.number_written = 0
+        self.number_skipped = 0
+
+    def configure(self, **properties):
+        """ Program the waveform with the given properties (e.g.
+        waveform_amplitude=0.01) and make sure it is armed.
+
+        :return: True if the waveform was reprogrammed, False if the armed
+            waveform could be used as is.
+        """
+        changes = {
+            key: value for key, value in properties.items()
+            if key not in self.programmed or self.programmed[key] != value
+        }
+        self.number_skipped += len(properties) - len(changes)
+
+        if len(changes) == 0 and self.armed:
+            return False
+
+        try:
+            self.disarm()
+
+            if len(self.programmed) == 0:
+                self.k6221.clear()
+
+            for key, value in changes.items():
+                if key == "waveform_arbitrary":
+                    self.write_arbitrary(*value)
+                else:
+                    setattr(self.k6221, key, value)
+                self.programmed[key] = value
+                self.number_written += 1
+
+            self.k6221.waveform_arm()
+            self.armed = True
+        except Exception:
+            self.reset()
+            raise
+
+        return True
+
+    @classmethod
+    def burst_schedule(cls, length, delay, number):
+        """ Determine the arbitrary waveform that outputs a burst of pulses from
+        a single trigger. A period of the waveform consists of a number of
+        points at the pulse level followed by points at zero, all of equal
+        duration; the pulse length is kept exact, and the period (pulse length
+        plus delay) is approximated by the number of points.
+
+        The burst can be reproduced if the period is within the tolerance
+        with at most MAX_ARBITRARY_POINTS points, and the frequency of the
+        waveform is in range; e.g. a pulse of 3 ms with a delay of up to about
+        three minutes (a single point at the pulse level), or of 1 ms with a
+        delay of up to about a minute. Bursts with a longer delay relative to
+        the pulse length, or with a period below 10 us or above 1000 s (the
+        range of the waveform frequency), cannot be reproduced.
+
+        :param length: the length (s) of a single pulse
+        :param delay: the delay (s) between consecutive pulses
+        :param number: the number of pulses in the burst
+        :return: a tuple with the period (s), the number of points at the
+            pulse level, the number of points of a period, and the
+            (fractional) number of cycles, or None if the burst cannot be
+            represented as a single waveform.
+        """
+        period = length + delay
+        if length <= 0 or delay <= 0 or not cls.MIN_FREQUENCY <= 1 / period <= cls.MAX_FREQUENCY:
+            return None
+
+        # The fewest points that represent the period within the tolerance
+        for high in range(1, cls.MAX_ARBITRARY_POINTS):
+            points = round(high * period / length)
+            if points > cls.MAX_ARBITRARY_POINTS:
+                return None
+
+            if points > high and \
+                    abs(points * length / high - period) <= cls.PERIOD_TOLERANCE * period:
+                break
+        else:
+            return None
+
+        period = points * length / high
+
+        # End the waveform right after the end of the last pulse; the output
+        # is at zero after the last pulse in any case
+        cycles = ceil((number - 1 + high / points) * 1e3) / 1e3
+
+        return period, high, points, cycles
+
+    def trigger(self):
+        """ Start the armed waveform.
+        """
+        if not self.armed:
+            raise RuntimeError("The waveform of the pulse source is not armed")
+
+        self.k6221.waveform_start()
+
+    def hits_compliance(self):
+        """ Check whether the compliance was hit since the previous check. This
+        makes use of the status bit registers and specifically reads bit 3
+        (compliance) of the Measurement Event Register; reading the register
+        also clears it.
+
+        :return: 1 if the compliance was hit, 0 otherwise
+        """
+        event_bytes = self.k6221.measurement_events
+        return int(format(event_bytes, "08b")[-4])
+
+    def write_arbitrary(self, high, points):
+        """ Write an arbitrary waveform of a number of points at the pulse
+        level (1) followed by points at zero, and select it as the waveform
+        function (which is remembered as programmed).
+
+        :param high: the number of points at the pulse level
+        :param points: the total number of points
+        """
+        data = [1] * high + [0] * (points - high)
+        chunks = range(0, points, self.ARBITRARY_CHUNK)
+        for i in chunks:
+            command = ":SOUR:WAVE:ARB:DATA" if i == 0 else ":SOUR:WAVE:ARB:APP"
+            chunk = data[i:i + self.ARBITRARY_CHUNK]
+            self.k6221.write("%s %s" % (command, ", ".join(str(x) for x in chunk)))
+
+        self.k6221.write(":SOUR:WAVE:ARB:COPY 1")
+        self.k6221.waveform_function = "arbitrary1"
+        self.programmed["waveform_function"] = "arbitrary1"
+
+    def disarm(self):
+        """ Abort the waveform output and disarm the waveform.
+        """
+        self.k6221.waveform_abort()
+        self.armed = False
+
+    def reset(self):
+        """ Forget the programmed properties, such that the next
+        configuration reprograms the instrument completely.
+        """
+        self.programmed.clear()
+        self.armed = False
@@ -0,0 +1,170 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class RawCapture(object):
+    """ Stores the full demodulator stream of every probe window in a folder
+    with an append-only binary file of samples (timestamp, x, y, r, phase, and
+    demodulator) and an index of the windows (pulse number, probe
+    configuration, first sample, and number of samples). The samples are
+    written as they are streamed, such that only a single block is kept in
+    memory; they are read back as a memory-mapped array (see raw_window),
+    such that a window can be sliced without loading the whole file.
+
+    A window is only added to the index once it is complete; the samples of
+    an interrupted window are not indexed.
+
+    :param path: the folder to write the samples to; created if needed, and
+        appended to if it exists
+    :param parameters: dictionary with parameters stored in the metadata
+    """
+
+    DTYPE = np.dtype([
+        ("timestamp", "<f8"),
+        ("x", "<f8"),
+        ("y", "<f8"),
+        ("r", "<f8"),
+        ("phase", "<f8"),
+        ("demod", "u1"),
+    ])
+
+    SAMPLES = "samples.bin"
+    INDEX = "index.csv"
+    METADATA = "metadata.json"
+    INDEX_COLUMNS = ["pulse number", "probe configuration", "start", "count"]
+
+    def __init__(self, path, parameters=None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        with open(self.path / self.METADATA, "w") as file:
+            json.dump({
+                "dtype": self.DTYPE.descr,
+                "index columns": self.INDEX_COLUMNS,
+                "parameters": {} if parameters is None else
+                {key: str(value) for key, value in parameters.items()},
+            }, file, indent=1)
+
+        # Continue after the complete samples of an existing file
+        samples = self.path / self.SAMPLES
+        self.position = samples.stat().st_size // self.DTYPE.itemsize if samples.is_file() else 0
+        self.samples = open(samples, "r+b" if samples.is_file() else "wb")
+        self.samples.seek(self.position * self.DTYPE.itemsize)
+        self.samples.truncate()
+
+        index = self.path / self.INDEX
+        new_index = not index.is_file()
+        self.index = open(index, "a")
+        if new_index:
+            self.index.write(",".join(self.INDEX_COLUMNS) + "\n")
+            self.index.flush()
+
+        self.window = None
+
+        self.number_samples = 0
+        self.number_windows = 0
+
+    def start_window(self, pulse_number, probe):
+        """ Start the samples of a probe window.
+
+        :param pulse_number: the number of the preceding pulse
+        :param probe: the probe configuration (number)
+        """
+        self.window = (pulse_number, probe, self.position)
+
+    def append(self, demod, timestamps, x, y):
+        """ Append samples of a single demodulator to the current window.
+
+        :param demod: the (zero-based) demodulator number
+        :param timestamps: the timestamps (s) of the samples
+        :param x: the x-values (V) of the samples
+        :param y: the y-values (V) of the samples
+        """
+        records = np.empty(len(timestamps), dtype=self.DTYPE)
+        records["timestamp"] = timestamps
+        records["x"] = x
+        records["y"] = y
+        records["r"] = np.hypot(x, y)
+        records["phase"] = np.arctan2(y, x)
+        records["demod"] = demod
+
+        records.tofile(self.samples)
+        self.position += len(records)
+        self.number_samples += len(records)
+
+    def end_window(self):
+        """ Complete the current window and add it to the index.
+        """
+        if self.window is None:
+            return
+
+        pulse_number, probe, start = self.window
+        self.window = None
+
+        # The samples are on disk before the window is indexed
+        self.samples.flush()
+        self.index.write("%d,%d,%d,%d\n" % (pulse_number, probe, start, self.position - start))
+        self.index.flush()
+        self.number_windows += 1
+
+    def close(self):
+        self.end_window()
+        self.samples.close()
+        self.index.close()
+
+
+def read_raw_index(path):
+    """ Read the index of the windows of a raw capture.
+
+    :param path: the folder with the raw capture
+    :return: a dictionary with an integer array for every index column
+    """
+    index = np.loadtxt(Path(path) / RawCapture.INDEX, delimiter=",", skiprows=1,
+                       dtype=np.int64, ndmin=2)
+    return {column: index[:, i] for i, column in enumerate(RawCapture.INDEX_COLUMNS)}
+
+
+def open_raw_samples(path):
+    """ Open the samples of a raw capture as a (read-only) memory-mapped
+    structured array; the samples are only read from disk when accessed.
+
+    :param path: the folder with the raw capture
+    """
+    samples = Path(path) / RawCapture.SAMPLES
+    count = samples.stat().st_size // RawCapture.DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RawCapture.DTYPE)
+    return np.memmap(samples, dtype=RawCapture.DTYPE, mode="r", shape=(count,))
+
+
+def raw_window(path, pulse_number, probe, demod=None):
+    """ The samples of the probe window(s) with the given pulse number and
+    probe configuration.
+
+    :param path: the folder with the raw capture
+    :param pulse_number: the pulse number of the window
+    :param probe: the probe configuration of the window
+    :param demod: only return the samples of this demodulator; None for all
+        (a memory-mapped slice, without copying)
+    :return: a structured array with the samples
+    """
+    index = read_raw_index(path)
+    samples = open_raw_samples(path)
+
+    windows = np.flatnonzero((index["pulse number"] == pulse_number) &
+                             (index["probe configuration"] == probe))
+    parts = [samples[index["start"][i]:index["start"][i] + index["count"][i]] for i in windows]
+
+    if len(parts) == 0:
+        return np.empty(0, dtype=RawCapture.DTYPE)
+    window = parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    if demod is not None:
+        window = window[window["demod"] == demod]
+    return window
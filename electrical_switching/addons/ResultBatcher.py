@@ -0,0 +1,105 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from pymeasure.experiment import Results
+from pymeasure.experiment.results import CSVFormatter
+
+from .Clock import SystemClock
+
+
+class ResultBatcher(object):
+    """ Collects the result rows of a procedure and emits them as a single
+    block (a list of rows) once the maximum number of rows is reached or the
+    oldest row exceeds the maximum age. With a maximum of a single row, every
+    row is emitted on its own, as before.
+
+    The age of the rows is checked when a row is added; before waiting, the
+    procedure has to call expire, such that rows are not held back for the
+    duration of the wait.
+
+    The emitted blocks have to be written by a formatter that understands
+    them, i.e. the results have to be a BatchResults object.
+
+    :param emit: the function that emits the results (procedure.emit)
+    :param max_rows: the maximum number of rows in a block
+    :param max_age: the maximum time (s) a row is held back; None for no limit
+    :param clock: the clock that is used to determine the age of the rows
+    """
+
+    def __init__(self, emit, max_rows=1, max_age=None, clock=None):
+        self.emit = emit
+        self.max_rows = max(int(max_rows), 1)
+        self.max_age = max_age
+        self.clock = SystemClock() if clock is None else clock
+
+        self.rows = list()
+        self.first_time = None
+
+        self.number_rows = 0
+        self.number_blocks = 0
+
+    def append(self, row):
+        """ Add a row; the block is emitted if it is full or too old.
+        """
+        if self.max_rows == 1:
+            self.emit("results", row)
+            self.number_rows += 1
+            self.number_blocks += 1
+            return
+
+        if len(self.rows) == 0:
+            self.first_time = self.clock.time()
+        self.rows.append(row)
+
+        if len(self.rows) >= self.max_rows or (
+                self.max_age is not None and
+                self.clock.time() - self.first_time >= self.max_age):
+            self.flush()
+
+    def expire(self, within=0.):
+        """ Emit the collected rows if the oldest row exceeds the maximum age
+        within the given time.
+
+        :param within: the time (s) until the next row can be added, e.g.
+            the duration of a wait
+        """
+        if self.max_age is None or len(self.rows) == 0:
+            return
+
+        if self.clock.time() + within - self.first_time >= self.max_age:
+            self.flush()
+
+    def flush(self):
+        """ Emit the collected rows (if any).
+        """
+        if len(self.rows) == 0:
+            return
+
+        rows, self.rows = self.rows, list()
+        self.emit("results", rows)
+        self.number_rows += len(rows)
+        self.number_blocks += 1
+
+
+class BatchFormatter(CSVFormatter):
+    """ CSV formatter that formats both single rows and blocks of rows (as
+    emitted by the ResultBatcher); a block is formatted as multiple lines,
+    such that it is written to the results file at once.
+    """
+
+    def format(self, record):
+        if isinstance(record, (list, tuple)):
+            return Results.LINE_BREAK.join(super(BatchFormatter, self).format(row)
+                                           for row in record)
+        return super().format(record)
+
+
+class BatchResults(Results):
+    """ Results that can record blocks of rows, as emitted by the
+    ResultBatcher, next to single rows.
+    """
+
+    def __init__(self, procedure, data_filename):
+        super().__init__(procedure, data_filename)
+        self.formatter = BatchFormatter(columns=self.procedure.DATA_COLUMNS)
@@ -0,0 +1,72 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import numpy as np
+
+
+class RunningStatistics(object):
+    """ Running mean and variance of a signal (Welford's algorithm, extended
+    to blocks of values), such that the standard error of the mean can be
+    followed while the signal is acquired. Nan values are ignored.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.nan
+        self.m2 = 0.
+
+    def add(self, values):
+        """ Add a single value or an array of values.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        values = values[~np.isnan(values)]
+
+        if len(values) == 0:
+            return
+
+        mean = values.mean()
+        self._merge(len(values), mean, np.sum((values - mean)**2))
+
+    def merge(self, other):
+        """ Add the values of another RunningStatistics object.
+        """
+        if other.count > 0:
+            self._merge(other.count, other.mean, other.m2)
+
+    def _merge(self, count, mean, m2):
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return
+
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """ The (unbiased) sample variance; nan for fewer than two values.
+        """
+        if self.count < 2:
+            return np.nan
+        return self.m2 / (self.count - 1)
+
+    def standard_error(self, effective_count=None):
+        """ The standard error of the mean.
+
+        :param effective_count: the number of independent values, if the
+            values are correlated (e.g. oversampled with respect to the
+            filter bandwidth); the number of values is used if it is smaller.
+        :return: the standard error, or nan for fewer than two values
+        """
+        if self.count < 2:
+            return np.nan
+
+        count = self.count
+        if effective_count is not None:
+            count = min(count, max(effective_count, 1))
+
+        return np.sqrt(self.variance / count)
@@ -0,0 +1,310 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class SequenceCompiler(object):
+    """ Compiles the (declarative) sequence of a measurement into an explicit
+    plan of cycles, each consisting of a pulse followed by an ordered list of
+    probes. The routing of all pulses and probes is validated before any
+    instrument is touched.
+
+    The sequence is a list of steps; every step applies a pulse a number of
+    times ("bursts"), each time followed by the listed probes (all probes if
+    not given, none if empty), e.g.:
+
+        sequence:
+          - pulse: 1
+            bursts: 3
+            probes: [R1xy, R3xy]
+          - pulse: 2
+            bursts: 3
+
+    The order of the pulses is kept. The probes after a pulse are applied in
+    the listed order, unless reordering is enabled; they are then ordered to
+    reduce the reconfiguration: probes with the same lock-in settings are
+    grouped, and the next probe is the one that requires the fewest relay
+    switches from the routing of the current one. Note that reordering
+    changes the time after the pulse at which each probe is measured.
+
+    :param rows: dictionary with the row for each connection (e.g. "pulse
+        high" or "lock-in input A")
+    :param pulses: dictionary with the parameters of every pulse
+    :param probes: dictionary with the parameters of every probe (by number)
+    :param probe_names: dictionary with the name of every probe (by number)
+    :param number_of_bursts: the number of bursts of a step if not given by
+        the step or the pulse
+    :param reorder: whether the probes after a pulse are ordered to reduce
+        the reconfiguration
+    :param keep_routing: whether the routing of a probe is kept until the
+        next probe of the cycle is routed; otherwise the matrix is
+        disconnected after every probe
+    """
+
+    ROWS = range(1, 7)
+    COLUMNS = range(1, 9)
+
+    STEP_KEYS = ["pulse", "bursts", "probes"]
+    PROBE_KEYS = ["current high", "current low", "voltage high", "voltage low"]
+    PROBE_ROWS = ["lock-in output A", "lock-in output B", "lock-in input A", "lock-in input B"]
+    LOCKIN_KEYS = ["time constant", "frequency", "amplitude", "harmonics"]
+
+    def __init__(self, rows, pulses, probes, probe_names, number_of_bursts=1, reorder=False,
+                 keep_routing=False):
+        self.rows = rows
+        self.pulses = pulses
+        self.probes = probes
+        self.probe_names = probe_names
+        self.number_of_bursts = number_of_bursts
+        self.reorder = reorder
+        self.keep_routing = keep_routing
+
+        self.routing = dict()
+
+    @classmethod
+    def columns(cls, value, name):
+        """ The list of columns of a connection, which can be a single column
+        or a list of columns.
+        """
+        columns = value if isinstance(value, (list, tuple)) else [value]
+        for column in columns:
+            if isinstance(column, bool) or not isinstance(column, int) or \
+                    column not in cls.COLUMNS:
+                raise ValueError(f"Invalid column {column!r} for {name}; the columns "
+                                 f"are {cls.COLUMNS[0]} to {cls.COLUMNS[-1]}")
+        return columns
+
+    def validate(self):
+        """ Check the rows and the columns of all pulses and probes, and
+        determine the crosspoints (row, column) that each of them closes.
+        """
+        for name, row in self.rows.items():
+            if isinstance(row, bool) or not isinstance(row, int) or row not in self.ROWS:
+                raise ValueError(f"Invalid row {row!r} for {name}; the rows "
+                                 f"are {self.ROWS[0]} to {self.ROWS[-1]}")
+        if len(set(self.rows.values())) != len(self.rows):
+            raise ValueError(f"Rows are used for more than one connection: {self.rows}")
+
+        self.routing = dict()
+
+        for pulse, params in self.pulses.items():
+            for key in ["high", "low"]:
+                if key not in params:
+                    raise ValueError(f"Pulse {pulse} has no \"{key}\" columns")
+            high = self.columns(params["high"], f"pulse {pulse}")
+            low = self.columns(params["low"], f"pulse {pulse}")
+
+            # A column connected to both pulse rows shorts the pulse source
+            if set(high) & set(low):
+                raise ValueError(f"Pulse {pulse} connects columns {sorted(set(high) & set(low))} "
+                                 f"to both the high and the low side")
+
+            self.routing[("pulse", pulse)] = frozenset(
+                [(self.rows["pulse high"], column) for column in high] +
+                [(self.rows["pulse low"], column) for column in low])
+
+        for probe, params in self.probes.items():
+            name = f"probe {self.probe_names.get(probe, probe)}"
+            for key in self.PROBE_KEYS:
+                if key not in params:
+                    raise ValueError(f"{name.capitalize()} has no \"{key}\" column")
+            columns = [self.columns(params[key], name) for key in self.PROBE_KEYS]
+
+            if set(columns[0]) & set(columns[1]) or set(columns[2]) & set(columns[3]):
+                raise ValueError(f"{name.capitalize()} connects a column to both the "
+                                 f"high and the low side of the current or the voltage")
+
+            self.routing[("probe", probe)] = frozenset(
+                (self.rows[row], column)
+                for row, row_columns in zip(self.PROBE_ROWS, columns)
+                for column in row_columns)
+
+    def pulse_name(self, value):
+        pulse = str(value)
+        if pulse not in self.pulses:
+            pulse = pulse.replace("pulse ", "")
+        if pulse not in self.pulses:
+            raise ValueError(f"Unknown pulse {value!r} in the sequence; the pulses are "
+                             f"{', '.join(self.pulses)}")
+        return pulse
+
+    def probe_number(self, value):
+        numbers = {name: probe for probe, name in self.probe_names.items()}
+        name = str(value)
+        if name not in numbers:
+            name = name.replace("probe ", "")
+        if name not in numbers:
+            raise ValueError(f"Unknown probe {value!r} in the sequence; the probes are "
+                             f"{', '.join(numbers)}")
+        return numbers[name]
+
+    def default_sequence(self):
+        """ The sequence of all pulses (in the listed order), each followed by
+        all probes.
+        """
+        return [{"pulse": pulse} for pulse in self.pulses]
+
+    def parse(self, sequence):
+        """ Check the steps of a sequence and fill in their defaults.
+
+        :param sequence: list of steps (dictionaries)
+        :return: list of (pulse, number of bursts, probes) tuples
+        """
+        if not isinstance(sequence, list):
+            raise ValueError("The sequence should be a list of steps")
+
+        steps = list()
+        for i, step in enumerate(sequence, 1):
+            if not isinstance(step, dict) or "pulse" not in step:
+                raise ValueError(f"Step {i} of the sequence has no pulse")
+            unknown = [key for key in step if key not in self.STEP_KEYS]
+            if unknown:
+                raise ValueError(f"Step {i} of the sequence has unknown keys {unknown}")
+
+            pulse = self.pulse_name(step["pulse"])
+
+            bursts = step.get("bursts", self.pulses[pulse].get(
+                "number of bursts", self.number_of_bursts))
+            if isinstance(bursts, bool) or not isinstance(bursts, int) or bursts < 1:
+                raise ValueError(f"Invalid number of bursts {bursts!r} in step {i} of the sequence")
+
+            probes = step.get("probes", None)
+            if probes is None or probes == "all":
+                probes = list(self.probes.keys())
+            else:
+                if not isinstance(probes, (list, tuple)):
+                    probes = [probes]
+                probes = [self.probe_number(probe) for probe in probes]
+
+            steps.append((pulse, bursts, probes))
+
+        return steps
+
+    def settings(self, probe):
+        """ The lock-in settings of a probe.
+        """
+        params = self.probes[probe]
+        return tuple(str(params.get(key, None)) for key in self.LOCKIN_KEYS)
+
+    def order(self, probes, settings=None):
+        """ Order the probes that follow a pulse: the next probe is the one
+        with the fewest changes of the lock-in settings and (then, if the
+        routing is kept between probes) of the relays; equal probes keep
+        their listed order.
+
+        :param probes: the probes in the listed order
+        :param settings: the lock-in settings before the first probe
+        :return: tuple with the ordered probes
+        """
+        remaining = list(probes)
+        ordered = list()
+        routing = frozenset()  # The matrix is disconnected after pulsing
+
+        while len(remaining) > 0:
+            probe = min(remaining, key=lambda p: (
+                self.settings(p) != settings,
+                len(routing ^ self.routing[("probe", p)]) if self.keep_routing else 0))
+            remaining.remove(probe)
+            ordered.append(probe)
+
+            settings = self.settings(probe)
+            if self.keep_routing:
+                routing = self.routing[("probe", probe)]
+
+        return tuple(ordered)
+
+    def compile(self, sequence=None):
+        """ Validate the routing and compile the sequence into cycles.
+
+        :param sequence: list of steps; None for the default sequence
+        :return: list of (pulse, probes) tuples, one per cycle
+        """
+        self.validate()
+
+        if sequence is None:
+            sequence = self.default_sequence()
+
+        cycles = list()
+        settings = None
+        orders = dict()
+        for pulse, bursts, probes in self.parse(sequence):
+            for _ in range(bursts):
+                key = (tuple(probes), settings)
+                if key not in orders:
+                    orders[key] = self.order(probes, settings) if self.reorder else tuple(probes)
+                cycles.append((pulse, orders[key]))
+
+                if len(orders[key]) > 0:
+                    settings = self.settings(orders[key][-1])
+
+        return cycles
+
+    def report(self, cycles, number_of_repeats=1, pulsing_time=None, probing_time=None):
+        """ Count the reconfigurations of the compiled cycles and sum the time
+        in which no samples are taken.
+
+        :param cycles: the compiled cycles
+        :param number_of_repeats: the number of times the cycles are repeated
+        :param pulsing_time: function that returns the dead time (s) of a pulse
+        :param probing_time: function that returns the dead time (s) of a probe
+        :return: dictionary with the number of cycles, relay switches, and
+            lock-in reconfigurations, and the dead time (s)
+        """
+        # All repeats after the first start from the same state (that of the
+        # end of a repeat), and thus have the same reconfigurations
+        relay_switches, lockin_changes, routing, settings = self.count(cycles, frozenset(), None)
+        repeat = self.count(cycles, routing, settings)
+        if number_of_repeats > 1:
+            relay_switches += (number_of_repeats - 1) * repeat[0]
+            lockin_changes += (number_of_repeats - 1) * repeat[1]
+
+        dead_time = 0.
+        if pulsing_time is not None:
+            dead_time += sum(pulsing_time(pulse) for pulse, _ in cycles)
+        if probing_time is not None:
+            dead_time += sum(probing_time(probe) for _, probes in cycles for probe in probes)
+
+        return {
+            "cycles": len(cycles) * number_of_repeats,
+            "relay switches": relay_switches,
+            "lock-in changes": lockin_changes,
+            "dead time": dead_time * number_of_repeats,
+        }
+
+    def count(self, cycles, routing, settings):
+        """ Count the relay switches and lock-in reconfigurations of a single
+        repeat of the cycles.
+
+        :param cycles: the compiled cycles
+        :param routing: the closed crosspoints before the first cycle
+        :param settings: the lock-in settings before the first cycle
+        :return: the number of relay switches and lock-in reconfigurations,
+            and the routing and lock-in settings after the last cycle
+        """
+        relay_switches = 0
+        lockin_changes = 0
+
+        for pulse, probes in cycles:
+            # The pulse channels are disconnected after pulsing
+            target = self.routing[("pulse", pulse)]
+            relay_switches += len(routing ^ target) + len(target)
+            routing = frozenset()
+
+            for probe in probes:
+                target = self.routing[("probe", probe)]
+                relay_switches += len(routing ^ target)
+                routing = target
+
+                if not self.keep_routing:
+                    relay_switches += len(routing)
+                    routing = frozenset()
+
+                if self.settings(probe) != settings:
+                    lockin_changes += 1
+                    settings = self.settings(probe)
+
+            # The probe channels are disconnected after the last probe
+            relay_switches += len(routing)
+            routing = frozenset()
+
+        return relay_switches, lockin_changes, routing, settings
@@ -0,0 +1,136 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class SequencePlanner(object):
+    """ Orders the measurements (procedures) of a sequence to reduce the time
+    spent on changing the temperature and the magnetic field, and marks which
+    consecutive measurements can hand the magnetic field over to each other
+    instead of ramping it to zero in between.
+
+    The temperature set-points are visited monotonically, starting from the
+    end (lowest or highest) that is closest to the set-point of the first
+    measurement as listed. Within a temperature, the field set-points are
+    visited along a nearest-neighbour path, starting from the field of the
+    preceding measurement (or zero). Measurements with equal set-points keep
+    their listed order.
+
+    :param reorder: whether to reorder the measurements
+    :param handover: whether consecutive measurements with field control
+        hand the field over to each other
+    """
+
+    def __init__(self, reorder=True, handover=True):
+        self.reorder = reorder
+        self.handover = handover
+
+    @staticmethod
+    def temperature(procedure):
+        if not procedure.temperature_control:
+            return None
+        return procedure.temperature_sp
+
+    @staticmethod
+    def field(procedure):
+        if not procedure.field_control:
+            return 0.
+        return procedure.field_mT
+
+    def plan(self, procedures):
+        """ Plan the sequence.
+
+        :param procedures: the procedures in the listed order
+        :return: a list with the procedures in the planned order; the
+            attributes field_from_previous and field_to_next of the
+            procedures are set if the field is handed over
+        """
+        procedures = list(procedures)
+
+        if self.reorder and len(procedures) > 1:
+            before = self.cost(procedures, handover=False)
+            procedures = self.order(procedures)
+            after = self.cost(procedures, handover=self.handover)
+
+            log.info(f"Planned sequence of {len(procedures)} measurements: field ramps "
+                     f"{before[0]:.0f} s -> {after[0]:.0f} s, temperature changes "
+                     f"{before[1]:.1f} K -> {after[1]:.1f} K")
+
+        for procedure in procedures:
+            procedure.field_from_previous = False
+            procedure.field_to_next = False
+
+        if self.handover:
+            for previous, procedure in zip(procedures[:-1], procedures[1:]):
+                if previous.field_control and procedure.field_control:
+                    previous.field_to_next = True
+                    procedure.field_from_previous = True
+
+        return procedures
+
+    def order(self, procedures):
+        """ Order the procedures by temperature and, within a temperature, by
+        a nearest-neighbour path through the fields.
+        """
+        # Group the procedures by temperature (in the listed order)
+        groups = dict()
+        for procedure in procedures:
+            groups.setdefault(self.temperature(procedure), list()).append(procedure)
+
+        # Measurements without temperature control go first, then the
+        # temperatures in monotonic order
+        temperatures = sorted(t for t in groups if t is not None)
+        first = self.temperature(procedures[0])
+        if first is not None and abs(first - temperatures[-1]) < abs(first - temperatures[0]):
+            temperatures.reverse()
+        if None in groups:
+            temperatures.insert(0, None)
+
+        ordered = list()
+        field = 0.
+        for temperature in temperatures:
+            remaining = groups[temperature]
+            while len(remaining) > 0:
+                # min returns the first of equally near procedures
+                nearest = min(remaining, key=lambda p: abs(self.field(p) - field))
+                remaining.remove(nearest)
+                ordered.append(nearest)
+                field = self.field(nearest)
+
+        return ordered
+
+    def cost(self, procedures, handover=False):
+        """ Estimate the total time spent ramping the field and the total
+        change of the temperature set-point of a sequence.
+
+        :param procedures: the procedures in order
+        :param handover: whether the field is handed over between consecutive
+            measurements; otherwise it is ramped to zero in between
+        :return: the field ramping time (s) and the temperature change (K)
+        """
+        ramp_time = 0.
+        temperature_change = 0.
+
+        field = 0.
+        temperature = None
+        for procedure in procedures:
+            rate = procedure.field_ramp_rate * procedure.field_calibration  # mT/s
+            if procedure.field_control:
+                if not handover:
+                    ramp_time += abs(field) / rate
+                    field = 0.
+                ramp_time += abs(self.field(procedure) - field) / rate
+                field = self.field(procedure)
+            elif field != 0.:
+                ramp_time += abs(field) / rate
+                field = 0.
+
+            if self.temperature(procedure) is not None:
+                if temperature is not None:
+                    temperature_change += abs(self.temperature(procedure) - temperature)
+                temperature = self.temperature(procedure)
+
+        if len(procedures) > 0 and field != 0.:
+            ramp_time += abs(field) / (procedures[-1].field_ramp_rate * procedures[-1].field_calibration)
+
+        return ramp_time, temperature_change
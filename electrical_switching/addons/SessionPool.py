@@ -0,0 +1,65 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class SessionPool(object):
+    """ Keeps instrument sessions open across measurements, such that
+    consecutive measurements (e.g. of a sequence) do not have to reconnect
+    to the instruments. Wrappers that remember the state of an instrument
+    (e.g. CachedDAQ or PulseSource) are kept as well, such that a measurement
+    only sends the settings that differ from those of the previous one.
+
+    Before a session is reused, it is checked with a (cheap) query; if the
+    check fails, the session is closed and a new one is opened.
+    """
+
+    def __init__(self):
+        self.sessions = dict()
+
+        self.number_opened = 0
+        self.number_reused = 0
+
+    def get(self, name, connect, check=None, close=None):
+        """ Get an open session, or open a new one.
+
+        :param name: the name of the session
+        :param connect: function without arguments that opens the session
+        :param check: function that is called with the session to check
+            whether it is still usable; it should raise an exception if not
+        :param close: function that is called with the session to close it
+            when it is discarded
+        :return: the session
+        """
+        if name in self.sessions:
+            session = self.sessions[name][0]
+            try:
+                if check is not None:
+                    check(session)
+            except Exception:
+                log.warning(f"Session {name} is not responding; reconnecting", exc_info=True)
+                self.close(name)
+            else:
+                self.number_reused += 1
+                return session
+
+        session = connect()
+        self.sessions[name] = (session, close)
+        self.number_opened += 1
+
+        return session
+
+    def close(self, name=None):
+        """ Close a session, or all sessions if no name is given.
+        """
+        names = list(self.sessions.keys()) if name is None else [name]
+
+        for name in names:
+            session, close = self.sessions.pop(name, (None, None))
+            if session is None or close is None:
+                continue
+
+            try:
+                close(session)
+            except Exception:
+                log.exception(f"Could not close session {name}")
@@ -0,0 +1,81 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import numpy as np
+
+
+class SettlingDetector(object):
+    """ Detects when a (filtered) signal has settled by comparing the mean of
+    the signal in two consecutive windows at the end of the signal. The signal
+    is considered settled when the means differ by less than the tolerance
+    (relative to the signal) plus the expected difference due to the noise.
+
+    At the end of the step response of a low-pass filter, the remaining
+    deviation from the final value decays with the time-constant of the
+    filter. With windows as long as the time-constant, the remaining
+    deviation is then about 1.6 times the change between the windows.
+
+    :param tolerance: the relative tolerance of the change between the windows
+    :param window: the length (s) of a single window
+    :param noise_factor: the number of standard errors of the difference
+        between the windows that is attributed to noise
+    """
+
+    def __init__(self, tolerance, window, noise_factor=3.):
+        self.tolerance = tolerance
+        self.window = window
+        self.noise_factor = noise_factor
+
+        self.timestamps = np.empty(0)
+        self.values = np.empty(0)
+        self.first_timestamp = None
+        self.settled_at = None
+
+    def add(self, timestamps, values):
+        """ Add samples of the signal.
+
+        :param timestamps: the times (s) of the samples
+        :param values: the values of the samples
+        """
+        self.timestamps = np.concatenate([self.timestamps, np.asarray(timestamps, dtype=float)])
+        self.values = np.concatenate([self.values, np.asarray(values, dtype=float)])
+
+        if self.first_timestamp is None and len(self.timestamps) > 0:
+            self.first_timestamp = self.timestamps[0]
+
+        # Only the last two windows are needed
+        if len(self.timestamps) > 0:
+            keep = self.timestamps > self.timestamps[-1] - 2 * self.window
+            self.timestamps = self.timestamps[keep]
+            self.values = self.values[keep]
+
+    def settled(self):
+        """ Check whether the signal has settled.
+
+        :return: True if the signal has settled; the time of the last sample
+            is then stored in settled_at
+        """
+        if self.settled_at is not None:
+            return True
+
+        if len(self.timestamps) == 0:
+            return False
+
+        end = self.timestamps[-1]
+        first = self.values[self.timestamps <= end - self.window]
+        second = self.values[self.timestamps > end - self.window]
+
+        # Require two full windows of samples
+        if end - self.first_timestamp < 2 * self.window or \
+                len(first) < 2 or len(second) < 2:
+            return False
+
+        difference = abs(second.mean() - first.mean())
+        noise = np.sqrt(first.var(ddof=1) / len(first) + second.var(ddof=1) / len(second))
+
+        if difference <= self.tolerance * abs(second.mean()) + self.noise_factor * noise:
+            self.settled_at = end
+            return True
+
+        return False
@@ -0,0 +1,490 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import random
+from math import factorial
+
+import numpy as np
+
+
+class SimulatedSample(object):
+    """ Model of a sample with a switchable (magnetic) state. The state is
+    described by a single order parameter m in the range -1 to 1. Every pulse
+    configuration (i.e. every distinct routing of the pulse lines) drives the
+    state towards either +1 or -1; the configurations that are encountered
+    first are assigned alternating directions.
+
+    The resistance of a probe configuration consists of a configuration
+    dependent offset and a switching part that is proportional to m.
+
+    :param seed: seed for the random number generator used for the noise.
+    """
+
+    critical_current = 0.01  # A
+    critical_width = 0.002  # A
+    switching_time = 1e-3  # s
+    resistance = 100  # Ohm
+    switching_amplitude = 0.05  # Ohm
+    noise = 2e-3  # Ohm
+
+    def __init__(self, seed=None):
+        self.state = 0.
+        self.directions = dict()
+        self.rng = np.random.default_rng(seed)
+
+    def apply_pulse(self, high, low, amplitude, length):
+        """ Apply a pulse through the given columns.
+
+        :param high: the columns connected to the positive pulse line
+        :param low: the columns connected to the negative pulse line
+        :param amplitude: the amplitude (A) of the pulse
+        :param length: the duration (s) of the pulse
+        """
+        if len(high) == 0 or len(low) == 0:
+            return
+
+        key = (tuple(sorted(high)), tuple(sorted(low)))
+        if key not in self.directions:
+            self.directions[key] = 1 if len(self.directions) % 2 == 0 else -1
+
+        direction = self.directions[key] * np.sign(amplitude)
+
+        efficiency = 1 / (1 + np.exp(
+            -(abs(amplitude) - self.critical_current) / self.critical_width))
+        efficiency *= 1 - np.exp(-length / self.switching_time)
+
+        self.state += (direction - self.state) * efficiency
+
+    def pulse_resistance(self, high, low):
+        """ The two-terminal resistance (Ohm) seen by the pulse source.
+        """
+        if len(high) == 0 or len(low) == 0:
+            return np.inf
+
+        return 2 * self.resistance / np.sqrt(len(high) * len(low))
+
+    def probe_resistance(self, current_high, current_low, voltage_high, voltage_low):
+        """ The (noiseless) four-terminal resistance (Ohm) of a probe
+        configuration.
+        """
+        configuration = (current_high, current_low, voltage_high, voltage_low)
+        if any(len(columns) == 0 for columns in configuration):
+            return 0.
+
+        # Configuration dependent (but reproducible) offset and sensitivity
+        rng = random.Random(hash(tuple(tuple(sorted(c)) for c in configuration)))
+        offset = self.resistance * rng.uniform(-0.5, 0.5)
+        sensitivity = rng.uniform(-1, 1)
+
+        return offset + self.switching_amplitude * sensitivity * self.state
+
+    def measurement_noise(self, size=None):
+        return self.rng.normal(0, self.noise, size)
+
+
+class SimulatedKeithley2700(object):
+    """ Simulated Keithley 2700 with a 7709 matrix card in slot 1.
+    """
+
+    def __init__(self):
+        self.closed = set()
+        self.text_enabled = False
+        self.display_text = ""
+
+    @staticmethod
+    def channels_from_rows_columns(rows, columns, slot=None):
+        if not isinstance(rows, (list, tuple, np.ndarray)):
+            rows = [rows]
+        if not isinstance(columns, (list, tuple, np.ndarray)):
+            columns = [columns] * len(rows)
+
+        channels = list()
+        for row, column in zip(rows, columns):
+            if isinstance(column, (list, tuple, np.ndarray)):
+                channels.extend((row - 1) * 8 + c for c in column)
+            else:
+                channels.append((row - 1) * 8 + column)
+
+        return channels
+
+    @property
+    def closed_channels(self):
+        return sorted(self.closed)
+
+    @closed_channels.setter
+    def closed_channels(self, channels):
+        self.closed.update(int(c) for c in np.array(channels, ndmin=1))
+
+    @property
+    def open_channels(self):
+        raise AttributeError("open_channels can only be set")
+
+    @open_channels.setter
+    def open_channels(self, channels):
+        self.closed.difference_update(int(c) for c in np.array(channels, ndmin=1))
+
+    def open_all_channels(self):
+        self.closed.clear()
+
+    def close_rows_to_columns(self, rows, columns, slot=None):
+        self.closed_channels = self.channels_from_rows_columns(rows, columns, slot)
+
+    def open_rows_to_columns(self, rows, columns, slot=None):
+        self.open_channels = self.channels_from_rows_columns(rows, columns, slot)
+
+    def columns_on_row(self, row):
+        """ The columns that are connected to the given row.
+        """
+        return sorted((c - 1) % 8 + 1 for c in self.closed if (c - 1) // 8 + 1 == row)
+
+
+class SimulatedKeithley6221(object):
+    """ Simulated Keithley 6221 that applies its waveform to the columns that
+    are connected to the pulse rows of the simulated switch matrix.
+    """
+
+    def __init__(self, sample, matrix, rows, clock):
+        self.sample = sample
+        self.matrix = matrix
+        self.rows = rows
+        self.clock = clock
+
+        self.source_enabled = False
+        self.source_compliance = 10.
+        self.waveform_function = "sine"
+        self.waveform_amplitude = 0.
+        self.waveform_offset = 0.
+        self.waveform_dutycycle = 50.
+        self.waveform_frequency = 1e3
+        self.waveform_ranging = "best"
+        self.waveform_duration_cycles = 1.
+
+        # The points of the arbitrary waveform that is being written, and the
+        # stored arbitrary waveforms
+        self.arbitrary_data = list()
+        self.arbitrary = dict()
+
+        self.armed = False
+        self._measurement_events = 0
+
+    def clear(self):
+        self._measurement_events = 0
+
+    def write(self, command):
+        """ Handle the commands that define arbitrary waveforms.
+        """
+        command, _, arguments = command.partition(" ")
+        if command == ":SOUR:WAVE:ARB:DATA":
+            self.arbitrary_data = [float(x) for x in arguments.split(",")]
+        elif command == ":SOUR:WAVE:ARB:APP":
+            self.arbitrary_data.extend(float(x) for x in arguments.split(","))
+        elif command == ":SOUR:WAVE:ARB:COPY":
+            self.arbitrary[int(arguments)] = np.array(self.arbitrary_data)
+        else:
+            raise ValueError(f"Simulated 6221: unsupported command {command!r}")
+
+    def waveform_arm(self):
+        self.armed = True
+
+    def waveform_abort(self):
+        self.armed = False
+
+    def waveform_start(self):
+        if not self.armed:
+            log.warning("Simulated 6221: waveform started without arming")
+            return
+
+        high = self.matrix.columns_on_row(self.rows["pulse high"])
+        low = self.matrix.columns_on_row(self.rows["pulse low"])
+
+        # Pulse level and length of the (square or arbitrary) waveform
+        level = self.waveform_offset + self.waveform_amplitude
+        period = 1 / self.waveform_frequency
+        if self.waveform_function.startswith("arbitrary"):
+            data = self.arbitrary[int(self.waveform_function[-1])]
+            level = self.waveform_offset + self.waveform_amplitude * data.max()
+            length = period * np.count_nonzero(data == data.max()) / len(data)
+        else:
+            length = period * self.waveform_dutycycle / 100
+
+        voltage = abs(level) * self.sample.pulse_resistance(high, low)
+        if voltage > self.source_compliance:
+            self._measurement_events |= 0b1000
+            level = np.sign(level) * self.source_compliance / \
+                self.sample.pulse_resistance(high, low)
+
+        for _ in range(max(int(np.ceil(self.waveform_duration_cycles - 1e-6)), 1)):
+            self.sample.apply_pulse(high, low, level, length)
+
+    @property
+    def measurement_events(self):
+        events = self._measurement_events
+        self._measurement_events = 0
+        return events
+
+
+class SimulatedITC503(object):
+    """ Simulated Oxford Instruments ITC503 temperature controller; the
+    temperature relaxes exponentially towards the set-point.
+    """
+
+    time_constant = 60.  # s
+
+    def __init__(self, clock, temperature=300.):
+        self.clock = clock
+        self._temperature = temperature
+        self._setpoint = temperature
+        self._last_update = clock.time()
+
+        self.control_mode = "LU"
+        self.heater_gas_mode = "MANUAL"
+        self.auto_pid = False
+        self.sweep_status = 0
+
+    def _update(self):
+        now = self.clock.time()
+        decay = np.exp(-(now - self._last_update) / self.time_constant)
+        self._temperature = self._setpoint + (self._temperature - self._setpoint) * decay
+        self._last_update = now
+
+    @property
+    def temperature_1(self):
+        self._update()
+        return self._temperature
+
+    @property
+    def temperature_setpoint(self):
+        return self._setpoint
+
+    @temperature_setpoint.setter
+    def temperature_setpoint(self, value):
+        self._update()
+        self._setpoint = value
+
+    def wait_for_temperature(self, error=0.01, timeout=3600, check_interval=0.5,
+                             stability_interval=10, thermalize_interval=300,
+                             should_stop=lambda: False, max_comm_errors=None):
+        start = self.clock.time()
+        while abs(self.temperature_1 - self._setpoint) > error:
+            if should_stop() or self.clock.time() - start > timeout:
+                return
+            self.clock.sleep(check_interval)
+
+        self.clock.sleep(stability_interval + thermalize_interval)
+
+
+class SimulatedSM7045D(object):
+    """ Simulated Delta Elektronika SM7045D magnet power supply.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.current = 0.
+        self.enabled = False
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def ramp_to_current(self, target_current, current_step=0.1):
+        # The real device ramps in steps of current_step per second
+        self.clock.sleep(abs(target_current - self.current) / current_step)
+        self.current = target_current
+
+    def ramp_to_zero(self, current_step=0.1):
+        self.ramp_to_current(0, current_step)
+
+
+class SimulatedDAQ(object):
+    """ Simulated zhinst data server session for the MFLI lock-in amplifier.
+    The demodulator measures the resistance of the columns that are connected
+    to the lock-in rows of the simulated switch matrix. The demodulator output
+    follows changes in the signal with the settling time of the low-pass
+    filter.
+
+    :param series_resistance: the resistance (Ohm) in series with the sample
+        that converts the output voltage into the probe current.
+    :param device: the device id of the simulated lock-in amplifier
+    """
+
+    clockbase = 60e6
+
+    def __init__(self, sample, matrix, rows, clock, series_resistance=2e4,
+                 device="dev4285"):
+        self.sample = sample
+        self.matrix = matrix
+        self.rows = rows
+        self.clock = clock
+        self.series_resistance = series_resistance
+        self.device = device
+
+        self.nodes = dict()
+        self.subscribed = set()
+        self._last_poll = None
+        self._target = dict()
+        self._target_changed = dict()
+        self._last_output_change = clock.time()
+
+    @staticmethod
+    def _normalize(path):
+        return path.lower()
+
+    def _node(self, path, default=0):
+        path = self._normalize(path)
+        if path.endswith("/clockbase"):
+            return self.clockbase
+        return self.nodes.get(path, default)
+
+    def _set_node(self, path, value):
+        self.nodes[self._normalize(path)] = value
+
+        # The signal changes (and starts settling) when the output changes
+        if "/sigouts/" in path or "/harmonic" in path or "/oscs/" in path:
+            self._last_output_change = self.clock.time()
+
+        if path.endswith("sigins/0/autorange") and value:
+            # Select the smallest range that fits the expected signal
+            self.nodes[self._normalize(path.replace("autorange", "range"))] = 3e-3
+            self.nodes[self._normalize(path)] = 0
+
+    def setInt(self, path, value):
+        self._set_node(path, int(value))
+
+    def setDouble(self, path, value):
+        self._set_node(path, float(value))
+
+    def set(self, settings):
+        for path, value in settings:
+            self._set_node(path, value)
+
+    def getInt(self, path):
+        return int(self._node(path))
+
+    def getDouble(self, path):
+        return float(self._node(path))
+
+    def get(self, paths, flat=True, **kwargs):
+        if isinstance(paths, str):
+            paths = paths.split(",")
+        return {
+            self._normalize(p.strip()): {
+                "timestamp": np.array([self._ticks(self.clock.time())]),
+                "value": np.array([self._node(p.strip())]),
+            } for p in paths
+        }
+
+    def sync(self):
+        self._last_poll = self.clock.time()
+
+    def subscribe(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.subscribed.update(self._normalize(p) for p in paths)
+        self._last_poll = self.clock.time()
+
+    def unsubscribe(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.subscribed.difference_update(self._normalize(p) for p in paths)
+
+    def _ticks(self, timestamp):
+        return int(timestamp * self.clockbase)
+
+    def _demod_signal(self, demod, timestamps):
+        """ The x and y output (V) of a demodulator at the given times.
+        """
+        device = "/" + self.device
+
+        current_high = self.matrix.columns_on_row(self.rows["lock-in output A"])
+        current_low = self.matrix.columns_on_row(self.rows["lock-in output B"])
+        voltage_high = self.matrix.columns_on_row(self.rows["lock-in input A"])
+        voltage_low = self.matrix.columns_on_row(self.rows["lock-in input B"])
+
+        resistance = self.sample.probe_resistance(
+            current_high, current_low, voltage_high, voltage_low)
+
+        on = self._node(device + "/sigouts/0/on")
+        amplitude = self._node(device + "/sigouts/0/amplitudes/0") / np.sqrt(2)
+        harmonic = self._node(device + "/demods/%d/harmonic" % demod, 1)
+        current = on * amplitude / self.series_resistance
+
+        # Only the first harmonic carries the (linear) resistance signal
+        target = (resistance * current if harmonic == 1 else 0., 0.)
+        if target != self._target.get(demod, None):
+            self._target[demod] = target
+            self._target_changed[demod] = self._last_output_change
+
+        time_constant = self._node(device + "/demods/%d/timeconstant" % demod, 0.1)
+        order = self._node(device + "/demods/%d/order" % demod, 3)
+        elapsed = np.maximum(np.asarray(timestamps) - self._target_changed[demod], 0)
+
+        # Step response of a cascade of first-order low-pass filters
+        scaled = elapsed / max(time_constant, 1e-6)
+        response = 1 - np.exp(-scaled) * sum(
+            scaled**k / factorial(k) for k in range(max(int(order), 1)))
+
+        size = len(elapsed)
+        x = target[0] * response + self.sample.measurement_noise(size) * current
+        y = target[1] * response + self.sample.measurement_noise(size) * current
+        return x, y
+
+    def getSample(self, path):
+        demod = int(self._normalize(path).split("/demods/")[1].split("/")[0])
+        now = self.clock.time()
+        x, y = self._demod_signal(demod, [now])
+
+        return {"timestamp": np.array([self._ticks(now)]), "x": x, "y": y}
+
+    def poll(self, recording_time, timeout, flags=0, flat=False):
+        self.clock.sleep(recording_time)
+        now = self.clock.time()
+        start = now - recording_time if self._last_poll is None else self._last_poll
+        self._last_poll = now
+
+        data = dict()
+        for path in self.subscribed:
+            if not path.endswith("/sample"):
+                continue
+
+            demod = int(path.split("/demods/")[1].split("/")[0])
+            rate = self._node(path.replace("/sample", "/rate"), 1e3)
+            timestamps = np.arange(start, now, 1 / rate)[1:]
+
+            x, y = self._demod_signal(demod, timestamps)
+            data[path] = {
+                "timestamp": (timestamps * self.clockbase).astype(np.int64),
+                "x": x,
+                "y": y,
+            }
+
+        return data
+
+
+class Simulation(object):
+    """ A set of simulated instruments that share a single sample and switch
+    matrix. All waiting is done through the given clock, such that a
+    simulation with a virtual clock runs without delays.
+
+    :param clock: the clock (e.g. a VirtualClock) used by the instruments
+    :param rows: dictionary with the rows of the switch matrix that are
+        connected to the "pulse high", "pulse low", "lock-in input A",
+        "lock-in input B", "lock-in output A", and "lock-in output B"
+    :param series_resistance: the probe series resistance (Ohm)
+    :param seed: seed for the measurement noise
+    :param device: the device id of the simulated lock-in amplifier
+    """
+
+    def __init__(self, clock, rows, series_resistance=2e4, seed=None,
+                 device="dev4285"):
+        self.clock = clock
+        self.sample = SimulatedSample(seed)
+
+        self.k2700 = SimulatedKeithley2700()
+        self.k6221 = SimulatedKeithley6221(self.sample, self.k2700, rows, clock)
+        self.lockin = SimulatedDAQ(self.sample, self.k2700, rows, clock,
+                                   series_resistance, device)
+        self.temperatureController = SimulatedITC503(clock)
+        self.source = SimulatedSM7045D(clock)
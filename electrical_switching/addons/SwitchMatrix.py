@@ -0,0 +1,78 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class SwitchMatrix(object):
+    """ Keeps track of the relay state of the 7709 matrix card in the
+    Keithley 2700 and only sends the commands that are required to go from
+    the current to the target routing. Channels that are no longer required
+    are always opened before new channels are closed (break-before-make).
+
+    If a command fails, the relay state is considered unknown and the next
+    routing starts by opening all channels.
+
+    :param k2700: the Keithley2700 instrument
+    """
+
+    def __init__(self, k2700):
+        self.k2700 = k2700
+        self.closed = None
+
+        self.number_opened = 0
+        self.number_closed = 0
+
+    def channels(self, rows, columns):
+        """ Determine the set of channels that connect the rows to the
+        columns; columns can be a single column or a list of columns per row.
+
+        :param rows: list of row numbers
+        :param columns: list of column numbers (or lists of column numbers)
+        """
+        if len(rows) == 0:
+            return set()
+
+        channels = self.k2700.channels_from_rows_columns(rows, columns)
+        return set(int(channel) for channel in channels)
+
+    def reset(self):
+        """ Open all channels, bringing the matrix in a known state.
+        """
+        self.closed = None
+        self.k2700.open_all_channels()
+        self.closed = set()
+
+    def route(self, rows=(), columns=()):
+        """ Connect the rows to the columns and disconnect all other channels,
+        using the minimal number of relay operations.
+
+        :param rows: list of row numbers
+        :param columns: list of column numbers (or lists of column numbers)
+        """
+        target = self.channels(rows, columns)
+
+        if self.closed is None:
+            self.reset()
+
+        to_open = sorted(self.closed - target)
+        to_close = sorted(target - self.closed)
+
+        try:
+            # Break before make
+            if len(to_open) > 0:
+                self.k2700.open_channels = to_open
+                self.closed.difference_update(to_open)
+                self.number_opened += len(to_open)
+
+            if len(to_close) > 0:
+                self.k2700.closed_channels = to_close
+                self.closed.update(to_close)
+                self.number_closed += len(to_close)
+        except Exception:
+            self.closed = None
+            raise
+
+    def disconnect(self):
+        """ Open all channels that are currently closed.
+        """
+        self.route()
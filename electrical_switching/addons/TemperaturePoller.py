@@ -0,0 +1,110 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+from collections import deque
+from threading import Thread, Event, Lock
+
+import numpy as np
+
+from .Clock import SystemClock
+
+
+class TemperaturePoller(Thread):
+    """ Background thread that periodically reads the temperature into a
+    ring buffer of timestamped samples, such that the temperature can be
+    looked up without waiting for the (slow) temperature controller.
+
+    :param read: function that returns the temperature (nan on failure)
+    :param interval: the time (s) between consecutive readings
+    :param size: the number of readings that are kept
+    :param clock: the clock that provides the timestamps
+    """
+
+    def __init__(self, read, interval=1., size=1000, clock=None):
+        super().__init__(daemon=True)
+        self.read = read
+        self.interval = interval
+        self.clock = SystemClock() if clock is None else clock
+
+        self.samples = deque(maxlen=size)
+        self.lock = Lock()
+        self._stop_event = Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                temperature = self.read()
+            except Exception:
+                log.exception("Could not read the temperature")
+            else:
+                if not np.isnan(temperature):
+                    with self.lock:
+                        self.samples.append((self.clock.time(), temperature))
+
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """ Stop polling and wait for the thread to finish.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def latest(self, max_age=None):
+        """ Get the most recent temperature reading.
+
+        :param max_age: the maximum age (s) of the reading; older readings are
+            considered stale.
+        :return: the temperature (K) and the timestamp (s) of the reading, or
+            nan for both if no (recent) reading is available.
+        """
+        with self.lock:
+            if len(self.samples) == 0:
+                return np.nan, np.nan
+            timestamp, temperature = self.samples[-1]
+
+        if max_age is not None and self.clock.time() - timestamp > max_age:
+            return np.nan, np.nan
+
+        return temperature, timestamp
+
+    def at(self, timestamp, max_age=None):
+        """ Get the temperature at the given time by linear interpolation
+        between the surrounding readings. Timestamps after the most recent
+        reading get the most recent reading.
+
+        :param timestamp: the time (s) at which the temperature is requested
+        :param max_age: the maximum distance (s) between the requested time and
+            the readings that are used.
+        :return: the temperature (K) and the timestamp (s) of the nearest
+            reading, or nan for both if no (recent) reading is available.
+        """
+        with self.lock:
+            if len(self.samples) == 0:
+                return np.nan, np.nan
+
+            # The requested time is normally close to the end of the buffer
+            after = None
+            for before in reversed(self.samples):
+                if before[0] <= timestamp:
+                    break
+                after = before
+            else:
+                before = None
+
+        if before is None:
+            before, after = after, None
+
+        if after is None or after[0] == before[0]:
+            if max_age is not None and abs(timestamp - before[0]) > max_age:
+                return np.nan, np.nan
+            return before[1], before[0]
+
+        if max_age is not None and after[0] - before[0] > max_age:
+            return np.nan, np.nan
+
+        fraction = (timestamp - before[0]) / (after[0] - before[0])
+        nearest = before if fraction < 0.5 else after
+
+        return before[1] + fraction * (after[1] - before[1]), nearest[0]
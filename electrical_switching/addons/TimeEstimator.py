@@ -2,14 +2,36 @@ import logging
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
+from datetime import datetime, timedelta
+from pathlib import Path
+
 from pymeasure.display.Qt import QtCore, QtGui
 
+from .TimingModel import TimingModel
+
 
 class TimeEstimator(QtGui.QWidget):
+    """ Dock with the estimated duration of the measurement, as set in the
+    inputs, and of the running measurement. The estimate is based on the
+    pulse sequence and probes from the config file and on the timings of
+    earlier measurements (see TimingModel); it is only recomputed when an
+    input, the config file, or the timing history changes. The end of the
+    running measurement is refined from its progress.
+    """
+
+    # Signals of the input widgets that indicate a change of the input
+    INPUT_SIGNALS = ("valueChanged", "textChanged", "stateChanged", "currentIndexChanged")
+
     def __init__(self, parent, inputs=None):
         super().__init__(parent)
         self._parent = parent
 
+        self.dirty = True
+        self.cycles = None
+        self.duration = None
+        self.watched_files = dict()
+        self.running = None
+
         self.update_timer = QtCore.QTimer(self)
         self.update_timer.timeout.connect(self.update_estimates)
 
@@ -17,12 +39,14 @@ class TimeEstimator(QtGui.QWidget):
 
         self._layout()
         self._add_to_interface()
+        self._connect_inputs()
 
         self.update_estimates()
 
     def _get_fields(self):
         proc = self._parent.make_procedure()
-        self.keys = proc.get_time_estimates().keys()
+        self.keys = list(proc.get_time_estimates().keys())
+        self.keys.append("Running measurement finished at")
 
     def _layout(self):
         f_layout = QtGui.QFormLayout(self)
@@ -44,9 +68,106 @@ class TimeEstimator(QtGui.QWidget):
         self.update_box.setTristate(True)
         self.update_box.stateChanged.connect(self._set_continuous_updating)
 
+    def _connect_inputs(self):
+        inputs = self._parent.inputs
+        for name in inputs._inputs:
+            element = getattr(inputs, name)
+            for signal in self.INPUT_SIGNALS:
+                if hasattr(element, signal):
+                    getattr(element, signal).connect(self._mark_dirty)
+                    break
+
+    def _mark_dirty(self, *args):
+        self.dirty = True
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return Path(path).stat().st_mtime
+        except (OSError, TypeError):
+            return None
+
+    def _files_changed(self):
+        return any(self._mtime(path) != mtime for path, mtime in self.watched_files.items())
+
+    def _estimate(self, procedure):
+        """ Plan the measurement of a procedure and estimate its duration.
+
+        :return: the number of cycles, the duration (s), and the files the
+            estimate depends on
+        """
+        procedure.plan_measurement()
+        model = TimingModel(Path(procedure.AAC_folder) / procedure.timing_history_file)
+        cycles, duration = procedure.estimate_duration(model)
+
+        return cycles, duration, [procedure.find_yaml_config(), model.path]
+
+    def _recompute(self):
+        try:
+            procedure = self._parent.make_procedure()
+            self.cycles, self.duration, files = self._estimate(procedure)
+        except Exception:
+            log.exception("Could not estimate the duration of the measurement")
+            self.cycles = self.duration = None
+            files = list()
+
+        self.watched_files = {path: self._mtime(path) for path in files if path is not None}
+        self.dirty = False
+
+    def _running_finished_at(self, now):
+        """ Estimate when the running measurement finishes: from the progress
+        since the measurement was first seen, or (without progress) from its
+        estimated duration.
+        """
+        manager = self._parent.manager
+        experiment = manager.running_experiment() if manager.is_running() else None
+
+        if experiment is None:
+            self.running = None
+            return None
+
+        progress = experiment.browser_item.progressbar.value()
+
+        if self.running is None or self.running["experiment"] is not experiment:
+            try:
+                procedure = experiment.procedure.__class__()
+                procedure.set_parameters(experiment.procedure.parameter_values())
+                duration = self._estimate(procedure)[1]
+            except Exception:
+                log.exception("Could not estimate the duration of the running measurement")
+                duration = None
+
+            self.running = {"experiment": experiment, "start": now,
+                            "progress": progress, "duration": duration}
+
+        running = self.running
+        if progress > running["progress"]:
+            elapsed = (now - running["start"]).total_seconds()
+            remaining = elapsed / (progress - running["progress"]) * (100 - progress)
+        elif running["duration"] is not None:
+            remaining = running["duration"] * (100 - progress) / 100 - \
+                (now - running["start"]).total_seconds()
+        else:
+            return None
+
+        return now + timedelta(seconds=max(remaining, 0))
+
     def update_estimates(self):
-        proc = self._parent.make_procedure()
-        estimates = proc.get_time_estimates()
+        if self.dirty or self._files_changed():
+            self._recompute()
+
+        now = datetime.now()
+
+        estimates = dict.fromkeys(self.keys, "-")
+        if self.duration is not None:
+            duration = int(self.duration + 0.5)
+            estimates["Number of cycles"] = "%d" % self.cycles
+            estimates["Duration"] = "%s (%d s)" % (str(timedelta(seconds=duration)), duration)
+            estimates["Finished at"] = str(now + timedelta(seconds=duration))[:-7]
+
+        finished_at = self._running_finished_at(now)
+        if finished_at is not None:
+            estimates["Running measurement finished at"] = str(finished_at)[:-7]
 
         for key, estimate in estimates.items():
             self.line_edits[key].setText(estimate)
@@ -68,4 +189,3 @@ class TimeEstimator(QtGui.QWidget):
         elif state == 2:
             self.update_timer.setInterval(100)
             self.update_timer.start()
-
@@ -0,0 +1,84 @@
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+class TimingModel(object):
+    """ Overhead per phase of the measurement (e.g. "pulsing" or "probing"),
+    learned from the timings of earlier measurements. For every measurement,
+    the number of phases and their total measured and modelled (i.e. the
+    mandated waits only) durations are stored in a JSON history file; the
+    overhead of a phase is the average difference between the measured and
+    the modelled duration.
+
+    :param path: the history file; if None, no timings are loaded or stored
+    :param max_runs: the number of measurements that are kept in the history
+    """
+
+    def __init__(self, path=None, max_runs=50):
+        self.path = None if path is None else Path(path)
+        self.max_runs = max_runs
+        self.runs = list()
+        self.mtime = None
+
+        if self.path is not None and self.path.is_file():
+            try:
+                with open(self.path, "r") as file:
+                    self.runs = json.load(file)
+                self.mtime = self.path.stat().st_mtime
+            except (OSError, ValueError):
+                log.exception(f"Could not read the timing history {self.path}")
+
+    def overhead(self, phase, mode=None):
+        """ The average overhead (s) of a single phase.
+
+        :param phase: the name of the phase
+        :param mode: only use measurements that were done in this mode; None
+            to use all measurements
+        :return: the overhead, or 0 if there are no timings for the phase
+        """
+        count = 0
+        overhead = 0.
+        for run in self.runs:
+            if mode is not None and run.get("mode", None) != mode:
+                continue
+
+            timing = run["phases"].get(phase, None)
+            if timing is None:
+                continue
+
+            count += timing["count"]
+            overhead += timing["measured"] - timing["modelled"]
+
+        if count == 0:
+            return 0.
+        return overhead / count
+
+    def record(self, phases, **info):
+        """ Add the timings of a measurement to the history and store it.
+
+        :param phases: dictionary with, for every phase, a dictionary with the
+            "count", and the total "measured" and "modelled" durations (s)
+        :param info: additional information that is stored with the timings
+            (e.g. mode)
+        """
+        self.runs.append({
+            "date": datetime.now().isoformat(timespec="seconds"),
+            **info,
+            "phases": phases,
+        })
+        self.runs = self.runs[-self.max_runs:]
+
+        if self.path is None:
+            return
+
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump(self.runs, file, indent=1)
+        os.replace(temporary, self.path)
+        self.mtime = self.path.stat().st_mtime
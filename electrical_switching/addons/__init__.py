@@ -1 +1,55 @@
-from .TimeEstimator import TimeEstimator
+import sys
+from importlib import import_module
+
+from .DemodulatorStream import DemodulatorStream
+from .Clock import SystemClock, VirtualClock
+from .Simulation import Simulation
+from .SwitchMatrix import SwitchMatrix
+from .CachedDAQ import CachedDAQ
+from .PulseSource import PulseSource
+from .TemperaturePoller import TemperaturePoller
+from .ColumnarResults import ColumnarWriter, read_columnar, iter_columnar
+from .ActionScheduler import ActionScheduler
+from .RunningStatistics import RunningStatistics
+from .SettlingDetector import SettlingDetector
+from .TimingModel import TimingModel
+from .PhaseTimer import PhaseTimer
+from .Checkpoint import Checkpoint
+from .SequencePlanner import SequencePlanner
+from .SessionPool import SessionPool
+from .RawCapture import RawCapture, read_raw_index, open_raw_samples, raw_window
+from .SequenceCompiler import SequenceCompiler
+
+# The add-ons that depend on the pymeasure GUI (or on pymeasure results) are
+# only imported when they are used, such that the measurement script can be
+# imported without loading Qt
+_lazy_imports = {
+    "TimeEstimator": "TimeEstimator",
+    "ResultBatcher": "ResultBatcher",
+    "BatchFormatter": "ResultBatcher",
+    "BatchResults": "ResultBatcher",
+    "ResultsAggregator": "AggregatedResultsCurve",
+    "ColumnarAggregator": "AggregatedResultsCurve",
+    "AggregatedResultsCurve": "AggregatedResultsCurve",
+    "MainWindow": "MainWindow",
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import_module("." + _lazy_imports[name], __name__)
+
+    # Importing a module sets it as attribute of the package, which hides the
+    # class with the same name; replace all imported modules by their classes
+    for attribute, module in _lazy_imports.items():
+        module = sys.modules.get(f"{__name__}.{module}", None)
+        if module is not None:
+            globals()[attribute] = getattr(module, attribute)
+
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
@@ -0,0 +1,418 @@
+r"""
+Analysis of the results of switching measurements.
+
+A results file contains rows for the applied pulses and rows for the samples
+of the probes, in which most columns are empty. The results are read in
+chunks (from the text results or the binary columnar results), such that the
+memory use is bounded also for very large files, and for every chunk the
+statistics of the probe samples are determined per pulse and probe
+configuration (vectorized); the statistics of the chunks are then merged.
+From these, the switching amplitude between the pulse configurations and the
+drift of the resistance with the temperature are determined.
+
+A folder is analysed by analysing all runs in it in parallel:
+
+    python analysis.py data/electrical_switching_1.txt
+    python analysis.py data --workers 4 --output analysis
+"""
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import argparse
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from addons.ColumnarResults import iter_columnar, read_metadata
+
+PROBE_COLUMN = re.compile(r"Probe (\d+) R([xy]) \(Ohm\)")
+
+# Columns that are needed besides the probe resistances
+COLUMNS = [
+    "Timestamp (s)",
+    "Temperature (K)",
+    "Pulse number",
+    "Pulse configuration",
+    "Pulse amplitude (A)",
+    "Pulse hits compliance",
+    "Probe configuration",
+]
+
+
+def read_columns(path):
+    """ The columns of a results file (text) or folder (binary).
+    """
+    path = Path(path)
+    if path.is_dir():
+        return read_metadata(path)["columns"]
+    return list(pd.read_csv(path, comment="#", nrows=0).columns)
+
+
+def iter_chunks(path, columns, chunksize=100000):
+    """ Read the given columns of a results file (text) or folder (binary) in
+    chunks.
+
+    :param path: the results file or the binary results folder
+    :param columns: the columns to read
+    :param chunksize: the number of rows per chunk (text results only; the
+        binary results are read per stored chunk)
+    :return: a generator of dictionaries with an array for every column
+    """
+    path = Path(path)
+    if path.is_dir():
+        yield from iter_columnar(path, columns)
+        return
+
+    reader = pd.read_csv(path, comment="#", usecols=columns, chunksize=chunksize,
+                         dtype={"Pulse configuration": str})
+    for chunk in reader:
+        yield {column: chunk[column].to_numpy() for column in columns}
+
+
+def probe_numbers(columns):
+    """ The numbers of the probes of which the resistances are in the columns.
+    """
+    numbers = set()
+    for column in columns:
+        match = PROBE_COLUMN.fullmatch(column)
+        if match is not None:
+            numbers.add(int(match.group(1)))
+    return sorted(numbers)
+
+
+def group_moments(inverse, size, values):
+    """ The number, mean and sum of squared deviations of the (finite) values
+    per group.
+
+    :param inverse: the group index of every value
+    :param size: the number of groups
+    :param values: the values
+    """
+    valid = np.isfinite(values)
+    inverse = inverse[valid]
+    values = values[valid]
+
+    count = np.bincount(inverse, minlength=size).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(inverse, weights=values, minlength=size) / count
+    m2 = np.bincount(inverse, weights=(values - mean[inverse])**2, minlength=size)
+
+    return count, mean, m2
+
+
+def merge_moments(inverse, size, count, mean, m2):
+    """ Merge the moments of several parts of the groups (Chan et al.).
+
+    :param inverse: the group index of every part
+    :param size: the number of groups
+    :param count: the number of values of every part
+    :param mean: the mean of every part
+    :param m2: the sum of squared deviations of every part
+    """
+    mean = np.nan_to_num(mean)
+
+    total = np.bincount(inverse, weights=count, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total_mean = np.bincount(inverse, weights=count * mean, minlength=size) / total
+    total_m2 = np.bincount(inverse, weights=m2 + count * (mean - total_mean[inverse])**2,
+                           minlength=size)
+
+    return total, total_mean, total_m2
+
+
+def chunk_statistics(chunk, probes):
+    """ The statistics of the probe samples in a chunk, per pulse number and
+    probe configuration.
+
+    :param chunk: dictionary with an array for every column
+    :param probes: the numbers of the probes
+    :return: a dictionary with an array for every statistic, or None if the
+        chunk has no probe samples
+    """
+    configuration = np.asarray(chunk["Probe configuration"], dtype=float)
+    rows = np.flatnonzero(np.isin(configuration, probes))
+    if len(rows) == 0:
+        return None
+
+    # The resistance of every sample, taken from the column of its probe
+    probe_index = np.searchsorted(probes, configuration[rows])
+    resistances = dict()
+    for component in ("x", "y"):
+        table = np.column_stack([
+            np.asarray(chunk["Probe %d R%s (Ohm)" % (probe, component)], dtype=float)[rows]
+            for probe in probes
+        ])
+        resistances[component] = table[np.arange(len(rows)), probe_index]
+
+    pulse = np.asarray(chunk["Pulse number"], dtype=float)[rows].astype(np.int64)
+    keys, first, inverse = np.unique(pulse * len(probes) + probe_index,
+                                     return_index=True, return_inverse=True)
+    size = len(keys)
+
+    statistics = {
+        "Pulse number": pulse[first],
+        "Probe configuration": np.asarray(probes)[probe_index[first]],
+        "Pulse configuration": np.asarray(chunk["Pulse configuration"])[rows][first].astype(str),
+        "Timestamp (s)": np.asarray(chunk["Timestamp (s)"], dtype=float)[rows][first],
+    }
+
+    for component, values in resistances.items():
+        count, mean, m2 = group_moments(inverse, size, values)
+        statistics["n " + component] = count
+        statistics["mean " + component] = mean
+        statistics["m2 " + component] = m2
+
+    temperature = np.asarray(chunk["Temperature (K)"], dtype=float)[rows]
+    valid = np.isfinite(temperature)
+    statistics["n T"] = np.bincount(inverse[valid], minlength=size).astype(float)
+    statistics["sum T"] = np.bincount(inverse[valid], weights=temperature[valid], minlength=size)
+
+    return statistics
+
+
+def probe_table(parts):
+    """ Merge the statistics of the chunks into a table with, for every pulse
+    number and probe configuration, the mean and standard error of Rx and Ry
+    and the mean temperature. The standard error treats the samples as
+    independent, which underestimates it for oversampled (streamed) data.
+    """
+    parts = [part for part in parts if part is not None]
+    if len(parts) == 0:
+        return pd.DataFrame(columns=[
+            "Pulse number", "Probe configuration", "Pulse configuration", "Timestamp (s)",
+            "Temperature (K)", "Samples", "Rx (Ohm)", "Rx error (Ohm)", "Ry (Ohm)",
+            "Ry error (Ohm)"])
+
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    # Groups can be split over several chunks
+    keys = np.rec.fromarrays([merged["Pulse number"], merged["Probe configuration"]])
+    keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    size = len(keys)
+
+    table = pd.DataFrame({
+        "Pulse number": merged["Pulse number"][first],
+        "Probe configuration": merged["Probe configuration"][first],
+        "Pulse configuration": merged["Pulse configuration"][first],
+        "Timestamp (s)": merged["Timestamp (s)"][first],
+    })
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["Temperature (K)"] = np.bincount(inverse, weights=merged["sum T"], minlength=size) / \
+            np.bincount(inverse, weights=merged["n T"], minlength=size)
+
+        for component in ("x", "y"):
+            count, mean, m2 = merge_moments(
+                inverse, size, merged["n " + component],
+                merged["mean " + component], merged["m2 " + component])
+
+            if component == "x":
+                table["Samples"] = count.astype(int)
+            table["R%s (Ohm)" % component] = mean
+            table["R%s error (Ohm)" % component] = np.sqrt(m2 / (count - 1) / count)
+
+    return table.sort_values(["Pulse number", "Probe configuration"], ignore_index=True)
+
+
+def switching_amplitude(table):
+    """ The switching amplitude: for every probe configuration and every pair
+    of pulse configurations, the difference between the average resistances
+    after the pulses of both configurations. The errors follow from the
+    pulse-to-pulse scatter.
+    """
+    rows = list()
+
+    for probe, probe_rows in table.groupby("Probe configuration"):
+        averages = dict()
+        for configuration, rows_configuration in probe_rows.groupby("Pulse configuration"):
+            averages[configuration] = {
+                component: (
+                    rows_configuration["R%s (Ohm)" % component].mean(),
+                    rows_configuration["R%s (Ohm)" % component].sem(),
+                ) for component in ("x", "y")
+            }
+            averages[configuration]["pulses"] = len(rows_configuration)
+
+        for first, second in combinations(sorted(averages), 2):
+            row = {
+                "Probe configuration": probe,
+                "From pulse configuration": first,
+                "To pulse configuration": second,
+                "Pulses": min(averages[first]["pulses"], averages[second]["pulses"]),
+            }
+            for component in ("x", "y"):
+                mean_first, error_first = averages[first][component]
+                mean_second, error_second = averages[second][component]
+                row["dR%s (Ohm)" % component] = mean_second - mean_first
+                row["dR%s error (Ohm)" % component] = np.hypot(error_first, error_second)
+            rows.append(row)
+
+    return pd.DataFrame(rows, columns=[
+        "Probe configuration", "From pulse configuration", "To pulse configuration",
+        "Pulses", "dRx (Ohm)", "dRx error (Ohm)", "dRy (Ohm)", "dRy error (Ohm)"])
+
+
+def temperature_drift(table):
+    """ The drift of the resistance with the temperature: for every probe and
+    pulse configuration, a linear fit of the resistance after the pulses
+    against the temperature.
+    """
+    rows = list()
+
+    for (probe, configuration), group in table.groupby(
+            ["Probe configuration", "Pulse configuration"]):
+        row = {
+            "Probe configuration": probe,
+            "Pulse configuration": configuration,
+        }
+
+        for component in ("x", "y"):
+            temperature = group["Temperature (K)"].to_numpy()
+            resistance = group["R%s (Ohm)" % component].to_numpy()
+            valid = np.isfinite(temperature) & np.isfinite(resistance)
+            temperature, resistance = temperature[valid], resistance[valid]
+
+            row["Pulses"] = len(temperature)
+            row["Temperature range (K)"] = np.ptp(temperature) if len(temperature) > 0 else np.nan
+
+            slope = error = np.nan
+            sxx = np.sum((temperature - temperature.mean())**2) if len(temperature) > 0 else 0.
+            if len(temperature) > 2 and sxx > 0:
+                slope = np.sum((temperature - temperature.mean()) *
+                               (resistance - resistance.mean())) / sxx
+                residuals = resistance - resistance.mean() - slope * (temperature - temperature.mean())
+                error = np.sqrt(np.sum(residuals**2) / (len(temperature) - 2) / sxx)
+
+            row["dR%s/dT (Ohm/K)" % component] = slope
+            row["dR%s/dT error (Ohm/K)" % component] = error
+
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=[
+        "Probe configuration", "Pulse configuration", "Pulses", "Temperature range (K)",
+        "dRx/dT (Ohm/K)", "dRx/dT error (Ohm/K)", "dRy/dT (Ohm/K)", "dRy/dT error (Ohm/K)"])
+
+
+def analyse(path, chunksize=100000):
+    """ Analyse a single run.
+
+    :param path: the results file or the binary results folder
+    :param chunksize: the number of rows per chunk
+    :return: a dictionary with the "probes", "switching" and "drift" tables
+    """
+    columns = read_columns(path)
+    probes = probe_numbers(columns)
+    missing = [column for column in COLUMNS if column not in columns]
+    if len(missing) > 0:
+        raise ValueError(f"{path} is not a results file; it misses {', '.join(missing)}")
+
+    needed = COLUMNS + ["Probe %d R%s (Ohm)" % (probe, component)
+                        for probe in probes for component in ("x", "y")]
+
+    table = probe_table(chunk_statistics(chunk, probes)
+                        for chunk in iter_chunks(path, needed, chunksize))
+
+    return {
+        "probes": table,
+        "switching": switching_amplitude(table),
+        "drift": temperature_drift(table),
+    }
+
+
+def analyse_and_store(path, output=None, chunksize=100000):
+    """ Analyse a single run and store the tables as CSV files (named after
+    the run, e.g. "run.probes.csv").
+
+    :param path: the results file or the binary results folder
+    :param output: the folder to store the tables in; next to the run if None
+    :param chunksize: the number of rows per chunk
+    :return: the switching table
+    """
+    path = Path(path)
+    output = path.parent if output is None else Path(output)
+
+    tables = analyse(path, chunksize)
+    for name, table in tables.items():
+        table.to_csv(output / f"{path.stem}.{name}.csv", index=False)
+
+    return tables["switching"]
+
+
+def find_runs(folder):
+    """ The runs in a folder: the text results files, and the binary results
+    folders of runs without text results.
+    """
+    folder = Path(folder)
+    runs = sorted(folder.glob("*.txt"))
+    runs.extend(path for path in sorted(folder.glob("*.columns"))
+                if path.is_dir() and not path.with_suffix(".txt").is_file())
+    return runs
+
+
+def analyse_runs(paths, output=None, chunksize=100000, workers=None):
+    """ Analyse several runs in parallel (one process per run).
+
+    :return: a dictionary with the switching table (or the exception) for
+        every run
+    """
+    summaries = dict()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(analyse_and_store, path, output, chunksize)
+                   for path in paths}
+        for path, future in futures.items():
+            try:
+                summaries[path] = future.result()
+            except Exception as exception:
+                log.exception(f"Could not analyse {path}")
+                summaries[path] = exception
+
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("paths", type=Path, nargs="+",
+                        help="results files, binary results folders, or data folders")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="folder to store the tables in (default: next to the runs)")
+    parser.add_argument("--chunksize", type=int, default=100000,
+                        help="number of rows that is read at once")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    runs = list()
+    for path in args.paths:
+        if path.is_dir() and path.suffix != ".columns":
+            runs.extend(find_runs(path))
+        else:
+            runs.append(path)
+
+    if args.output is not None:
+        args.output.mkdir(parents=True, exist_ok=True)
+
+    summaries = analyse_runs(runs, args.output, args.chunksize, args.workers)
+
+    failed = 0
+    for path, summary in summaries.items():
+        print(f"{path}:")
+        if isinstance(summary, Exception):
+            print(f"  failed: {summary}")
+            failed += 1
+        elif len(summary) == 0:
+            print("  no probe samples")
+        else:
+            print(summary.to_string(index=False))
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+r"""
+Benchmarks for the host-side overhead of the measurement loop.
+
+The MeasurementProcedure is driven with simulated instruments on a virtual
+clock, such that all physics-mandated waiting (pulse delays, settling times,
+probe durations) takes no wall-clock time. The remaining wall-clock time is
+the overhead of the software itself: building the data rows in
+store_measurement, emitting and writing the results, and (optionally)
+reloading the results like the GUI curves do. The startup benchmark
+measures the time to import the measurement script and to create a
+procedure in a fresh process, which is paid at every start of the software.
+
+The results are written to a JSON file, which can be compared with the
+results of an earlier run to detect regressions in the hot path:
+
+    python benchmark.py --rows 100000 --output benchmark.json
+    python benchmark.py --rows 100000 --compare benchmark.json
+"""
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+from pymeasure.experiment import Results
+
+from addons import BatchResults, ResultsAggregator
+from electrical_switching import MeasurementProcedure, software_version
+
+SOFTWARE_FOLDER = Path(__file__).parent
+
+# Metrics for which a higher value is better; for all others lower is better
+HIGHER_IS_BETTER = ["rows per second"]
+
+# Modules that should not be loaded by importing the measurement script
+HEAVY_MODULES = ["PyQt5", "PySide2", "pyqtgraph", "pyvisa", "zhinst", "git", "yaml"]
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import electrical_switching
+imported = time.perf_counter()
+heavy = [module for module in {modules!r} if module in sys.modules]
+electrical_switching.MeasurementProcedure()
+created = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "procedure": created - imported,
+    "heavy": heavy,
+}}))
+"""
+
+
+class BenchmarkSink(object):
+    """ Stand-in for the worker: receives the emitted results and writes them
+    to the results file in the same way the pymeasure recorder does, and
+    stops the procedure once the requested number of rows has been written.
+
+    :param results: the pymeasure Results object to write to
+    :param max_rows: the number of rows after which the procedure is stopped
+    :param curve_interval: the (wall-clock) interval (s) at which the results
+        are reloaded like the GUI curves do; None to skip
+    :param memory_interval: the number of rows after which the traced memory
+        is recorded; None to skip
+    :param aggregated_curve: whether the curve aggregates the rows per pulse
+        (like the default GUI curve) instead of reloading all rows
+    """
+
+    def __init__(self, results, max_rows, curve_interval=None, memory_interval=None,
+                 aggregated_curve=False):
+        self.results = results
+        self.max_rows = max_rows
+        self.curve_interval = curve_interval
+        self.memory_interval = memory_interval
+        self.aggregator = ResultsAggregator(results.data_filename) if aggregated_curve else None
+
+        self.file = open(results.data_filename, "a", buffering=1)
+
+        self.rows = 0
+        self.emits = 0
+        self.emit_time = 0.
+        self.curve_time = 0.
+        self.curve_updates = 0
+        self.memory = list()
+        self.last_curve_update = perf_counter()
+
+    def emit(self, topic, record):
+        if topic != "results":
+            return
+
+        start = perf_counter()
+        self.file.write(self.results.format(record) + Results.LINE_BREAK)
+        self.file.flush()
+        self.rows += len(record) if isinstance(record, list) else 1
+        self.emits += 1
+        self.emit_time += perf_counter() - start
+
+        if self.curve_interval is not None and \
+                start - self.last_curve_update > self.curve_interval:
+            self.update_curve()
+
+        if self.memory_interval is not None and \
+                self.rows >= (len(self.memory) + 1) * self.memory_interval:
+            self.memory.append((self.rows, tracemalloc.get_traced_memory()[0]))
+
+    def update_curve(self):
+        start = perf_counter()
+        if self.aggregator is not None:
+            self.aggregator.update("Pulse number", "Probe 1 x (V)")
+        else:
+            data = self.results.data
+            data["Pulse number"].to_numpy(), data["Probe 1 x (V)"].to_numpy()
+        self.curve_time += perf_counter() - start
+        self.curve_updates += 1
+        self.last_curve_update = perf_counter()
+
+    def should_stop(self):
+        return self.rows >= self.max_rows
+
+    def close(self):
+        self.file.close()
+
+
+def make_procedure(folder, streaming, sample_rate, batch_size=1):
+    """ Create a procedure with simulated instruments that keeps running until
+    it is stopped.
+    """
+    procedure = MeasurementProcedure()
+    procedure.AAC_folder = str(folder)
+    procedure.AAE_yaml_config_file = str(SOFTWARE_FOLDER / "config.yml")
+    procedure.AAF_simulation = True
+    procedure.number_of_repeats = 10**9
+    procedure.probe_streaming = streaming
+    procedure.probe_sample_rate = sample_rate
+    procedure.AAH_results_batch_size = batch_size
+
+    return procedure
+
+
+def run(rows, streaming=True, sample_rate=1e3, curve_interval=None, memory=False,
+        batch_size=1, aggregated_curve=False):
+    """ Run a single benchmark.
+
+    :param rows: the number of rows to write
+    :param streaming: whether to use streaming lock-in acquisition
+    :param sample_rate: the (simulated) demodulator sample rate (Hz)
+    :param curve_interval: the interval (s) for reloading the results as the
+        GUI curves do; None to skip
+    :param memory: whether to trace the memory usage (slows the run down)
+    :param batch_size: the maximum number of rows that are emitted as a block
+    :param aggregated_curve: whether the curve aggregates the rows per pulse
+    :return: a dictionary with the measured metrics
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        procedure = make_procedure(folder, streaming, sample_rate, batch_size)
+        results = BatchResults(procedure, str(Path(folder) / "benchmark.txt"))
+
+        sink = BenchmarkSink(
+            results, rows, curve_interval,
+            memory_interval=max(rows // 20, 1) if memory else None,
+            aggregated_curve=aggregated_curve,
+        )
+        procedure.emit = sink.emit
+        procedure.should_stop = sink.should_stop
+
+        # Time the individual phases of the cycle
+        phase_time = {"store_measurement": 0.}
+        store_measurements = procedure.store_measurements
+
+        def timed_store_measurements(data_dicts):
+            start = perf_counter()
+            store_measurements(data_dicts)
+            phase_time["store_measurement"] += perf_counter() - start
+
+        procedure.store_measurements = timed_store_measurements
+
+        if memory:
+            tracemalloc.start()
+
+        start = perf_counter()
+        try:
+            procedure.startup()
+            virtual_start = procedure.clock.time()
+            procedure.execute()
+            virtual_duration = procedure.clock.time() - virtual_start
+        finally:
+            procedure.shutdown()
+            sink.close()
+        duration = perf_counter() - start
+
+        if memory:
+            tracemalloc.stop()
+
+    cycles = max(procedure.last_pulse_number, 1)
+
+    metrics = {
+        "rows": sink.rows,
+        "cycles": procedure.last_pulse_number,
+        "wall time (s)": duration,
+        "simulated time (s)": virtual_duration,
+        "overhead per cycle (s)": duration / cycles,
+        "overhead per row (s)": duration / max(sink.rows, 1),
+        "rows per second": sink.rows / duration,
+        "store_measurement per row (s)":
+            (phase_time["store_measurement"] - sink.emit_time - sink.curve_time)
+            / max(sink.rows, 1),
+        "emit per row (s)": sink.emit_time / max(sink.rows, 1),
+        "emits per row": sink.emits / max(sink.rows, 1),
+    }
+
+    if curve_interval is not None:
+        metrics["curve update (s)"] = sink.curve_time / max(sink.curve_updates, 1)
+
+    if memory and len(sink.memory) > 1:
+        (first_rows, first_memory), (last_rows, last_memory) = sink.memory[0], sink.memory[-1]
+        metrics["memory growth per 1e5 rows (MB)"] = \
+            (last_memory - first_memory) / (last_rows - first_rows) * 1e5 / 1e6
+        metrics["memory at end (MB)"] = last_memory / 1e6
+
+    return metrics
+
+
+def startup(repeats=5):
+    """ Measure the startup time of the measurement script in fresh processes.
+
+    :param repeats: the number of processes; the fastest one is reported
+    :return: a dictionary with the measured metrics
+    """
+    script = STARTUP_SCRIPT.format(modules=HEAVY_MODULES)
+
+    timings = list()
+    for _ in range(repeats):
+        start = perf_counter()
+        output = subprocess.run([sys.executable, "-c", script], cwd=SOFTWARE_FOLDER,
+                                capture_output=True, text=True, check=True).stdout
+        duration = perf_counter() - start
+
+        timing = json.loads(output.strip().splitlines()[-1])
+        timings.append((duration, timing["import"], timing["procedure"], timing["heavy"]))
+
+    duration, import_time, procedure_time, heavy = min(timings)
+    if len(heavy) > 0:
+        print(f"  Modules loaded at import: {', '.join(heavy)}")
+
+    return {
+        "process (s)": duration,
+        "import (s)": import_time,
+        "first procedure (s)": procedure_time,
+        "heavy modules loaded": len(heavy),
+    }
+
+
+def compare(current, previous, tolerance=0.1):
+    """ Compare the metrics of two benchmark runs and report regressions.
+
+    :param current: the benchmark results of the current run
+    :param previous: the benchmark results to compare to
+    :param tolerance: the relative change that is reported as a regression
+    :return: a list with the names of the regressed metrics
+    """
+    regressions = list()
+
+    for benchmark, metrics in current["benchmarks"].items():
+        if benchmark not in previous["benchmarks"]:
+            continue
+
+        print(f"\n{benchmark} (compared to {previous['version']}, {previous['date']})")
+        for key, value in metrics.items():
+            old = previous["benchmarks"][benchmark].get(key, None)
+            if not old or key in ["rows", "cycles"]:
+                continue
+
+            change = (value - old) / abs(old)
+            regressed = -change > tolerance if key in HIGHER_IS_BETTER else change > tolerance
+            if regressed:
+                regressions.append(f"{benchmark}: {key}")
+
+            print(f"  {key:40s} {old:12.4g} -> {value:12.4g} ({change:+7.1%})"
+                  f"{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="number of rows to write per benchmark")
+    parser.add_argument("--sample-rate", type=float, default=1e3,
+                        help="simulated demodulator sample rate (Hz)")
+    parser.add_argument("--curve-interval", type=float, default=0.2,
+                        help="interval (s) for reloading the results like the GUI")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="number of rows per block for the batched benchmarks")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="JSON file to store the results in")
+    parser.add_argument("--compare", type=Path, default=None,
+                        help="JSON file with earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change that is reported as a regression")
+    parser.add_argument("--startup-repeats", type=int, default=5,
+                        help="number of processes for the startup benchmark")
+    args = parser.parse_args(argv)
+
+    benchmarks = {
+        "polling": dict(streaming=False),
+        "streaming": dict(streaming=True, sample_rate=args.sample_rate),
+        "streaming with curve": dict(streaming=True, sample_rate=args.sample_rate,
+                                     curve_interval=args.curve_interval),
+        "streaming memory": dict(streaming=True, sample_rate=args.sample_rate,
+                                 memory=True),
+        "streaming batched": dict(streaming=True, sample_rate=args.sample_rate,
+                                  batch_size=args.batch_size),
+        "streaming batched with curve": dict(streaming=True, sample_rate=args.sample_rate,
+                                             curve_interval=args.curve_interval,
+                                             batch_size=args.batch_size),
+        "streaming batched with aggregated curve": dict(streaming=True,
+                                                        sample_rate=args.sample_rate,
+                                                        curve_interval=args.curve_interval,
+                                                        batch_size=args.batch_size,
+                                                        aggregated_curve=True),
+    }
+
+    current = {
+        "version": software_version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "rows": args.rows,
+        "benchmarks": dict(),
+    }
+
+    print("Running benchmark 'startup'")
+    metrics = startup(args.startup_repeats)
+    current["benchmarks"]["startup"] = metrics
+    for key, value in metrics.items():
+        print(f"  {key:40s} {value:12.4g}")
+
+    for name, kwargs in benchmarks.items():
+        print(f"Running benchmark '{name}'")
+        metrics = run(args.rows, **kwargs)
+        current["benchmarks"][name] = metrics
+
+        for key, value in metrics.items():
+            print(f"  {key:40s} {value:12.4g}")
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as file:
+            previous = json.load(file)
+
+        regressions = compare(current, previous, args.tolerance)
+        if len(regressions) > 0:
+            print("\nRegressions found in: " + ", ".join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
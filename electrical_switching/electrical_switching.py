@@ -5,50 +5,42 @@ import logging
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
-from pymeasure.display.Qt import QtGui
-from pymeasure.display.windows import ManagedWindow
-from pymeasure.experiment import Procedure, Results, unique_filename, \
-    Parameter, FloatParameter, BooleanParameter, IntegerParameter
-from pymeasure.instruments.keithley import Keithley6221, Keithley2700
-from pymeasure.instruments.oxfordinstruments import ITC503
-from pymeasure.instruments.deltaelektronika import SM7045D
-import pyvisa
-
-import zhinst.utils
-from addons import TimeEstimator
-
-from time import sleep, time
+from pymeasure.experiment import Procedure, unique_filename, \
+    Parameter, FloatParameter, BooleanParameter, IntegerParameter, ListParameter
+
+# The instrument drivers, the GUI, yaml and git are imported where they are
+# used, such that importing this script (e.g. by the GUI or a headless run) is
+# fast and has no side effects
+from addons import DemodulatorStream, SystemClock, VirtualClock, Simulation, \
+    SwitchMatrix, CachedDAQ, PulseSource, TemperaturePoller, ColumnarWriter, ResultBatcher, \
+    ActionScheduler, RunningStatistics, SettlingDetector, TimingModel, PhaseTimer, Checkpoint, \
+    SessionPool, RawCapture, SequenceCompiler, iter_columnar
+
+from functools import lru_cache
 from pathlib import Path
 from shutil import copy
 from datetime import datetime, timedelta
-from git import cmd, Repo, exc
 import numpy as np
-import ctypes
-import yaml
 
 
-# Initialize logger & log to file
-log = logging.getLogger("")
-file_handler = logging.FileHandler("electrical_switching.log", "a")
-file_handler.setFormatter(logging.Formatter(
-    fmt="%(asctime)s : %(message)s (%(levelname)s)",
-    datefmt="%m/%d/%Y %I:%M:%S %p"
-))
-log.addHandler(file_handler)
+@lru_cache(maxsize=None)
+def software_version():
+    """ The version of the software (from git), determined only once.
+    """
+    from git import cmd, Repo, exc
 
-# Register as separate software
-myappid = "fna.MeasurementSoftware.ElectricalSwitching"
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+    try:
+        return cmd.Git(Repo(search_parent_directories=True)).describe()
+    except exc.GitError:
+        return "none"
 
-# get Git software version
-try:
-    version = cmd.Git(Repo(search_parent_directories=True)).describe()
-except exc.GitCommandError:
-    version = "none"
 
 # Get date of measurement
 date = datetime.now()
 
+# Instrument sessions that are kept open between measurements
+sessions = SessionPool()
+
 r"""
  _____    _____     ____     _____   ______   _____    _    _   _____    ______
 |  __ \  |  __ \   / __ \   / ____| |  ____| |  __ \  | |  | | |  __ \  |  ____|
@@ -58,7 +50,6 @@ r"""
 |_|      |_|  \_\  \____/   \_____| |______| |_____/   \____/  |_|  \_\ |______|
 
 """
-# TODO: more complicated pulsing and probing schemes
 
 
 # noinspection PyTypeChecker
@@ -73,7 +64,7 @@ class MeasurementProcedure(Procedure):
 
     """
 
-    AAA = Parameter("Software version", default=version)
+    AAA = Parameter("Software version")
     AAB = Parameter("Measurement date", default=date)
 
     AAC_folder = Parameter("Measurement folder",
@@ -82,6 +73,27 @@ class MeasurementProcedure(Procedure):
                                   default="electrical_switching")
     AAE_yaml_config_file = Parameter("Measurement configuration file",
                                      default="config.yml")
+    AAF_simulation = BooleanParameter("Simulated instruments",
+                                      default=False)
+    # With "binary", the text results file only contains the header (the
+    # parameters), and the live plot reads the rows from the binary results,
+    # which are written every results buffer and at least every checkpoint
+    # interval
+    AAG_results_format = ListParameter("Results format",
+                                       choices=["text", "text and binary", "binary"],
+                                       default="text")
+    AAH_results_batch_size = IntegerParameter("Results batch size",
+                                              default=1, minimum=1)
+    AAI_results_batch_interval = FloatParameter("Results batch interval",
+                                                units="s", default=1.)
+    AAJ_phase_timing = BooleanParameter("Record phase timing",
+                                        default=False)
+    AAK_resume_results_file = Parameter("Resume results file (empty for new)",
+                                        default="")
+    AAL_checkpoint_interval = FloatParameter("Checkpoint interval",
+                                             units="s", default=60.)
+    AAM_keep_connections = BooleanParameter("Keep instrument connections",
+                                            default=False)
 
     # general parameters
     number_of_repeats = IntegerParameter("Number of repeats",
@@ -102,6 +114,8 @@ class MeasurementProcedure(Procedure):
                                           default=1)
     pulse_number_of_bursts = IntegerParameter("Number of bursts",
                                               default=4)
+    pulse_hardware_timed = BooleanParameter("Hardware-timed pulse bursts",
+                                            default=False)
 
     # probing parameters
     probe_amplitude = FloatParameter("Probe amplitude",
@@ -114,6 +128,28 @@ class MeasurementProcedure(Procedure):
                                          units="s", default=0.1)
     probe_duration = FloatParameter("Probe duration",
                                     units="s", default=15)
+    probe_streaming = BooleanParameter("Streaming lock-in acquisition",
+                                       default=False)
+    probe_sample_rate = FloatParameter("Probe sample rate",
+                                       units="Hz", default=100)
+    probe_raw_capture = BooleanParameter("Capture raw demodulator samples",
+                                         default=False)
+    probe_harmonics = Parameter("Probe additional harmonics",
+                                default="")
+    probe_pipelined = BooleanParameter("Prepare probes during waits",
+                                       default=False)
+    probe_adaptive = BooleanParameter("Adaptive probe duration",
+                                      default=False)
+    probe_target_error = FloatParameter("Probe target error",
+                                        units="Ohm", default=1e-3)
+    probe_min_duration = FloatParameter("Probe minimum duration",
+                                        units="s", default=2)
+    probe_target_ry = BooleanParameter("Probe target error includes Ry",
+                                       default=False)
+    probe_settling_detection = BooleanParameter("Detect lock-in settling",
+                                                default=False)
+    probe_settling_tolerance = FloatParameter("Probe settling tolerance",
+                                              default=1e-3)
 
     probe_series_resistance = FloatParameter("Probe series resistance",
                                              units="Ohm", default=2e4)
@@ -123,6 +159,12 @@ class MeasurementProcedure(Procedure):
                                            default=False)
     temperature_sp = FloatParameter("Temperature set-point",
                                     units="K", default=300.)
+    temperature_poll_interval = FloatParameter("Temperature poll interval",
+                                               units="s", default=1.)
+    temperature_max_age = FloatParameter("Temperature maximum age",
+                                         units="s", default=10.)
+    temperature_interpolate = BooleanParameter("Interpolate temperature",
+                                               default=False)
 
     # Magnetic field control
     field_control = BooleanParameter("Magnetic field control",
@@ -133,11 +175,20 @@ class MeasurementProcedure(Procedure):
                                        units="mT/A", default=13.69)
     field_ramp_rate = FloatParameter("Magnetic field ramp rate",
                                      units="A/s", default=0.1)
+    field_handover = BooleanParameter("Keep field between sequenced measurements",
+                                      default=False)
+
+    # Sequencer settings
+    sequence_reorder = BooleanParameter("Reorder sequenced measurements",
+                                        default=False)
+    sequence_reorder_probes = BooleanParameter("Reorder probes after a pulse",
+                                               default=False)
 
     # Define data columns
     DATA_COLUMNS = [
         "Timestamp (s)",
         "Temperature (K)",
+        "Temperature timestamp (s)",
         "Magnetic field (T)",
         "Magnetic field current (A)",
         "Pulse number",
@@ -150,6 +201,9 @@ class MeasurementProcedure(Procedure):
         "Probe sensitivity (V)",
         "Probe frequency (Hz)",
         "Probe time constant (s)",
+        "Probe settling time (s)",
+        "Probe Rx error (Ohm)",
+        "Probe Ry error (Ohm)",
     ]
 
     max_number_of_probes = 2
@@ -162,6 +216,24 @@ class MeasurementProcedure(Procedure):
 
     DATA_COLUMNS.extend(probe_columns)
 
+    # The additional demodulators (numbered from 2, as on the MFLI) that
+    # measure simultaneously with the first
+    max_number_of_demods = 4
+    demod_columns = list()
+    for i in range(1, max_number_of_demods):
+        demod_columns.extend(
+            ["Demod %d harmonic" % (i + 1), "Demod %d x (V)" % (i + 1),
+             "Demod %d y (V)" % (i + 1)]
+        )
+
+    DATA_COLUMNS.extend(demod_columns)
+
+    # Types of the columns in the binary results; all others are floats
+    COLUMN_TYPES = {
+        "Pulse number": "i8",
+        "Pulse configuration": "U64",
+    }
+
     # pre-define default variables
     config = dict()
     row_pulse_hi = 5
@@ -185,12 +257,84 @@ class MeasurementProcedure(Procedure):
 
     probe_name_mapping = dict()
     pulse_name_mapping = dict()
+
+    # Order of the low-pass filters of the lock-in demodulators
+    filter_order = 3
+
+    # File (in the data folder) with the phase timings of earlier measurements
+    timing_history_file = "timing_history.json"
+    phase_timings = None
     pulse_sequence = list()
 
+    # The (declarative) sequence from the config file, and the probes that
+    # follow each pulse of the compiled sequence
+    sequence = None
+    probe_sequence = list()
+    sequence_report = None
+
     # Pulse counter
     last_pulse_number = 0
     last_pulse_config = 0
 
+    # Clock used for all timing and waiting; replaced by a virtual clock for
+    # simulated measurements
+    clock = SystemClock()
+
+    # Background reader for the temperature
+    temperature_poller = None
+
+    # The text results file (set when queued) and the binary results writer
+    results_filename = None
+    results_writer = None
+    results_buffer_size = 10000
+    results_batcher = None
+
+    # Writer of the raw demodulator samples of the probe windows
+    raw_capture = None
+
+    # Whether the probes are acquired by streaming (set in startup, as the
+    # raw capture requires streaming as well)
+    streaming = False
+
+    # Runs the preparation of the probes in the background
+    scheduler = None
+
+    # Records the duration of the phases of the measurement (disabled unless
+    # requested when starting up)
+    timer = PhaseTimer(enabled=False)
+
+    # Checkpoint of the last completed cycle (pulsing and probing), and the
+    # cycle up to which a resumed measurement is skipped
+    checkpoint = None
+    completed_cycle = None
+    last_checkpoint = None
+    resume_cycle = None
+
+    # Whether the magnetic field is handed over from the previous or to the
+    # next measurement of a sequence (set by the sequence planner)
+    field_from_previous = False
+    field_to_next = False
+
+    # The magnet power supply (and ramp rate) of the measurement that handed
+    # its field over, until the next measurement takes it over
+    field_handed_over = None
+
+    # The instruments (connected in startup); a failed startup can leave
+    # them unconnected
+    k2700 = None
+    lockin = None
+    pulse_source = None
+    matrix = None
+    source = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # The software version is determined when the first procedure is
+        # created, instead of when the script is imported
+        if self.AAA is None:
+            self.set_parameters({"AAA": software_version()})
+
     r"""
           ____    _    _   _______   _        _____   _   _   ______
          / __ \  | |  | | |__   __| | |      |_   _| | \ | | |  ____|
@@ -216,59 +360,126 @@ class MeasurementProcedure(Procedure):
         self.determine_probe_mapping()
         self.determine_pulse_parameters()
         self.determine_probe_parameters()
+        self.determine_sequence()
+
+        report = self.sequence_report
+        log.info(f"Planned {report['cycles']} cycles with {report['relay switches']} relay "
+                 f"switches, {report['lock-in changes']} lock-in reconfigurations, and "
+                 f"{timedelta(seconds=round(report['dead time']))} dead time")
+
+        # Continue an interrupted measurement
+        if self.AAK_resume_results_file:
+            self.resume_measurement()
+
+        self.checkpoint = Checkpoint(self.sidecar_filename(".checkpoint.json"))
+
+        # Open the binary results
+        if self.AAG_results_format != "text":
+            self.open_binary_results()
+        if self.AAG_results_format == "binary":
+            log.info("Writing only binary results; the text results contain the header only, "
+                     "and the rows are plotted once they are written to the binary results")
+
+        # Capture the raw demodulator samples, which requires streaming
+        self.streaming = self.probe_streaming or self.probe_raw_capture
+        if self.probe_raw_capture:
+            self.open_raw_capture()
+
+        # Ramp down a magnetic field that was handed over, if this measurement
+        # does not continue with it (e.g. the measurement it was handed over
+        # to was removed from the queue)
+        if not (self.field_control and self.field_from_previous):
+            self.release_field()
+
+        # Connect the instruments (or their simulated counterparts)
+        if self.AAF_simulation:
+            self.connect_simulated_instruments()
+        else:
+            self.connect_instruments()
 
-        # Connect and set up Keithley 2700 as switchboard
-        self.k2700 = Keithley2700("GPIB::30::INSTR")
+        # From now on, this measurement ramps down the handed-over field
+        if self.field_control and self.field_from_previous:
+            type(self).field_handed_over = None
+
+        self.timer = PhaseTimer(self.clock, enabled=self.AAJ_phase_timing)
+
+        # Collect the text results in blocks
+        if self.AAG_results_format != "binary":
+            self.results_batcher = ResultBatcher(
+                self.emit, self.AAH_results_batch_size,
+                self.AAI_results_batch_interval, clock=self.clock)
 
         # Enable to set text on the display of the Keithley 2700
         self.k2700.text_enabled = True
         self.k2700.display_text = "STARTING"
 
         # Connect everything to ground
-        self.k2700.open_all_channels()
+        self.matrix = SwitchMatrix(self.k2700)
+        self.matrix.reset()
+
+        # Set up MFLI as probing lock-in amplifier
+        log.info("Setting up lock-in amplifier")
+        settings = [
+            ("/dev4285/sigouts/0/on", 0),
+            ("/dev4285/sigouts/0/enables/0", 1),
+            ("/dev4285/sigouts/0/enables/1", 0),
+            ("/dev4285/sigouts/0/enables/2", 0),
+            ("/dev4285/sigouts/0/enables/3", 0),
+
+            ("/dev4285/sigouts/0/diff", 1),
+            ("/dev4285/sigins/0/diff", 1),
+
+            ('/dev4285/sigins/0/ac', 1),
+
+            ('/dev4285/demods/0/enable', 1),
+            ('/dev4285/demods/1/enable', 0),
+            ('/dev4285/demods/2/enable', 0),
+            ('/dev4285/demods/3/enable', 0),
+
+            ('/dev4285/demods/0/order', self.filter_order),
+            ('/dev4285/demods/0/oscselect', 0),
+            ('/dev4285/demods/0/adcselect', 0),
+            ('/dev4285/demods/0/harmonic', 1.),
+            ('/dev4285/demods/0/phaseshift', 0.),
+
+            ('/dev4285/demods/1/order', self.filter_order),
+            ('/dev4285/demods/1/oscselect', 0),
+            ('/dev4285/demods/1/adcselect', 0),
+            ('/dev4285/demods/1/phaseshift', 0.),
+
+            ('/dev4285/demods/2/order', self.filter_order),
+            ('/dev4285/demods/2/oscselect', 0),
+            ('/dev4285/demods/2/adcselect', 0),
+            ('/dev4285/demods/2/phaseshift', 0.),
+
+            ('/dev4285/demods/3/order', self.filter_order),
+            ('/dev4285/demods/3/oscselect', 0),
+            ('/dev4285/demods/3/adcselect', 0),
+            ('/dev4285/demods/3/phaseshift', 0.),
+
+            ('/dev4285/sigins/0/float', 0),
+            ('/dev4285/sigins/0/imp50', 0),
+            ('/dev4285/sigouts/0/imp50', 0),
+        ]
+
+        if self.streaming:
+            settings.extend([
+                ('/dev4285/demods/%d/rate' % demod, self.probe_sample_rate)
+                for demod in range(self.max_number_of_demods)
+            ])
 
-        # Connect and set up MFLI as probing lock-in amplifier
-        log.info("Connecting to and setting up lock-in amplifier")
-        (daq, device, props) = zhinst.utils.create_api_session("dev4285", 6)
-        self.lockin = daq
-        self.lockin.setInt("/dev4285/sigouts/0/on", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/0", 1)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/1", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/2", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/3", 0)
-
-        self.lockin.setInt("/dev4285/sigouts/0/diff", 1)
-        self.lockin.setInt("/dev4285/sigins/0/diff", 1)
-
-        self.lockin.setInt('/dev4285/sigins/0/ac', 1)
-
-        self.lockin.setInt('/dev4285/demods/0/enable', 1)
-        self.lockin.setInt('/dev4285/demods/1/enable', 0)
-        self.lockin.setInt('/dev4285/demods/2/enable', 0)
-        self.lockin.setInt('/dev4285/demods/3/enable', 0)
-
-        self.lockin.setInt('/dev4285/demods/0/order', 3)
-        self.lockin.setInt('/dev4285/demods/0/oscselect', 0)
-        self.lockin.setInt('/dev4285/demods/0/adcselect', 0)
-        self.lockin.setDouble('/dev4285/demods/0/harmonic', 1)
-        self.lockin.setDouble('/dev4285/demods/0/phaseshift', 0)
-        self.lockin.setInt('/dev4285/sigins/0/float', 0)
-        self.lockin.setInt('/dev4285/sigins/0/imp50', 0)
-        self.lockin.setInt('/dev4285/sigouts/0/imp50', 0)
-
-        # Connect and set up Keithley 6221 as pulsing device
-        log.info("Connecting to and setting up pulse source")
-        self.k6221 = Keithley6221("GPIB::13::INSTR")
-        self.k6221.waveform_abort()
-        self.k6221.source_enabled = False
+        # Send all settings as a single transaction
+        self.lockin.set(settings)
 
-        # Connect and set up temperature controller
-        log.info("Connecting to and setting up temperature controller")
-        try:
-            self.temperatureController = ITC503("GPIB::24", max_temperature=320)
-        except pyvisa.errors.VisaIOError:
-            self.temperatureController = None
+        # Background thread for preparing the probes during waits
+        self.scheduler = ActionScheduler(self.probe_pipelined)
 
+        # Set up Keithley 6221 as pulsing device
+        log.info("Setting up pulse source")
+        self.pulse_source.disarm()
+        self.k6221.source_enabled = False
+
+        # Set up temperature controller
         if self.temperature_control and self.temperatureController is None:
             log.error("Could not connect to ITC503. Fix this issue")
 
@@ -279,12 +490,13 @@ class MeasurementProcedure(Procedure):
             self.temperatureController.auto_pid = True
             self.temperatureController.sweep_status = 0
 
-        # Connect and set up magnet power supply (Delta Elektronika)
-        log.info("Connecting to magnet power supply")
-        self.source = SM7045D("GPIB::8")
+        # Set up magnet power supply (Delta Elektronika)
         if self.field_control:
-            log.info("Ramping magnet power supply to zero and enabling it")
-            self.source.ramp_to_zero(self.field_ramp_rate)
+            if self.field_from_previous:
+                log.info("Keeping the magnetic field of the previous measurement")
+            else:
+                log.info("Ramping magnet power supply to zero and enabling it")
+                self.source.ramp_to_zero(self.field_ramp_rate)
             self.source.enable()
 
         self.field = self.field_mT * 1e-3
@@ -300,6 +512,8 @@ class MeasurementProcedure(Procedure):
 
         # Set (and wait for) the temperature
         if self.temperature_control and self.temperatureController is not None:
+            import pyvisa
+
             log.info(f"Setting temperature to {self.temperature_sp} K.")
             self.temperatureController.temperature_setpoint = self.temperature_sp
 
@@ -321,9 +535,16 @@ class MeasurementProcedure(Procedure):
             log.info("Ramping magnetic field.")
             self.source.ramp_to_current(self.field_current, self.field_ramp_rate)
 
+        # Read the temperature in the background from now on
+        self.start_temperature_poller()
+
         # Perform the measurement
         for n in range(self.number_of_repeats):
             for i, pulse_idx in enumerate(self.pulse_sequence):
+                # Skip the cycles that were completed before resuming
+                if self.resume_cycle is not None and (n, i) <= self.resume_cycle:
+                    continue
+
                 # Check for stop command
                 if self.should_stop():
                     return
@@ -331,23 +552,41 @@ class MeasurementProcedure(Procedure):
                 # Apply pulse sequence
                 self.last_pulse_number += 1
                 self.last_pulse_config = pulse_idx
+                phase_start = self.clock.time()
                 self.perform_pulsing(pulse_idx)
 
-                # Wait between pulsing and probing
-                sleep(self.probe_delay)
+                probe_order = self.probe_sequence[i]
+
+                # Wait between pulsing and probing; the first probe is
+                # prepared in the meantime if the probes are pipelined
+                if self.probe_pipelined and len(probe_order) > 0:
+                    self.scheduler.submit(("probe", probe_order[0]),
+                                          self.prepare_probe, probe_order[0])
+                with self.timer.span("probe delay"):
+                    self.wait(self.probe_delay)
+                self.record_phase("pulsing", self.clock.time() - phase_start,
+                                  self.modelled_pulsing_duration())
 
                 # Check for stop command
                 if self.should_stop():
                     return
 
                 # Perform all probes
-                for probe_idx in self.probes.keys():
-                    self.perform_probing(probe_idx)
+                for j, probe_idx in enumerate(probe_order):
+                    next_probe_idx = probe_order[j + 1] if j + 1 < len(probe_order) else None
+                    phase_start = self.clock.time()
+                    self.perform_probing(probe_idx, next_probe_idx)
+                    self.record_phase("probing", self.clock.time() - phase_start,
+                                      self.modelled_probing_duration(self.probes[probe_idx]))
 
                     # Check for stop command
                     if self.should_stop():
                         return
 
+                # Store the position in the loop
+                self.completed_cycle = (n, i)
+                self.save_checkpoint()
+
                 # Update progress
                 self.emit("progress", (n + (i + 1) / len(self.pulse_sequence)
                                        ) / self.number_of_repeats * 100)
@@ -365,20 +604,86 @@ class MeasurementProcedure(Procedure):
         """
         log.info("Shutting down. Setting devices in a safe state.")
 
-        # Ramp field to zero
-        if self.field_control:
-            log.info("Ramping magnetic field to zero.")
-            self.source.ramp_to_zero(self.field_ramp_rate)
+        if self.temperature_poller is not None:
+            self.temperature_poller.stop()
+            self.temperature_poller = None
+
+        # Write the buffered results
+        if self.results_batcher is not None:
+            self.results_batcher.flush()
+
+        if self.results_writer is not None:
+            self.results_writer.close()
+            self.results_writer = None
+
+        if self.raw_capture is not None:
+            self.raw_capture.close()
+            log.info(f"Captured {self.raw_capture.number_samples} raw samples in "
+                     f"{self.raw_capture.number_windows} probe windows.")
+            self.raw_capture = None
+
+        # Store the last completed cycle, such that the measurement can be resumed
+        if self.checkpoint is not None and self.completed_cycle is not None:
+            self.save_checkpoint(force=True)
+            log.info(f"Stored {self.checkpoint.number_saved} checkpoints in "
+                     f"{self.checkpoint.path}")
+
+        # Finish the actions that are running in the background
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+            log.info(f"Scheduler: ran {self.scheduler.number_run} actions in the "
+                     f"background, waited {self.scheduler.wait_time:.3f} s for them.")
+
+        # Store the phase timings for the time estimates of later measurements
+        if self.phase_timings and not self.AAF_simulation:
+            try:
+                TimingModel(Path(self.AAC_folder) / self.timing_history_file).record(
+                    self.phase_timings, mode=self.timing_mode(), version=self.AAA)
+            except OSError:
+                log.exception("Could not store the phase timings")
+
+        # Store and summarize the durations of the individual phases
+        if self.timer.enabled:
+            self.timer.log_summary(log)
+            try:
+                path = self.sidecar_filename(".timing.json")
+                self.timer.write(path, mode=self.timing_mode(), version=self.AAA)
+                log.info(f"Wrote phase timing to {path}")
+            except OSError:
+                log.exception("Could not store the phase timing")
+
+        # Ramp field to zero, unless the measurement finished and the field is
+        # handed over to the next measurement
+        if self.field_control and self.source is not None:
+            if self.field_to_next and self.measurement_finished() and not self.should_stop():
+                log.info("Keeping the magnetic field for the next measurement.")
+                type(self).field_handed_over = (self.source, self.field_ramp_rate)
+            else:
+                log.info("Ramping magnetic field to zero.")
+                self.source.ramp_to_zero(self.field_ramp_rate)
 
         # Disconnect everything
-        self.lockin.setInt("/dev4285/sigouts/0/on", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/0", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/1", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/2", 0)
-        self.lockin.setInt("/dev4285/sigouts/0/enables/3", 0)
-
-        self.k2700.open_all_channels()
-        self.k2700.display_text = "FINISHED!!!!"
+        if self.lockin is not None:
+            self.lockin.setInt("/dev4285/sigouts/0/on", 0)
+            self.lockin.setInt("/dev4285/sigouts/0/enables/0", 0)
+            self.lockin.setInt("/dev4285/sigouts/0/enables/1", 0)
+            self.lockin.setInt("/dev4285/sigouts/0/enables/2", 0)
+            self.lockin.setInt("/dev4285/sigouts/0/enables/3", 0)
+            log.info(f"Lock-in: sent {self.lockin.number_sent} and skipped "
+                     f"{self.lockin.number_skipped} node operations.")
+
+        if self.pulse_source is not None:
+            self.pulse_source.disarm()
+            log.info(f"Pulse source: wrote {self.pulse_source.number_written} and "
+                     f"skipped {self.pulse_source.number_skipped} waveform properties.")
+
+        if self.matrix is not None:
+            self.matrix.reset()
+            log.info(f"Switch matrix: opened {self.matrix.number_opened} and closed "
+                     f"{self.matrix.number_closed} channels.")
+
+        if self.k2700 is not None:
+            self.k2700.display_text = "FINISHED!!!!"
 
         log.info("Finished measurement.")
 
@@ -393,31 +698,166 @@ class MeasurementProcedure(Procedure):
     """
 
     # Define additional functions
+    @classmethod
+    def release_field(cls):
+        """ Ramp the magnetic field to zero if it was handed over to a next
+        measurement that did not take it over, e.g. because the queue ended or
+        was aborted, or the next measurement failed to start.
+        """
+        if cls.field_handed_over is None:
+            return
+
+        source, ramp_rate = cls.field_handed_over
+        cls.field_handed_over = None
+
+        log.info("Ramping the magnetic field that was handed over to zero.")
+        source.ramp_to_zero(ramp_rate)
+
+    @classmethod
+    def close_connections(cls):
+        """ Ramp down a magnetic field that was handed over and close the
+        instrument connections that were kept open for a next measurement,
+        e.g. when the queue ended or the program is closed.
+        """
+        cls.release_field()
+        sessions.close()
+
+    def connect_instruments(self):
+        """ Connect to the instruments that are used for the measurement. The
+        connections (and the cached lock-in and pulse source settings) can be
+        kept open for the next measurement; connections that do not respond
+        anymore are reopened.
+        """
+        import pyvisa
+        import zhinst.utils
+        from pymeasure.instruments.keithley import Keithley6221, Keithley2700
+        from pymeasure.instruments.oxfordinstruments import ITC503
+        from pymeasure.instruments.deltaelektronika import SM7045D
+
+        # The magnet power supply is kept connected while it has a field that
+        # was handed over, such that it can still be ramped down
+        if not self.AAM_keep_connections:
+            for name in list(sessions.sessions):
+                if name != "sm7045d" or self.field_handed_over is None:
+                    sessions.close(name)
+
+        def close_visa(instrument):
+            instrument.adapter.connection.close()
+
+        # Connect Keithley 2700 as switchboard
+        self.k2700 = sessions.get(
+            "k2700", lambda: Keithley2700("GPIB::30::INSTR"),
+            check=lambda k2700: k2700.id, close=close_visa)
+
+        # Connect MFLI as probing lock-in amplifier
+        log.info("Connecting to lock-in amplifier")
+        self.lockin = sessions.get(
+            "lockin", lambda: CachedDAQ(zhinst.utils.create_api_session("dev4285", 6)[0]),
+            check=lambda lockin: lockin.daq.getInt("/dev4285/sigouts/0/on"),
+            close=lambda lockin: lockin.daq.disconnect())
+
+        # Pick up settings that were changed on the device since the previous
+        # measurement, and count the operations of this measurement only
+        self.lockin.check_for_changes()
+        self.lockin.number_sent = self.lockin.number_skipped = 0
+
+        # Connect Keithley 6221 as pulsing device
+        log.info("Connecting to pulse source")
+        self.pulse_source = sessions.get(
+            "k6221", lambda: PulseSource(Keithley6221("GPIB::13::INSTR")),
+            check=lambda pulse_source: pulse_source.k6221.id,
+            close=lambda pulse_source: close_visa(pulse_source.k6221))
+        self.pulse_source.number_written = self.pulse_source.number_skipped = 0
+        self.k6221 = self.pulse_source.k6221
+
+        # Connect temperature controller
+        log.info("Connecting to temperature controller")
+        try:
+            self.temperatureController = sessions.get(
+                "itc503", lambda: ITC503("GPIB::24", max_temperature=320),
+                check=lambda itc503: itc503.id, close=close_visa)
+        except pyvisa.errors.VisaIOError:
+            self.temperatureController = None
+
+        # Connect magnet power supply (Delta Elektronika)
+        log.info("Connecting to magnet power supply")
+        self.source = sessions.get(
+            "sm7045d", lambda: SM7045D("GPIB::8"),
+            check=lambda source: source.measure_current, close=close_visa)
+
+        log.info(f"Instrument connections: opened {sessions.number_opened}, "
+                 f"reused {sessions.number_reused} in total.")
+
+    def connect_simulated_instruments(self):
+        """ Replace the instruments by simulated instruments that emulate a
+        switching sample. All waiting is done on a virtual clock, such that
+        the measurement runs without the actual delays.
+        """
+        log.info("Using simulated instruments")
+        self.clock = VirtualClock()
+
+        simulation = Simulation(
+            self.clock,
+            rows={
+                "pulse high": self.row_pulse_hi,
+                "pulse low": self.row_pulse_lo,
+                "lock-in input A": self.row_lia_inA,
+                "lock-in input B": self.row_lia_inB,
+                "lock-in output A": self.row_lia_outA,
+                "lock-in output B": self.row_lia_outB,
+            },
+            series_resistance=self.probe_series_resistance,
+        )
+
+        self.k2700 = simulation.k2700
+        self.lockin = CachedDAQ(simulation.lockin)
+        self.k6221 = simulation.k6221
+        self.pulse_source = PulseSource(self.k6221)
+        self.temperatureController = simulation.temperatureController
+        self.source = simulation.source
+
+    def find_yaml_config(self):
+        """ Find the selected YAML config file; the file in the output folder
+        takes precedence over the file in the software folder.
+
+        :return: the path of the config file, or None if there is none
+        """
+        file = Path(self.AAC_folder) / self.AAE_yaml_config_file
+        file_with_software = Path(self.AAE_yaml_config_file)
+
+        if file.is_file():
+            return file
+        elif file_with_software.is_file():
+            return file_with_software
+        return None
+
     def load_yaml_config(self):
         """ Load the selected YAML.
         first tries to find the file in the output folder, if
         this cannot be found, load it from the software folder.
         """
+        import yaml
+
         # Try to find config file in output folder
         read_cfg = True
         file = Path(self.AAC_folder) / self.AAE_yaml_config_file
-        file_with_software = Path(self.AAE_yaml_config_file)
+        found = self.find_yaml_config()
 
         # Determine if the YAML file exists in the data folder or the software folder
-        if file.is_file():
+        if found == file:
             log.info("Loading YAML config file from data folder")
-        elif file_with_software.is_file():
+        elif found is not None:
             log.info("Copying YAML config file to data folder")
-            copy(file_with_software, file)
+            copy(found, file)
         else:
             log.info("Not using a YAML config file")
             read_cfg = False
 
         # read or write the config file
         if read_cfg:
-            with open(file, "r") as yml_file:
-                self.cfg = yaml.full_load(yml_file)
+            self.read_yaml_config(file)
         else:
+            self.read_yaml_config(None)
             log.info("Writing default config (only for the columns) to data folder")
 
             cfg = {
@@ -430,6 +870,30 @@ class MeasurementProcedure(Procedure):
             with open(file, "w") as yml_file:
                 yaml.dump(cfg, yml_file, default_flow_style=False)
 
+    def read_yaml_config(self, file):
+        """ Read the config from a YAML file into "cfg"; without a file (or
+        for an empty file) the config is empty, such that the defaults are
+        used.
+        """
+        import yaml
+
+        self.cfg = dict()
+        if file is not None:
+            with open(file, "r") as yml_file:
+                self.cfg = yaml.full_load(yml_file) or dict()
+
+    def plan_measurement(self):
+        """ Determine the pulse sequence and the probe parameters from the
+        config file (like startup does), without copying or writing the config
+        file; used to estimate the duration of the measurement.
+        """
+        self.read_yaml_config(self.find_yaml_config())
+        self.extract_config()
+        self.determine_probe_mapping()
+        self.determine_pulse_parameters()
+        self.determine_probe_parameters()
+        self.determine_sequence()
+
     def extract_config(self):
         """ Extract the loaded config and save to the appropriate variables.
         """
@@ -454,6 +918,9 @@ class MeasurementProcedure(Procedure):
                     k.replace("probe ", ""): v for k, v in cols_cfg["probing"].items()
                 }
 
+        if "sequence" in self.cfg:
+            self.sequence = self.cfg.pop("sequence")
+
         if len(self.cfg.keys()) > 0:
             log.info("The config file has additional (unhandled) attributes")
 
@@ -462,31 +929,21 @@ class MeasurementProcedure(Procedure):
         the measurement script.
         """
         new_probes = dict()
+        self.probe_name_mapping = dict()
 
         for i, (probe, probe_params) in enumerate(self.probes.items(), 1):
 
             self.probe_name_mapping[i] = probe
-            new_probes[i] = probe_params
+            new_probes[i] = dict(probe_params)
 
         self.probes = new_probes
 
     def determine_pulse_parameters(self):
-        """ Determine the pulse sequence from either "pulse_number_of_bursts" or (if
-        defined) from the "number of bursts" in the config file. The sequence is stored
-        in the parameter "pulse_sequence".
+        """ Determine the name of every pulse by its (1-based) index in the
+        config file, stored in "pulse_name_mapping"; the number of bursts of
+        the pulses is applied when the sequence is compiled.
         """
-        self.pulse_sequence = list()
-
-        for i, (pulse, pulse_params) in enumerate(self.pulses.items(), 1):
-
-            # Check if number of bursts is defined for this pulse:
-            if "number of bursts" in pulse_params:
-                n = pulse_params["number of bursts"]
-            else:
-                n = self.pulse_number_of_bursts
-
-            self.pulse_sequence.extend([pulse for _ in range(n)])
-            self.pulse_name_mapping[i] = pulse
+        self.pulse_name_mapping = {i: pulse for i, pulse in enumerate(self.pulses, 1)}
 
     def determine_probe_parameters(self):
         """ Determine the probe parameters per probing configuration and check
@@ -501,6 +958,65 @@ class MeasurementProcedure(Procedure):
                 probe_params["time constant"] = self.probe_time_constant
             if "duration" not in probe_params:
                 probe_params["duration"] = self.probe_duration
+            if "harmonics" not in probe_params:
+                probe_params["harmonics"] = self.probe_harmonics
+
+            probe_params["harmonics"] = self.parse_harmonics(probe_params["harmonics"])
+            if len(probe_params["harmonics"]) > self.max_number_of_demods - 1:
+                raise ValueError(
+                    f"At most {self.max_number_of_demods - 1} additional harmonics "
+                    f"can be measured, got {probe_params['harmonics']}")
+
+    def determine_sequence(self):
+        """ Compile the sequence (from the config file, or each pulse followed by
+        all probes) into the pulses of the cycles, stored in "pulse_sequence",
+        and the probes that follow them (in the listed order, or reordered if
+        enabled), stored in "probe_sequence".
+        The routing of all pulses and probes is checked before the instruments
+        are connected; the planned reconfigurations are stored in
+        "sequence_report".
+        """
+        compiler = SequenceCompiler(
+            rows={
+                "pulse high": self.row_pulse_hi,
+                "pulse low": self.row_pulse_lo,
+                "lock-in input A": self.row_lia_inA,
+                "lock-in input B": self.row_lia_inB,
+                "lock-in output A": self.row_lia_outA,
+                "lock-in output B": self.row_lia_outB,
+            },
+            pulses=self.pulses,
+            probes=self.probes,
+            probe_names=self.probe_name_mapping,
+            number_of_bursts=self.pulse_number_of_bursts,
+            reorder=self.sequence_reorder_probes,
+            keep_routing=self.probe_pipelined,
+        )
+
+        cycles = compiler.compile(self.sequence)
+
+        self.pulse_sequence = [pulse for pulse, _ in cycles]
+        self.probe_sequence = [probes for _, probes in cycles]
+
+        self.sequence_report = compiler.report(
+            cycles, self.number_of_repeats,
+            pulsing_time=lambda pulse: self.modelled_pulsing_duration(),
+            probing_time=lambda probe: self.modelled_probing_duration(self.probes[probe]) -
+            self.probes[probe]["duration"],
+        )
+
+    @staticmethod
+    def parse_harmonics(harmonics):
+        """ Convert the additional harmonics (a comma-separated string, a
+        single number, or a list) to a list of numbers.
+        """
+        if harmonics is None:
+            return []
+        if isinstance(harmonics, str):
+            harmonics = [h for h in harmonics.replace(";", ",").split(",") if h.strip()]
+        elif not isinstance(harmonics, (list, tuple)):
+            harmonics = [harmonics]
+        return [float(h) for h in harmonics]
 
     def perform_pulsing(self, pulse_idx):
         """ Perform pulsing with the parameters associated with puls_idx
@@ -513,121 +1029,442 @@ class MeasurementProcedure(Procedure):
         # Get pulse information associated with pulse_idx
         pulse = self.pulses[pulse_idx]
 
+        # Program and arm the pulse source before the pulse channels are
+        # connected, such that the sample only sees the pulses
+        schedule = self.prepare_pulses()
+
         # Connect pulse channels
-        self.k2700.open_all_channels()
-        self.k2700.close_rows_to_columns(
-            rows=[self.row_pulse_hi, self.row_pulse_lo],
-            columns=[pulse["high"], pulse["low"]]
-        )
+        with self.timer.span("relay routing"):
+            self.matrix.route(
+                rows=[self.row_pulse_hi, self.row_pulse_lo],
+                columns=[pulse["high"], pulse["low"]]
+            )
 
         # Apply pulses
-        pulse_timestamp, amplitude, compliance, hits_compliance = self.apply_pulses()
+        with self.timer.span("pulsing"):
+            pulse_timestamps, amplitude, compliance, hits_compliance = \
+                self.apply_pulses(schedule)
 
-        # Store the measured voltage
-        self.store_measurement({
+        # Store the pulses (one row per pulse in the burst)
+        self.store_measurements([{
             "Timestamp (s)": pulse_timestamp,
             "Pulse amplitude (A)": amplitude,
             "Pulse compliance (V)": compliance,
             "Pulse hits compliance": hits_compliance,
-        })
+        } for pulse_timestamp in pulse_timestamps])
 
         # Disconnect pulse channels
-        self.k2700.open_all_channels()
+        with self.timer.span("relay routing"):
+            self.matrix.disconnect()
 
-    def perform_probing(self, probe_idx):
-        """ Perform probing with the parameters associated with probe_idx
+    def prepare_probe(self, probe_idx):
+        """ Prepare the probing with the parameters associated with probe_idx:
+        update the display and program the lock-in. This does not depend on
+        the state of the sample (the lock-in output is off), such that it can
+        be done in the background during a wait.
 
         :param probe_idx: the index/name for the to-be-used probe
+        :return: a dictionary with the (coerced) lock-in settings
         """
-        log.info("Probing with probe {}".format(probe_idx))
         self.k2700.display_text = f"PROBE {probe_idx}, {self.last_pulse_number:3d}"
 
         # Get probe information associated with probe_idx
         probe = self.probes[probe_idx]
 
-        # Connect probe channels
-        self.k2700.open_all_channels()
-        self.k2700.close_rows_to_columns(
-            rows=[
-                self.row_lia_outA, self.row_lia_outB,
-                self.row_lia_inA, self.row_lia_inB,
-            ],
-            columns=[
-                probe["current high"], probe["current low"],
-                probe["voltage high"], probe["voltage low"],
-            ])
+        # The additional demodulators measure the harmonics of the same
+        # oscillator
+        harmonics = probe["harmonics"]
+        demods = list(range(len(harmonics) + 1))
 
-        # Set parameters on lock-in
-        self.lockin.set([
+        # Set parameters on lock-in; only the parameters that differ from the
+        # previous probe are sent
+        self.lockin.check_for_changes()
+        settings = [
             ("/dev4285/demods/0/timeconstant", probe["time constant"]),
             ("/dev4285/oscs/0/freq", probe["frequency"]),
             ("/dev4285/sigouts/0/range", 20),
             ("/dev4285/sigouts/0/amplitudes/0",
              probe["amplitude"] * np.sqrt(2)),
             ("/dev4285/sigins/0/range", 3),
+        ]
+        for demod in range(1, self.max_number_of_demods):
+            settings.append(("/dev4285/demods/%d/enable" % demod, int(demod in demods)))
+            if demod in demods:
+                settings.extend([
+                    ("/dev4285/demods/%d/harmonic" % demod, harmonics[demod - 1]),
+                    ("/dev4285/demods/%d/timeconstant" % demod, probe["time constant"]),
+                ])
+        self.lockin.set(settings)
+
+        settings = self.lockin.get_values([
+            "/dev4285/demods/0/timeconstant",
+            "/dev4285/demods/0/order",
+            "/dev4285/oscs/0/freq",
+            "/dev4285/sigouts/0/amplitudes/0",
         ])
 
-        time_constant = self.lockin.getDouble("/dev4285/demods/0/timeconstant")
-        filter_order = self.lockin.getInt('/dev4285/demods/0/order')
-        frequency = self.lockin.getDouble("/dev4285/oscs/0/freq")
-        sine_voltage = self.lockin.getDouble(
-            "/dev4285/sigouts/0/amplitudes/0") / np.sqrt(2)
+        return {
+            "harmonics": harmonics,
+            "demods": demods,
+            "time constant": float(settings["/dev4285/demods/0/timeconstant"]),
+            "filter order": int(settings["/dev4285/demods/0/order"]),
+            "frequency": float(settings["/dev4285/oscs/0/freq"]),
+            "sine voltage": float(settings["/dev4285/sigouts/0/amplitudes/0"]) / np.sqrt(2),
+        }
+
+    def perform_probing(self, probe_idx, next_probe_idx=None):
+        """ Perform probing with the parameters associated with probe_idx
+
+        :param probe_idx: the index/name for the to-be-used probe
+        :param next_probe_idx: the index/name of the probe that follows; if
+            the probes are pipelined, it is prepared during the final wait
+        """
+        log.info("Probing with probe {}".format(probe_idx))
+
+        # Get the lock-in settings; these are prepared in the background
+        # during the preceding wait if the probes are pipelined
+        with self.timer.span("lock-in programming"):
+            if self.scheduler.pending(("probe", probe_idx)):
+                prepared = self.scheduler.result(("probe", probe_idx))
+            else:
+                prepared = self.prepare_probe(probe_idx)
+
+        # Get probe information associated with probe_idx
+        probe = self.probes[probe_idx]
+
+        # Connect probe channels; channels shared with the previous
+        # configuration remain closed
+        with self.timer.span("relay routing"):
+            self.matrix.route(
+                rows=[
+                    self.row_lia_outA, self.row_lia_outB,
+                    self.row_lia_inA, self.row_lia_inB,
+                ],
+                columns=[
+                    probe["current high"], probe["current low"],
+                    probe["voltage high"], probe["voltage low"],
+                ])
+
+        harmonics = prepared["harmonics"]
+        demods = prepared["demods"]
+        time_constant = prepared["time constant"]
+        filter_order = prepared["filter order"]
+        frequency = prepared["frequency"]
+        sine_voltage = prepared["sine voltage"]
 
         # Calculate the 90.0% and 99.9% settling times
         delay_90 = time_constant * (1.93 * filter_order**0.85 + 0.38)
         delay_99 = time_constant * (2.74 * filter_order**0.79 + 1.89)
 
-        self.lockin.setInt("/dev4285/sigouts/0/on", 1)
-        sleep(1)
+        with self.timer.span("settling"):
+            output_on = self.clock.time()
+            self.lockin.setInt("/dev4285/sigouts/0/on", 1)
+
+            if self.probe_settling_detection:
+                sensitivity = self.wait_for_settling(time_constant, delay_90 + delay_99)
+            else:
+                self.clock.sleep(1)
+
+                # Let input-auto-ranger do it's work
+                self.lockin.setInt("/dev4285/sigins/0/autorange", 1)
+                self.clock.sleep(1)
+
+                # Get the used range / sensitivity
+                sensitivity = self.lockin.getDouble("/dev4285/sigins/0/range")
+
+                # Waiting a settling time is required before sync is called
+                # to ensure all parameters are communicated correctly
+                self.clock.sleep(delay_90)
+                self.lockin.sync()
+
+                # Allow the value to settle before starting the readings
+                self.clock.sleep(delay_99)
 
-        # Let input-auto-ranger do it's work
+            settling_time = self.clock.time() - output_on
+
+        probe_data = {
+            "Probe configuration": probe_idx,
+            "Probe amplitude (V)": sine_voltage,
+            "Probe sensitivity (V)": sensitivity,
+            "Probe frequency (Hz)": frequency,
+            "Probe time constant (s)": time_constant,
+            "Probe settling time (s)": settling_time,
+        }
+        for demod in demods[1:]:
+            probe_data["Demod %d harmonic" % (demod + 1)] = harmonics[demod - 1]
+
+        with self.timer.span("sampling"):
+            if self.streaming:
+                self.acquire_streaming(probe_idx, probe, probe_data, delay_90, demods)
+            else:
+                self.acquire_polling(probe_idx, probe, probe_data, delay_90, demods)
+
+        # Deliver the rows of this probe window as a single block
+        if self.results_batcher is not None:
+            with self.timer.span("result emission"):
+                self.results_batcher.flush()
+
+        # Turn off lock-in output
+        self.lockin.setInt("/dev4285/sigouts/0/on", 0)
+
+        # Prepare the next probe while waiting
+        if self.probe_pipelined and next_probe_idx is not None:
+            self.scheduler.submit(("probe", next_probe_idx),
+                                  self.prepare_probe, next_probe_idx)
+
+        # Disconnect the probe channels, unless the probes are pipelined and
+        # the next probe (of the same cycle) is routed right after the delay
+        if not (self.probe_pipelined and next_probe_idx is not None):
+            with self.timer.span("relay routing"):
+                self.matrix.disconnect()
+
+        with self.timer.span("probe delay"):
+            self.clock.sleep(1)
+
+    def wait_for_settling(self, window, max_duration):
+        """ Wait for the auto-ranger to finish and for the output of the first
+        demodulator to settle, as determined from the streamed samples. The
+        fixed waits (2 s for the auto-ranger and the theoretical settling time
+        of the filter) are used as upper bounds.
+
+        :param window: the length (s) of the windows that are compared to
+            determine whether the signal has settled
+        :param max_duration: the maximum time (s) to wait for the signal to
+            settle
+        :return: the range (V) of the signal input, as set by the auto-ranger
+        """
+        # Let input-auto-ranger do it's work; the node is reset when done
         self.lockin.setInt("/dev4285/sigins/0/autorange", 1)
-        sleep(1)
+        deadline = self.clock.time() + 2
+        while self.lockin.getInt("/dev4285/sigins/0/autorange") and \
+                self.clock.time() < deadline:
+            self.clock.sleep(0.05)
 
         # Get the used range / sensitivity
         sensitivity = self.lockin.getDouble("/dev4285/sigins/0/range")
 
-        # Waiting a settling time is required before sync is called
-        # to ensure all parameters are communicated correctly
-        sleep(delay_90)
-        self.lockin.sync()
+        detector = SettlingDetector(self.probe_settling_tolerance, window)
 
-        # Allow the value to settle before starting the readings
-        sleep(delay_99)
+        stream = DemodulatorStream(self.lockin, "dev4285", clock=self.clock,
+                                   poll_length=min(0.1, window / 2))
+        stream.subscribe()
+
+        deadline = self.clock.time() + max_duration
+        try:
+            while self.clock.time() < deadline and not self.should_stop():
+                block = stream.read()[0]
+                detector.add(block["timestamp"], np.hypot(block["x"], block["y"]))
 
+                if detector.settled():
+                    break
+            else:
+                log.debug("The lock-in signal did not settle within the settling time")
+        finally:
+            stream.unsubscribe()
+
+        return sensitivity
+
+    def acquire_polling(self, probe_idx, probe, probe_data, delay_90, demods=(0,)):
+        """ Acquire the lock-in signal by requesting single samples, waiting
+        for the signal to settle between consecutive samples. The running
+        standard errors of Rx and Ry are stored with every sample.
+
+        :param probe_idx: the index/name for the used probe
+        :param probe: the dictionary with the probe parameters
+        :param probe_data: the data that is stored with every sample
+        :param delay_90: the time (s) to wait between samples
+        :param demods: the demodulators to read; the first is stored in the
+            probe columns, the others in the demodulator columns
+        """
         # Start timing
-        start = time()
+        start = self.clock.time()
+
+        statistics_x, statistics_y = RunningStatistics(), RunningStatistics()
 
         while True:
             # Probe
             sample = self.lockin.getSample("/dev4285/demods/0/sample")
 
-            # Store the values
-            self.store_measurement({
-                "Probe configuration": probe_idx,
+            Rx = sample["x"][0] / (self.probe_current * 1e-3)
+            Ry = sample["y"][0] / (self.probe_current * 1e-3)
+            statistics_x.add(Rx)
+            statistics_y.add(Ry)
+
+            # The samples are (approximately) independent as they are taken
+            # a settling time apart
+            errors = (statistics_x.standard_error(), statistics_y.standard_error())
+
+            data = {
+                **probe_data,
+                "Probe Rx error (Ohm)": errors[0],
+                "Probe Ry error (Ohm)": errors[1],
                 "Probe %d x (V)" % (probe_idx): sample["x"][0],
                 "Probe %d y (V)" % (probe_idx): sample["y"][0],
-                "Probe %d Rx (Ohm)" % (probe_idx): sample["x"][0] / (self.probe_current * 1e-3),
-                "Probe %d Ry (Ohm)" % (probe_idx): sample["y"][0] / (self.probe_current * 1e-3),
-                "Probe amplitude (V)": sine_voltage,
-                "Probe sensitivity (V)": sensitivity,
-                "Probe frequency (Hz)": frequency,
-                "Probe time constant (s)": time_constant,
-            })
+                "Probe %d Rx (Ohm)" % (probe_idx): Rx,
+                "Probe %d Ry (Ohm)" % (probe_idx): Ry,
+            }
 
-            # stop probing after duration or on should_stop
-            if time() - start > probe["duration"] or self.should_stop():
+            for demod in demods[1:]:
+                sample = self.lockin.getSample("/dev4285/demods/%d/sample" % demod)
+                data["Demod %d x (V)" % (demod + 1)] = sample["x"][0]
+                data["Demod %d y (V)" % (demod + 1)] = sample["y"][0]
+
+            # Store the values
+            self.store_measurement(data)
+
+            # stop probing after duration, on convergence, or on should_stop
+            if self.probe_finished(probe, self.clock.time() - start, errors) or \
+                    self.should_stop():
                 break
 
             # Wait for the next value to settle
-            sleep(delay_90)
+            self.wait(delay_90)
+
+    def acquire_streaming(self, probe_idx, probe, probe_data, delay_90, demods=(0,)):
+        """ Acquire the lock-in signal by streaming the demodulator samples;
+        the samples are polled in blocks and stored with their device
+        timestamps. The running standard errors of Rx and Ry (at the end of
+        the block) are stored with the samples of every block.
+
+        If the raw samples are captured, the samples of all demodulators are
+        written to the raw capture instead, and only a single summary row
+        (with the mean values) is stored for the probe window.
+
+        :param probe_idx: the index/name for the used probe
+        :param probe: the dictionary with the probe parameters
+        :param probe_data: the data that is stored with every sample
+        :param delay_90: the settling time (s) of the filter, which determines
+            the number of independent samples
+        :param demods: the demodulators to stream; the first is stored in the
+            probe columns, the others (matched to the samples of the first) in
+            the demodulator columns
+        """
+        stream = DemodulatorStream(self.lockin, "dev4285", demods, clock=self.clock)
+        stream.subscribe()
 
-        # Turn off lock-in output
-        self.lockin.setInt("/dev4285/sigouts/0/on", 0)
-        sleep(1)
+        # Start timing
+        start = self.clock.time()
+
+        statistics_x, statistics_y = RunningStatistics(), RunningStatistics()
+        first_timestamp = None
+        errors = (np.nan, np.nan)
 
-        # # Disconnect probe channels
-        self.k2700.open_all_channels()
+        raw = self.raw_capture is not None
+        if raw:
+            self.raw_capture.start_window(self.last_pulse_number, probe_idx)
+            statistics_demods = {demod: (RunningStatistics(), RunningStatistics())
+                                 for demod in demods[1:]}
+
+        try:
+            while True:
+                data = stream.read()
+
+                if raw:
+                    with self.timer.span("raw capture"):
+                        for demod, block in data.items():
+                            self.raw_capture.append(
+                                demod, block["timestamp"], block["x"], block["y"])
+
+                blocks = stream.aligned(data, demods[0])
+                block = blocks[demods[0]]
+
+                current = self.probe_current * 1e-3
+                Rx = block["x"] / current
+                Ry = block["y"] / current
+                statistics_x.add(Rx)
+                statistics_y.add(Ry)
+
+                # Samples that are less than a settling time apart are
+                # correlated; count the independent samples only
+                if len(block["timestamp"]) > 0:
+                    if first_timestamp is None:
+                        first_timestamp = block["timestamp"][0]
+                    independent = (block["timestamp"][-1] - first_timestamp) / delay_90 + 1
+                    errors = (statistics_x.standard_error(independent),
+                              statistics_y.standard_error(independent))
+
+                if raw:
+                    for demod in demods[1:]:
+                        statistics_demods[demod][0].add(blocks[demod]["x"])
+                        statistics_demods[demod][1].add(blocks[demod]["y"])
+                elif len(block["timestamp"]) > 0:
+                    self.store_streamed_rows(probe_idx, probe_data, errors, blocks, demods)
+
+                # stop probing after duration, on convergence, or on should_stop
+                if self.probe_finished(probe, self.clock.time() - start, errors) or \
+                        self.should_stop():
+                    break
+        finally:
+            stream.unsubscribe()
+
+            if raw:
+                self.raw_capture.end_window()
+
+        # Store a single row with the means of the window
+        if raw and first_timestamp is not None:
+            current = self.probe_current * 1e-3
+            row = {
+                **probe_data,
+                "Timestamp (s)": first_timestamp,
+                "Probe Rx error (Ohm)": errors[0],
+                "Probe Ry error (Ohm)": errors[1],
+                "Probe %d x (V)" % (probe_idx): statistics_x.mean * current,
+                "Probe %d y (V)" % (probe_idx): statistics_y.mean * current,
+                "Probe %d Rx (Ohm)" % (probe_idx): statistics_x.mean,
+                "Probe %d Ry (Ohm)" % (probe_idx): statistics_y.mean,
+            }
+            for demod, (statistics_demod_x, statistics_demod_y) in statistics_demods.items():
+                row["Demod %d x (V)" % (demod + 1)] = statistics_demod_x.mean
+                row["Demod %d y (V)" % (demod + 1)] = statistics_demod_y.mean
+
+            self.store_measurements([row])
+
+    def store_streamed_rows(self, probe_idx, probe_data, errors, blocks, demods):
+        """ Store a row for every streamed sample of the first demodulator,
+        with the (matched) samples of the other demodulators.
+        """
+        block = blocks[demods[0]]
+        Rx = block["x"] / (self.probe_current * 1e-3)
+        Ry = block["y"] / (self.probe_current * 1e-3)
+
+        rows = [{
+            **probe_data,
+            "Timestamp (s)": timestamp,
+            "Probe Rx error (Ohm)": errors[0],
+            "Probe Ry error (Ohm)": errors[1],
+            "Probe %d x (V)" % (probe_idx): x,
+            "Probe %d y (V)" % (probe_idx): y,
+            "Probe %d Rx (Ohm)" % (probe_idx): rx,
+            "Probe %d Ry (Ohm)" % (probe_idx): ry,
+        } for timestamp, x, y, rx, ry in zip(
+            block["timestamp"], block["x"], block["y"], Rx, Ry)
+        ]
+
+        for demod in demods[1:]:
+            for row, x, y in zip(rows, blocks[demod]["x"], blocks[demod]["y"]):
+                row["Demod %d x (V)" % (demod + 1)] = x
+                row["Demod %d y (V)" % (demod + 1)] = y
+
+        self.store_measurements(rows)
+
+    def probe_finished(self, probe, elapsed, errors):
+        """ Determine whether probing can stop: after the (maximum) duration of
+        the probe, or, for an adaptive probe duration, after the minimum
+        duration once the standard error of Rx (and optionally Ry) is below
+        the target.
+
+        :param probe: the dictionary with the probe parameters
+        :param elapsed: the time (s) since the start of the acquisition
+        :param errors: the current standard errors (Ohm) of Rx and Ry
+        """
+        if elapsed > probe["duration"]:
+            return True
+
+        if not self.probe_adaptive or elapsed < self.probe_min_duration:
+            return False
+
+        errors = errors if self.probe_target_ry else errors[:1]
+        return all(error <= self.probe_target_error for error in errors)
 
     def store_measurement(self, data_dict=None):
         """ Create the data structure and save data to file.
@@ -635,122 +1472,493 @@ class MeasurementProcedure(Procedure):
         :param data_dict: a dictionary containing the data to be saved.
             Keys in this dictionary overwrite the auto-generated values.
         """
+        self.store_measurements([data_dict])
 
-        data = {
-            "Timestamp (s)": time(),
-            "Temperature (K)": np.nan,
-            "Magnetic field (T)": self.field,
-            "Magnetic field current (A)": self.field_current,
-            "Pulse number": self.last_pulse_number,
-            "Pulse configuration": self.last_pulse_config,
-            "Pulse amplitude (A)": np.nan,
-            "Pulse compliance (V)": np.nan,
-            "Pulse hits compliance": np.nan,
-            "Probe configuration": np.nan,
-            "Probe amplitude (V)": np.nan,
-            "Probe sensitivity (V)": np.nan,
-            "Probe frequency (Hz)": np.nan,
-            "Probe time constant (s)": np.nan,
-        }
-        for key in self.probe_columns:
-            data[key] = np.nan
-
-        # Fill the appropriate column with data
-        if data_dict is not None:
-            data.update(data_dict)
-
-        # Grab temperature if necessary
-        if np.isnan(data["Temperature (K)"]) and self.temperatureController is not None:
-            for i in range(2):
-                try:
-                    temperature = self.temperatureController.temperature_1
-                except ValueError:
-                    log.error(
-                        f"Could not get temperature due to ValueError. Attempt #{i + 1}."
-                    )
-                except pyvisa.errors.VisaIOError:
-                    self.temperatureController = None
-                    break
-                else:
-                    data["Temperature (K)"] = temperature
-                    break
+    def store_measurements(self, data_dicts):
+        """ Create the data structure for a block of measurements and save
+        the data to file. The temperature is queried only once for the entire
+        block.
+
+        :param data_dicts: a list of dictionaries containing the data to be
+            saved. Keys in these dictionaries overwrite the auto-generated
+            values.
+        """
+        if len(data_dicts) == 0:
+            return
+
+        temperature = None
+
+        for data_dict in data_dicts:
+            data = {
+                "Timestamp (s)": self.clock.time(),
+                "Temperature (K)": np.nan,
+                "Temperature timestamp (s)": np.nan,
+                "Magnetic field (T)": self.field,
+                "Magnetic field current (A)": self.field_current,
+                "Pulse number": self.last_pulse_number,
+                "Pulse configuration": self.last_pulse_config,
+                "Pulse amplitude (A)": np.nan,
+                "Pulse compliance (V)": np.nan,
+                "Pulse hits compliance": np.nan,
+                "Probe configuration": np.nan,
+                "Probe amplitude (V)": np.nan,
+                "Probe sensitivity (V)": np.nan,
+                "Probe frequency (Hz)": np.nan,
+                "Probe time constant (s)": np.nan,
+                "Probe settling time (s)": np.nan,
+                "Probe Rx error (Ohm)": np.nan,
+                "Probe Ry error (Ohm)": np.nan,
+            }
+            for key in self.probe_columns:
+                data[key] = np.nan
+            for key in self.demod_columns:
+                data[key] = np.nan
+
+            # Fill the appropriate column with data
+            if data_dict is not None:
+                data.update(data_dict)
+
+            # Grab temperature if necessary
+            if np.isnan(data["Temperature (K)"]):
+                with self.timer.span("temperature query"):
+                    if self.temperature_poller is not None:
+                        temperature = self.get_polled_temperature(data["Timestamp (s)"])
+                    elif temperature is None:
+                        temperature = (self.read_temperature(), self.clock.time())
+
+                data["Temperature (K)"], data["Temperature timestamp (s)"] = temperature
+
+            # Write the data
+            with self.timer.span("result emission"):
+                if self.results_writer is not None:
+                    self.results_writer.append(data)
+                if self.results_batcher is not None:
+                    self.results_batcher.append(data)
+
+    def open_binary_results(self):
+        """ Open the binary (columnar) results, which are stored in a folder
+        next to the text results file (with the extension ".columns").
+        """
+        path = self.sidecar_filename(".columns")
+
+        log.info(f"Writing binary results to {path}")
+        self.results_writer = ColumnarWriter(
+            path, self.DATA_COLUMNS, self.COLUMN_TYPES, self.results_buffer_size,
+            parameters=self.parameter_values(),
+        )
 
-        # Write the data
-        self.emit("results", data)
+    def resume_measurement(self):
+        """ Continue an interrupted measurement from its checkpoint: the new
+        results are appended to the existing results file and the cycles that
+        were completed at the checkpoint are skipped.
 
-    def apply_pulses(self):
-        """ Apply the actual pulses. This function is responsible for
-        communicating with the devices that are required for the pulsing.
+        As the checkpoint is written at most once per checkpoint interval, the
+        results file can contain cycles after it (e.g. after a crash); these
+        are measured again. The pulse counter continues after the highest
+        pulse number in the results, such that the pulse numbers remain unique.
+        """
+        self.results_filename = str(Path(self.AAC_folder) / self.AAK_resume_results_file)
+
+        state = Checkpoint(self.sidecar_filename(".checkpoint.json")).load()
+        if state is None:
+            raise ValueError(f"No checkpoint found for {self.results_filename}")
+
+        probe_sequence = [list(probes) for probes in self.probe_sequence]
+        if state["pulse sequence"] != list(self.pulse_sequence) or \
+                state.get("probe sequence", probe_sequence) != probe_sequence:
+            raise ValueError("The sequence differs from that of the "
+                             "measurement that is resumed")
+
+        self.resume_cycle = tuple(state["cycle"])
+        self.completed_cycle = self.resume_cycle
+        self.last_pulse_number = state["pulse number"]
+        self.last_pulse_config = state["pulse configuration"]
+
+        stored = self.stored_pulse_number()
+        if stored > self.last_pulse_number:
+            log.warning(f"The results contain {stored - self.last_pulse_number} cycles after "
+                        f"the checkpoint; these are measured again from pulse number "
+                        f"{stored + 1} on")
+            self.last_pulse_number = stored
+
+        log.info(f"Resuming {self.results_filename} after repeat {self.resume_cycle[0] + 1}, "
+                 f"cycle {self.resume_cycle[1] + 1} (pulse number {self.last_pulse_number})")
+
+    def stored_pulse_number(self):
+        """ The highest pulse number in the stored (text and binary) results
+        of the measurement, or 0 if no rows were stored.
         """
+        import pandas as pd
 
-        # For defining single pulses, use a square wave with 100% duty-cycle
-        # for a single cycle; pulse-length is then defined by 1 / frequency
-        self.k6221.clear()
+        highest = 0
 
-        self.k6221.waveform_function = "square"
-        self.k6221.waveform_amplitude = self.pulse_amplitude
-        self.k6221.waveform_offset = 0
-        self.k6221.source_compliance = self.pulse_compliance
-        self.k6221.waveform_dutycycle = 100
-        self.k6221.waveform_frequency = 1e3 / self.pulse_length
-        self.k6221.waveform_ranging = "best"
-        self.k6221.waveform_duration_cycles = 1
+        if Path(self.results_filename).is_file():
+            try:
+                reader = pd.read_csv(self.results_filename, comment="#", usecols=["Pulse number"],
+                                     chunksize=100000, on_bad_lines="skip")
+                for chunk in reader:
+                    highest = max(highest, chunk["Pulse number"].max(skipna=True))
+            except pd.errors.EmptyDataError:
+                pass
+
+        columns = self.sidecar_filename(".columns")
+        if columns.is_dir():
+            for chunk in iter_columnar(columns, ["Pulse number"]):
+                if len(chunk["Pulse number"]) > 0:
+                    highest = max(highest, chunk["Pulse number"].max())
+
+        return int(highest)
+
+    def measurement_finished(self):
+        """ Whether all cycles of the measurement were completed.
+        """
+        return self.completed_cycle == (
+            self.number_of_repeats - 1, len(self.pulse_sequence) - 1)
 
-        # Arm the waveform
-        self.k6221.waveform_arm()
+    def save_checkpoint(self, force=False):
+        """ Store the last completed cycle in the checkpoint, at most once per
+        checkpoint interval (unless forced). The results are written before
+        the checkpoint, such that the checkpoint never runs ahead of them.
+        """
+        now = self.clock.time()
+        if not force and self.last_checkpoint is not None and \
+                now - self.last_checkpoint < self.AAL_checkpoint_interval:
+            return
 
-        pulse_timestamp = None
+        if self.results_batcher is not None:
+            self.results_batcher.flush()
+        if self.results_writer is not None:
+            self.results_writer.flush()
 
-        # Apply the pulses; each start triggers a single pulse
-        for i in range(self.pulse_burst_length):
-            sleep(self.pulse_delay)
-            self.k6221.waveform_start()
+        try:
+            self.checkpoint.save(**{
+                "results file": self.results_filename,
+                "cycle": self.completed_cycle,
+                "pulse number": self.last_pulse_number,
+                "pulse configuration": self.last_pulse_config,
+                "pulse sequence": self.pulse_sequence,
+                "probe sequence": self.probe_sequence,
+                "number of repeats": self.number_of_repeats,
+                "finished": self.measurement_finished(),
+            })
+        except (OSError, TypeError):
+            log.exception("Could not store the checkpoint")
 
-            # Get time stamp for the pulse
-            if pulse_timestamp is None:
-                pulse_timestamp = time()
+        self.last_checkpoint = now
 
-            sleep(self.pulse_length * 1e-3)
+    def open_raw_capture(self):
+        """ Open the raw capture of the demodulator samples, which is stored in
+        a folder next to the text results file (with the extension ".raw").
+        """
+        path = self.sidecar_filename(".raw")
 
-            # Break if aborted
-            if self.should_stop():
+        log.info(f"Writing raw demodulator samples to {path}")
+        self.raw_capture = RawCapture(path, parameters=self.parameter_values())
+
+    def find_results_filename(self):
+        """ The name of the text results file: that of the measurement that is
+        resumed, or a new (unique) file in the measurement folder.
+        """
+        if self.AAK_resume_results_file:
+            return str(Path(self.AAC_folder) / self.AAK_resume_results_file)
+
+        return unique_filename(
+            self.AAC_folder,
+            prefix=self.AAD_filename_base,
+            ext="txt",
+            datetimeformat="",
+        )
+
+    def sidecar_filename(self, extension):
+        """ The name of a file that belongs with the text results file: the
+        results filename with the given extension (e.g. ".columns"), or a new
+        filename in the data folder if the results filename is not known.
+        """
+        if self.results_filename is not None:
+            return Path(self.results_filename).with_suffix(extension)
+
+        return Path(unique_filename(
+            self.AAC_folder,
+            prefix=self.AAD_filename_base,
+            ext=extension.lstrip("."),
+            datetimeformat="",
+        ))
+
+    def wait(self, duration):
+        """ Wait for the given duration (s); the buffered results that would
+        exceed their maximum age during the wait are emitted first.
+        """
+        if self.results_batcher is not None:
+            self.results_batcher.expire(duration)
+
+        self.clock.sleep(duration)
+
+    def start_temperature_poller(self):
+        """ Start reading the temperature in the background, such that storing
+        the measurements does not have to wait for the temperature controller.
+        Not used for simulated measurements, as the background thread does not
+        follow the virtual clock.
+        """
+        if self.temperatureController is None or self.AAF_simulation or \
+                self.temperature_poll_interval <= 0:
+            return
+
+        self.temperature_poller = TemperaturePoller(
+            self.read_temperature, self.temperature_poll_interval, clock=self.clock)
+        self.temperature_poller.start()
+
+    def get_polled_temperature(self, timestamp):
+        """ Get the temperature from the background poller without waiting for
+        the temperature controller.
+
+        :param timestamp: the time (s) for which the temperature is requested
+        :return: the temperature (K) and the timestamp (s) of the reading; nan
+            if no reading within the maximum age is available.
+        """
+        if self.temperature_interpolate:
+            return self.temperature_poller.at(timestamp, self.temperature_max_age)
+        else:
+            return self.temperature_poller.latest(self.temperature_max_age)
+
+    def read_temperature(self):
+        """ Read the temperature from the temperature controller.
+
+        :return: the temperature (K), or nan if it could not be read.
+        """
+        if self.temperatureController is None:
+            return np.nan
+
+        import pyvisa
+
+        for i in range(2):
+            try:
+                temperature = self.temperatureController.temperature_1
+            except ValueError:
+                log.error(
+                    f"Could not get temperature due to ValueError. Attempt #{i + 1}."
+                )
+            except pyvisa.errors.VisaIOError:
+                self.temperatureController = None
                 break
+            else:
+                return temperature
+
+        return np.nan
+
+    def prepare_pulses(self):
+        """ Determine how the pulses of a burst are timed, and program and arm
+        the pulse source accordingly. The waveforms have no offset, such that
+        the output is at zero until the burst is triggered.
+
+        :return: the schedule of a hardware-timed burst (see
+            PulseSource.burst_schedule), or None for software-timed pulses
+        """
+        schedule = None
+        if self.pulse_hardware_timed and self.pulse_burst_length > 1:
+            schedule = PulseSource.burst_schedule(
+                self.pulse_length * 1e-3, self.pulse_delay, self.pulse_burst_length)
+
+            if schedule is None:
+                log.warning(f"Pulse length and delay cannot be represented as a single "
+                            f"waveform within {PulseSource.PERIOD_TOLERANCE:.1%} of the "
+                            f"period; using software-timed pulses.")
+
+        with self.timer.span("pulse source programming"):
+            if schedule is None:
+                # For defining single pulses, use a square wave with 100%
+                # duty-cycle for a single cycle; pulse-length is then defined
+                # by 1 / frequency. The waveform remains armed as long as
+                # these properties do not change
+                self.pulse_source.configure(
+                    waveform_function="square",
+                    waveform_amplitude=self.pulse_amplitude,
+                    waveform_offset=0,
+                    source_compliance=self.pulse_compliance,
+                    waveform_dutycycle=100,
+                    waveform_frequency=1e3 / self.pulse_length,
+                    waveform_ranging="best",
+                    waveform_duration_cycles=1,
+                )
+            else:
+                # A period of the arbitrary waveform is a pulse followed by
+                # zeros, which is output for a fractional number of cycles
+                # that ends right after the last pulse
+                period, high, points, cycles = schedule
+                self.pulse_source.configure(
+                    waveform_arbitrary=(high, points),
+                    waveform_amplitude=self.pulse_amplitude,
+                    waveform_offset=0,
+                    source_compliance=self.pulse_compliance,
+                    waveform_frequency=1 / period,
+                    waveform_ranging="best",
+                    waveform_duration_cycles=cycles,
+                )
+
+        return schedule
 
-        # Wait to ensure the pulse is over and the waveform can be aborted
-        sleep(15e-3)
+    def apply_pulses(self, schedule=None):
+        """ Apply the actual pulses with the prepared pulse source. This
+        function is responsible for communicating with the devices that are
+        required for the pulsing.
 
-        # Disarm the waveform
-        self.k6221.waveform_abort()
+        :param schedule: the schedule of a hardware-timed burst, or None for
+            software-timed pulses (as returned by prepare_pulses)
+        :return: a list with the timestamps of the applied pulses, the pulse
+            amplitude, the compliance, and whether the compliance was hit.
+        """
+        if schedule is None:
+            pulse_timestamps = self.apply_software_timed_burst()
+        else:
+            pulse_timestamps = self.apply_hardware_timed_burst(schedule[0], schedule[-1])
 
-        # Check whether the compliance was hit during the pulse
-        # This makes use of the status bit registers and specifically reads
-        # bit 3 (compliance) of the Measurement Event Register
-        event_bytes = self.k6221.measurement_events
-        pulse_hits_compliance = int(format(event_bytes, "08b")[-4])
+        # Wait to ensure the pulse is over
+        self.clock.sleep(15e-3)
 
-        return pulse_timestamp, self.pulse_amplitude,\
+        # Check whether the compliance was hit during the burst
+        with self.timer.span("pulse source query"):
+            pulse_hits_compliance = self.pulse_source.hits_compliance()
+
+        return pulse_timestamps, self.pulse_amplitude,\
             self.pulse_compliance, pulse_hits_compliance
 
-    def get_time_estimates(self):
-        estimates = dict()
+    def apply_software_timed_burst(self):
+        """ Apply the burst by starting a single pulse for every pulse in the
+        burst; the pulses are timed by the software.
+
+        :return: a list with the timestamps of the applied pulses
+        """
+        pulse_timestamps = list()
+
+        # Apply the pulses; each start triggers a single pulse
+        with self.timer.span("pulse burst"):
+            for i in range(self.pulse_burst_length):
+                self.clock.sleep(self.pulse_delay)
+                self.pulse_source.trigger()
+
+                # Get time stamp for the pulse
+                pulse_timestamps.append(self.clock.time())
+
+                self.clock.sleep(self.pulse_length * 1e-3)
+
+                # Break if aborted
+                if self.should_stop():
+                    break
+
+        return pulse_timestamps
+
+    def apply_hardware_timed_burst(self, period, cycles):
+        """ Apply the entire burst with a single trigger; the pulses are timed
+        by the pulse source. The waveform is aborted as soon as the burst has
+        ended (or the measurement is stopped).
+
+        :param period: the period (s) of the pulses
+        :param cycles: the (fractional) number of cycles of the burst
+        :return: a list with the timestamps of the applied pulses, as
+            reconstructed from the programmed schedule
+        """
+        with self.timer.span("pulse burst"):
+            self.pulse_source.trigger()
+            start = self.clock.time()
+
+            # Wait for the burst to finish
+            duration = cycles * period
+            end = start + duration
+            while self.clock.time() < end:
+                self.clock.sleep(min(end - self.clock.time(), 0.5))
+
+                # Abort the burst if requested
+                if self.should_stop():
+                    duration = self.clock.time() - start
+                    break
+
+            self.pulse_source.disarm()
+
+        return [start + i * period for i in range(self.pulse_burst_length)
+                if i * period < duration]
+
+    def timing_mode(self):
+        """ The settings that change the duration of the phases beyond the
+        modelled waits; timings are only compared between equal modes.
+        """
+        return "streaming=%s, pipelined=%s, adaptive=%s, settling=%s" % (
+            self.probe_streaming or self.probe_raw_capture, self.probe_pipelined, self.probe_adaptive,
+            self.probe_settling_detection)
+
+    def settling_delays(self, time_constant):
+        """ The 90.0% and 99.9% settling times (s) of the lock-in filter.
+        """
+        delay_90 = time_constant * (1.93 * self.filter_order**0.85 + 0.38)
+        delay_99 = time_constant * (2.74 * self.filter_order**0.79 + 1.89)
+        return delay_90, delay_99
+
+    def modelled_pulsing_duration(self):
+        """ The duration (s) of applying a burst, including the probe delay,
+        from the mandated waits only.
+        """
+        return self.pulse_burst_length * (self.pulse_delay + self.pulse_length * 1e-3) + \
+            15e-3 + self.probe_delay
+
+    def modelled_probing_duration(self, probe):
+        """ The duration (s) of a single probe from the mandated waits only.
+
+        :param probe: the dictionary with the probe parameters
+        """
+        delay_90, delay_99 = self.settling_delays(probe["time constant"])
+        return 3 + probe["duration"] + delay_99 + 2 * delay_90
 
-        filter_order = 3
-        delay_90 = self.probe_time_constant * (1.93 * filter_order**0.85 + 0.38)
-        delay_99 = self.probe_time_constant * (2.74 * filter_order**0.79 + 1.89)
-        d_probing = 3 + self.probe_duration + delay_99 + 2 * delay_90
-        d_pulsing = self.pulse_burst_length * (self.pulse_delay + self.pulse_length * 1e-3) + 15e-3 + self.probe_delay
+    def record_phase(self, phase, measured, modelled):
+        """ Add the duration of a phase to the phase timings.
 
-        cycles = self.number_of_repeats * self.pulse_number_of_bursts
+        :param phase: the name of the phase ("pulsing" or "probing")
+        :param measured: the measured duration (s)
+        :param modelled: the modelled duration (s)
+        """
+        if self.phase_timings is None:
+            self.phase_timings = dict()
+
+        timing = self.phase_timings.setdefault(
+            phase, {"count": 0, "measured": 0., "modelled": 0.})
+        timing["count"] += 1
+        timing["measured"] += measured
+        timing["modelled"] += modelled
+
+    def estimate_duration(self, timing_model=None):
+        """ Estimate the duration of the measurement from the planned pulse
+        sequence and probes (plan_measurement should be called first) and the
+        overhead per phase learned from earlier measurements.
+
+        :param timing_model: the TimingModel with the timings of earlier
+            measurements; None to use the modelled waits only
+        :return: the number of cycles and the duration (s)
+        """
+        mode = self.timing_mode()
+        overhead_pulsing = overhead_probing = 0.
+        if timing_model is not None:
+            overhead_pulsing = timing_model.overhead("pulsing", mode)
+            overhead_probing = timing_model.overhead("probing", mode)
+
+        d_pulsing = self.modelled_pulsing_duration() + overhead_pulsing
+        d_probing = sum(self.modelled_probing_duration(self.probes[probe]) + overhead_probing
+                        for probes in self.probe_sequence for probe in probes)
+
+        cycles = self.number_of_repeats * len(self.pulse_sequence)
+        return cycles, cycles * d_pulsing + self.number_of_repeats * d_probing
 
-        n = self.max_number_of_probes
-        duration_1p = np.ceil(cycles * (d_pulsing + d_probing * 1))
-        duration_np = np.ceil(cycles * (d_pulsing + d_probing * n))
+    def get_time_estimates(self, timing_model=None):
+        """ Estimate the duration and the end of the measurement.
 
-        estimates['Duration for 1 probe'] = "%s (%d s)" % (str(timedelta(seconds=duration_1p)), duration_1p)
-        estimates['Duration for %d probes' % n] = "%s (%d s)" % (str(timedelta(seconds=duration_np)), duration_np)
+        :param timing_model: the TimingModel with the timings of earlier
+            measurements; None to use the modelled waits only
+        :return: a dictionary with the estimates as text
+        """
+        self.plan_measurement()
+        cycles, duration = self.estimate_duration(timing_model)
+        duration = np.ceil(duration)
 
-        estimates['1 probe finished at'] = str(datetime.now() + timedelta(seconds=duration_1p))[:-7]
-        estimates['%d probe finished at' % n] = str(datetime.now() + timedelta(seconds=duration_np))[:-7]
+        estimates = dict()
+        estimates['Number of cycles'] = "%d" % cycles
+        estimates['Duration'] = "%s (%d s)" % (str(timedelta(seconds=duration)), duration)
+        estimates['Finished at'] = str(datetime.now() + timedelta(seconds=duration))[:-7]
 
         return estimates
 
@@ -767,77 +1975,43 @@ r"""
 """
 
 
-class MainWindow(ManagedWindow):
-    def __init__(self):
-        super(MainWindow, self).__init__(
-            procedure_class=MeasurementProcedure,
-            inputs=(
-                "AAC_folder",
-                "AAD_filename_base",
-                "AAE_yaml_config_file",
-                "number_of_repeats",
-                "pulse_amplitude",
-                "pulse_compliance",
-                "pulse_length",
-                "pulse_burst_length",
-                "pulse_delay",
-                "pulse_number_of_bursts",
-                "probe_delay",
-                "probe_amplitude",
-                "probe_frequency",
-                "probe_time_constant",
-                "probe_duration",
-                "probe_series_resistance",
-                "probe_current",
-                "temperature_control",
-                "temperature_sp",
-                "field_control",
-                "field_mT",
-            ),
-            x_axis="Pulse number",
-            y_axis="Probe 1 x (V)",
-            displays=(
-                "pulse_amplitude",
-                "pulse_compliance",
-                "pulse_length",
-                "pulse_burst_length",
-                "temperature_sp",
-                "field_mT",
-            ),
-            sequencer=True,
-            inputs_in_scrollarea=True,
-        )
+def log_to_file(filename=None):
+    """ Append the log messages (of all loggers) to a file.
 
-        self.estimator = TimeEstimator(self)
+    :param filename: the log file; by default "electrical_switching.log" in the
+        software folder (independent of the working directory)
+    """
+    if filename is None:
+        filename = Path(__file__).resolve().parent / "electrical_switching.log"
 
-    def queue(self, *args, procedure=None):
-        if procedure is None:
-            procedure = self.make_procedure()
+    file_handler = logging.FileHandler(filename, "a")
+    file_handler.setFormatter(logging.Formatter(
+        fmt="%(asctime)s : %(message)s (%(levelname)s)",
+        datefmt="%m/%d/%Y %I:%M:%S %p"
+    ))
+    logging.getLogger("").addHandler(file_handler)
 
-        folder = procedure.AAC_folder
-        filename = procedure.AAD_filename_base
 
-        filename = unique_filename(
-            folder,
-            prefix=filename,
-            ext="txt",
-            datetimeformat="",
-        )
+def main():
+    """ Start the graphical interface for the measurements.
+    """
+    from pymeasure.display.Qt import QtGui
+    from addons import MainWindow
 
-        results = Results(procedure, filename)
+    log_to_file()
 
-        # manual define a curve to deal with nan values
-        curve = self.new_curve(results, connect="finite")
-        curve.setSymbol("o")
-        curve.setSymbolPen(curve.pen)
+    # Register as separate software
+    if sys.platform == "win32":
+        import ctypes
 
-        experiment = self.new_experiment(results, curve)
+        myappid = "fna.MeasurementSoftware.ElectricalSwitching"
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
 
-        self.manager.queue(experiment)
+    app = QtGui.QApplication(sys.argv)
+    window = MainWindow(MeasurementProcedure)
+    window.show()
+    return app.exec_()
 
 
 if __name__ == "__main__":
-    app = QtGui.QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
-    sys.exit(app.exec_())
+    sys.exit(main())
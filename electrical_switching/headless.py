@@ -0,0 +1,250 @@
+r"""
+Headless runner for switching measurements, without the graphical interface.
+
+The parameters of the measurements are read from parameter files and/or given
+on the command line; parameters that are not given keep their defaults. A
+parameter file (YAML) contains the parameters of a single measurement, or a
+list with the parameters of several measurements. The parameters are given by
+their attribute (e.g. "pulse_amplitude") or by their name as in the results
+files (e.g. "Pulse amplitude"); values with units are given as in the results
+files (e.g. "300 K"). The parameters on the command line apply to all
+measurements.
+
+The measurements are run one after the other (ordered by the sequence
+planner, like the sequences of the GUI), and the results are written to the
+measurement folder in the same way as the GUI does. Like the queue of the GUI,
+the remaining measurements are not run after a measurement failed (e.g. as an
+instrument could not be connected), unless requested:
+
+    python headless.py overnight.yml
+    python headless.py 10K.yml 20K.yml --set number_of_repeats=10
+    python headless.py --set AAF_simulation=true --set "Temperature set-point=20 K"
+    python headless.py overnight.yml --plan
+    python headless.py overnight.yml --keep-going --log-file overnight.log
+"""
+
+import logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from queue import Empty
+from time import perf_counter
+
+import yaml
+from pymeasure.experiment import Procedure, Worker
+
+from electrical_switching import MeasurementProcedure, log_to_file
+from addons import BatchResults, SequencePlanner, TimingModel
+
+
+def read_parameter_file(path):
+    """ Read the parameters of the measurements in a parameter file.
+
+    :param path: the YAML parameter file
+    :return: a list with a dictionary of parameters for every measurement
+    """
+    with open(path, "r") as file:
+        parameters = yaml.safe_load(file) or dict()
+
+    if isinstance(parameters, dict):
+        parameters = [parameters]
+    if not isinstance(parameters, list) or not all(isinstance(p, dict) for p in parameters):
+        raise ValueError(f"{path} should contain the parameters of a measurement, or a "
+                         f"list with the parameters of several measurements")
+
+    return parameters
+
+
+def parse_assignments(assignments):
+    """ Convert "name=value" assignments to a dictionary of parameters; the
+    values are converted by the parameters themselves.
+    """
+    parameters = dict()
+    for assignment in assignments:
+        name, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid parameter assignment {assignment!r}, use name=value")
+        parameters[name.strip()] = value.strip()
+
+    return parameters
+
+
+def make_procedure(parameters):
+    """ Create a procedure with the given parameters.
+
+    :param parameters: dictionary with the parameters, by attribute or name
+    :return: the MeasurementProcedure
+    """
+    procedure = MeasurementProcedure()
+
+    attributes = {parameter.name: attribute
+                  for attribute, parameter in procedure.parameter_objects().items()}
+    procedure.set_parameters({attributes.get(name, name): value
+                              for name, value in parameters.items()})
+
+    return procedure
+
+
+def plan(procedures):
+    """ Print the planned cycles, reconfigurations, and duration (from the
+    timings of earlier measurements) of the measurements.
+    """
+    finished = datetime.now()
+    for i, procedure in enumerate(procedures, 1):
+        procedure.plan_measurement()
+        model = TimingModel(Path(procedure.AAC_folder) / procedure.timing_history_file)
+        cycles, duration = procedure.estimate_duration(model)
+        report = procedure.sequence_report
+        finished += timedelta(seconds=round(duration))
+
+        print(f"Measurement {i} of {len(procedures)}:")
+        print(f"  {cycles} cycles, {report['relay switches']} relay switches, "
+              f"{report['lock-in changes']} lock-in reconfigurations")
+        print(f"  Duration {timedelta(seconds=round(duration))}, "
+              f"finished at {finished:%Y-%m-%d %X}")
+
+
+def run(procedure, progress_interval=10.):
+    """ Run a measurement in a worker (in the same way as the GUI does) and
+    report its progress on the console.
+
+    :param procedure: the MeasurementProcedure
+    :param progress_interval: the minimum interval (s) between progress reports
+    :return: the status of the procedure
+    """
+    filename = procedure.find_results_filename()
+    if procedure.AAK_resume_results_file and not Path(filename).is_file():
+        log.error(f"Cannot resume {filename}: the file does not exist")
+        return Procedure.FAILED
+
+    procedure.results_filename = filename
+    results = BatchResults(procedure, filename)
+    print(f"Measuring to {filename}", flush=True)
+
+    worker = Worker(results, log_level=logging.getLogger("").level)
+    worker.start()
+
+    start = perf_counter()
+    last_report = None
+    last_progress = None
+    try:
+        while worker.is_alive() or not worker.monitor_queue.empty():
+            try:
+                message = worker.monitor_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if message is None:
+                continue
+
+            topic, record = message
+            if topic == "status":
+                print(f"  {Procedure.STATUS_STRINGS[record]}", flush=True)
+            elif topic == "progress":
+                now = perf_counter()
+                if record == last_progress or last_report is not None and \
+                        now - last_report < progress_interval and record < 100:
+                    continue
+                last_report = now
+                last_progress = record
+
+                elapsed = now - start
+                text = f"  {record:5.1f}% after {timedelta(seconds=round(elapsed))}"
+                if 0 < record < 100:
+                    remaining = elapsed * (100 - record) / record
+                    text += f", finished at {datetime.now() + timedelta(seconds=remaining):%X}"
+                print(text, flush=True)
+    except KeyboardInterrupt:
+        print("  Stopping the measurement", flush=True)
+        worker.stop()
+
+        # Let the procedure bring the instruments into a safe state
+        while worker.is_alive():
+            worker.join(0.1)
+        raise
+
+    return procedure.status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("files", type=Path, nargs="*",
+                        help="parameter files (YAML), run one after the other")
+    parser.add_argument("--set", dest="assignments", action="append", default=[],
+                        metavar="NAME=VALUE",
+                        help="set a parameter of all measurements (can be repeated)")
+    parser.add_argument("--plan", action="store_true",
+                        help="only check the measurements and estimate their duration")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="run the remaining measurements after a measurement failed")
+    parser.add_argument("--progress-interval", type=float, default=10.,
+                        help="minimum interval (s) between progress reports")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="level of the log messages on the console")
+    parser.add_argument("--log-file", type=Path, default=None,
+                        help="file to append the log messages to (default: "
+                             "electrical_switching.log in the software folder)")
+    args = parser.parse_args(argv)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        fmt="%(asctime)s : %(message)s (%(levelname)s)", datefmt="%X"))
+    logging.getLogger("").addHandler(console_handler)
+    logging.getLogger("").setLevel(args.log_level)
+    log_to_file(args.log_file)
+
+    # Create and check all measurements before the first one is started
+    try:
+        assignments = parse_assignments(args.assignments)
+        parameters = [dict()] if len(args.files) == 0 else \
+            [p for file in args.files for p in read_parameter_file(file)]
+
+        procedures = list()
+        for measurement in parameters:
+            # The config file and the sequence are checked on a separate
+            # procedure, as planning changes the pulses and probes
+            make_procedure({**measurement, **assignments}).plan_measurement()
+            procedures.append(make_procedure({**measurement, **assignments}))
+    except (OSError, ValueError, NameError, yaml.YAMLError) as error:
+        log.error(f"Invalid measurement: {error}")
+        return 2
+
+    if len(procedures) > 1:
+        planner = SequencePlanner(
+            reorder=all(procedure.sequence_reorder for procedure in procedures),
+            handover=all(procedure.field_handover for procedure in procedures),
+        )
+        procedures = planner.plan(procedures)
+
+    if args.plan:
+        plan(procedures)
+        return 0
+
+    failed = 0
+    try:
+        for i, procedure in enumerate(procedures, 1):
+            print(f"Measurement {i} of {len(procedures)}", flush=True)
+            status = run(procedure, args.progress_interval)
+            if status != Procedure.FINISHED:
+                failed += 1
+                if not args.keep_going and i < len(procedures):
+                    log.error(f"Measurement {i} did not finish; skipping the remaining "
+                              f"{len(procedures) - i} measurements")
+                    break
+    except KeyboardInterrupt:
+        log.warning("Measurements stopped by the user")
+        return 1
+    finally:
+        # Ramp down a magnetic field that was handed over to a measurement
+        # that did not run (e.g. as its startup failed)
+        MeasurementProcedure.close_connections()
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The measurement script and the add-ons are imported as top-level modules,
+# as when the script is run from its folder
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from addons import VirtualClock, Simulation
+
+
+ROWS = {
+    "pulse high": 5,
+    "pulse low": 6,
+    "lock-in input A": 1,
+    "lock-in input B": 2,
+    "lock-in output A": 3,
+    "lock-in output B": 4,
+}
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(start=1000.)
+
+
+@pytest.fixture
+def simulation(clock):
+    return Simulation(clock, rows=ROWS, seed=0)
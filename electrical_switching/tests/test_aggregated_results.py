@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from addons import ColumnarAggregator, ColumnarWriter, ResultsAggregator
+from electrical_switching import MeasurementProcedure
+from test_analysis import results_rows, write_text
+
+X, Y = "Pulse number", "Probe 1 Rx (Ohm)"
+
+
+def expected(rows):
+    groups = dict()
+    for row in rows:
+        if not np.isnan(row.get(Y, np.nan)):
+            groups.setdefault(row["Pulse number"], list()).append(row[Y])
+    return [np.mean(values) for values in groups.values()]
+
+
+def test_binary_results_are_aggregated_like_text_results(tmp_path):
+    rows = results_rows()
+    write_text(tmp_path / "run.txt", rows)
+
+    writer = ColumnarWriter(tmp_path / "run.columns", MeasurementProcedure.DATA_COLUMNS,
+                            MeasurementProcedure.COLUMN_TYPES, buffer_size=7)
+    aggregator = ColumnarAggregator(tmp_path / "run.columns")
+
+    # Only the written chunks are shown; the buffered rows follow later
+    writer.extend(rows[:20])
+    _, y, _ = aggregator.update(X, Y)
+    assert len(y) > 0 and y == pytest.approx(expected(rows[:14]))
+
+    writer.extend(rows[20:])
+    writer.close()
+    x, y, error = aggregator.update(X, Y)
+    text = ResultsAggregator(str(tmp_path / "run.txt")).update(X, Y)
+
+    assert y == pytest.approx(expected(rows))
+    for binary, text in zip((x, y, error), text):
+        assert binary == pytest.approx(text)
+
+    raw_x, raw_y = aggregator.read_raw(X, Y)
+    assert len(raw_x) == len(rows)
+
+
+def test_binary_results_that_are_not_written_yet(tmp_path):
+    aggregator = ColumnarAggregator(tmp_path / "run.columns")
+
+    assert all(len(values) == 0 for values in aggregator.update(X, Y))
+    assert all(len(values) == 0 for values in aggregator.read_raw(X, Y))
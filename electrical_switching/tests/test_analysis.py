@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+from addons import ColumnarWriter
+from electrical_switching import MeasurementProcedure
+
+
+def results_rows(number_of_pulses=6, samples=(3, 5), seed=0):
+    """ Rows of a measurement with alternating pulse configurations, each
+    pulse followed by the samples of two probes.
+    """
+    rng = np.random.default_rng(seed)
+    rows = list()
+    for pulse_number in range(1, number_of_pulses + 1):
+        configuration = str(1 + (pulse_number - 1) % 2)
+        base = {"Pulse number": pulse_number, "Pulse configuration": configuration}
+        rows.append({**base, "Timestamp (s)": 10. * pulse_number, "Pulse amplitude (A)": 0.02,
+                     "Temperature (K)": 300. + pulse_number})
+
+        for probe, number in zip((1, 2), samples):
+            for i in range(number):
+                rows.append({
+                    **base,
+                    "Timestamp (s)": 10. * pulse_number + probe + i / 10,
+                    "Temperature (K)": 300. + pulse_number + i / 100,
+                    "Probe configuration": probe,
+                    "Probe %d Rx (Ohm)" % probe:
+                        probe * 10 + (configuration == "2") + rng.normal(0, 0.1),
+                    "Probe %d Ry (Ohm)" % probe: rng.normal(0, 0.1),
+                })
+    return rows
+
+
+def write_text(path, rows):
+    table = pd.DataFrame(rows, columns=MeasurementProcedure.DATA_COLUMNS)
+    with open(path, "w") as file:
+        file.write("#Parameters:\n#\tPulse amplitude: 0.02 A\n#Data:\n")
+        table.to_csv(file, index=False)
+
+
+def groupby_table(rows):
+    """ The statistics per pulse and probe, determined directly with pandas.
+    """
+    table = pd.DataFrame(rows).dropna(subset=["Probe configuration"])
+    table["Rx"] = np.where(table["Probe configuration"] == 1,
+                           table["Probe 1 Rx (Ohm)"], table["Probe 2 Rx (Ohm)"])
+    table["Ry"] = np.where(table["Probe configuration"] == 1,
+                           table["Probe 1 Ry (Ohm)"], table["Probe 2 Ry (Ohm)"])
+
+    groups = table.groupby(["Pulse number", "Probe configuration"])
+    return pd.DataFrame({
+        "Temperature (K)": groups["Temperature (K)"].mean(),
+        "Samples": groups["Rx"].count(),
+        "Rx (Ohm)": groups["Rx"].mean(),
+        "Rx error (Ohm)": groups["Rx"].sem(),
+        "Ry (Ohm)": groups["Ry"].mean(),
+        "Ry error (Ohm)": groups["Ry"].sem(),
+    }).reset_index()
+
+
+def assert_matches_groupby(table, rows):
+    expected = groupby_table(rows)
+
+    assert len(table) == len(expected)
+    np.testing.assert_array_equal(table["Pulse number"], expected["Pulse number"])
+    np.testing.assert_array_equal(table["Probe configuration"], expected["Probe configuration"])
+    for column in ["Temperature (K)", "Samples", "Rx (Ohm)", "Rx error (Ohm)",
+                   "Ry (Ohm)", "Ry error (Ohm)"]:
+        np.testing.assert_allclose(table[column], expected[column], rtol=1e-10)
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 100000])
+def test_chunked_text_results_match_a_plain_groupby(tmp_path, chunksize):
+    rows = results_rows()
+    write_text(tmp_path / "run.txt", rows)
+
+    tables = analysis.analyse(tmp_path / "run.txt", chunksize=chunksize)
+
+    assert_matches_groupby(tables["probes"], rows)
+
+
+def test_binary_results_match_a_plain_groupby(tmp_path):
+    rows = results_rows(number_of_pulses=5)
+    writer = ColumnarWriter(tmp_path / "run.columns", MeasurementProcedure.DATA_COLUMNS,
+                            MeasurementProcedure.COLUMN_TYPES, buffer_size=4)
+    writer.extend(rows)
+    writer.close()
+
+    tables = analysis.analyse(tmp_path / "run.columns")
+
+    assert_matches_groupby(tables["probes"], rows)
+
+
+def test_switching_amplitude(tmp_path):
+    rows = results_rows(number_of_pulses=40)
+    write_text(tmp_path / "run.txt", rows)
+
+    switching = analysis.analyse(tmp_path / "run.txt", chunksize=50)["switching"]
+
+    assert list(switching["Probe configuration"]) == [1, 2]
+    assert list(switching["Pulses"]) == [20, 20]
+    np.testing.assert_allclose(switching["dRx (Ohm)"], 1, atol=0.1)
+    np.testing.assert_allclose(switching["dRy (Ohm)"], 0, atol=0.1)
+
+
+def test_not_a_results_file(tmp_path):
+    pd.DataFrame({"a": [1]}).to_csv(tmp_path / "other.txt", index=False)
+
+    with pytest.raises(ValueError, match="is not a results file"):
+        analysis.analyse(tmp_path / "other.txt")
@@ -0,0 +1,116 @@
+import numpy as np
+
+from addons import CachedDAQ
+
+
+class FakeDAQ(object):
+    """ Data server session with nodes that can also be changed "on the
+    device" (e.g. from the front panel).
+    """
+
+    def __init__(self, **nodes):
+        self.nodes = {"/dev1/" + path.replace("__", "/"): value for path, value in nodes.items()}
+        self.sets = list()
+        self.gets = list()
+        self.subscribed = set()
+        self.changes = dict()
+
+    def set(self, settings):
+        self.sets.append(list(settings))
+        for path, value in settings:
+            self.nodes[path] = value
+            if path.endswith("/autorange") and value:
+                self.nodes[path.replace("autorange", "range")] = 0.3
+
+    def get(self, paths, flat=True):
+        self.gets.append(paths)
+        return {path: {"value": np.array([self.nodes[path]])} for path in paths.split(",")}
+
+    def subscribe(self, paths):
+        self.subscribed.update(paths)
+
+    def poll(self, *args):
+        changes, self.changes = self.changes, dict()
+        return changes
+
+    def sync(self):
+        return "synced"
+
+    def change_on_device(self, path, value):
+        self.nodes[path] = value
+        self.changes[path] = {"value": np.array([value])}
+
+
+def test_unchanged_settings_are_not_sent():
+    daq = FakeDAQ()
+    lockin = CachedDAQ(daq)
+
+    lockin.set([("/dev1/oscs/0/freq", 79.), ("/dev1/sigouts/0/range", 20)])
+    lockin.set([("/dev1/oscs/0/freq", 79.), ("/dev1/sigouts/0/range", 10)])
+
+    assert daq.sets == [
+        [("/dev1/oscs/0/freq", 79.), ("/dev1/sigouts/0/range", 20)],
+        [("/dev1/sigouts/0/range", 10)],
+    ]
+    assert (lockin.number_sent, lockin.number_skipped) == (3, 1)
+
+
+def test_written_values_are_read_back_once():
+    daq = FakeDAQ()
+    lockin = CachedDAQ(daq)
+
+    # The device coerces the time constant
+    lockin.setDouble("/dev1/demods/0/timeconstant", 0.1)
+    daq.nodes["/dev1/demods/0/timeconstant"] = 0.1024
+
+    assert lockin.getDouble("/dev1/demods/0/timeconstant") == 0.1024
+    assert lockin.getDouble("/dev1/demods/0/timeconstant") == 0.1024
+    assert daq.gets == ["/dev1/demods/0/timeconstant"]
+
+    # Writing the node again invalidates the confirmed value
+    lockin.setDouble("/dev1/demods/0/timeconstant", 0.2)
+    assert lockin.getDouble("/dev1/demods/0/timeconstant") == 0.2
+    assert len(daq.gets) == 2
+
+
+def test_trigger_node_invalidates_the_affected_nodes():
+    daq = FakeDAQ(sigins__0__range=3.)
+    lockin = CachedDAQ(daq)
+    assert lockin.getDouble("/dev1/sigins/0/range") == 3.
+
+    lockin.setInt("/dev1/sigins/0/autorange", 1)
+    lockin.setInt("/dev1/sigins/0/autorange", 1)
+
+    # The trigger is sent every time and the range is read again
+    assert daq.sets == [[("/dev1/sigins/0/autorange", 1)]] * 2
+    assert lockin.getDouble("/dev1/sigins/0/range") == 0.3
+    assert lockin.getInt("/dev1/sigins/0/autorange") == 1
+    assert lockin.getInt("/dev1/sigins/0/autorange") == 1
+    assert daq.gets.count("/dev1/sigins/0/autorange") == 2
+
+
+def test_changes_on_the_device_invalidate_the_cache():
+    daq = FakeDAQ()
+    lockin = CachedDAQ(daq)
+    lockin.setDouble("/dev1/oscs/0/freq", 79.)
+    assert lockin.getDouble("/dev1/oscs/0/freq") == 79.
+    assert "/dev1/oscs/0/freq" in daq.subscribed
+
+    daq.change_on_device("/dev1/oscs/0/freq", 100.)
+    lockin.check_for_changes()
+
+    assert lockin.getDouble("/dev1/oscs/0/freq") == 100.
+    lockin.setDouble("/dev1/oscs/0/freq", 79.)
+    assert daq.sets[-1] == [("/dev1/oscs/0/freq", 79.)]
+
+
+def test_invalidate_all_and_pass_through():
+    daq = FakeDAQ()
+    lockin = CachedDAQ(daq)
+    lockin.setInt("/dev1/sigouts/0/on", 1)
+
+    lockin.invalidate()
+    lockin.setInt("/dev1/sigouts/0/on", 1)
+
+    assert len(daq.sets) == 2
+    assert lockin.sync() == "synced"
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pymeasure.experiment import Results
+
+from addons import BatchResults, Checkpoint
+from electrical_switching import MeasurementProcedure
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yml"
+
+
+class Crash(Exception):
+    pass
+
+
+def run(folder, resume=False, crash_after=None, checkpoint_interval=60.):
+    """ Run a short simulated measurement that writes its results like the
+    worker does; a crash is simulated by raising from should_stop without
+    shutting down.
+    """
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(folder),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAF_simulation": True,
+        "AAL_checkpoint_interval": checkpoint_interval,
+        "AAK_resume_results_file": "run.txt" if resume else "",
+        "number_of_repeats": 3,
+        "pulse_number_of_bursts": 2,
+        "probe_delay": 0.1,
+        "probe_duration": 0.5,
+        "probe_time_constant": 0.01,
+    })
+
+    filename = str(Path(folder) / "run.txt")
+    if not resume:
+        procedure.results_filename = filename
+    results = BatchResults(procedure, filename)
+
+    def emit(topic, record):
+        if topic == "results":
+            with open(filename, "a") as file:
+                file.write(results.formatter.format(record) + Results.LINE_BREAK)
+
+    calls = [0]
+
+    def should_stop():
+        calls[0] += 1
+        if crash_after is not None and calls[0] > crash_after:
+            raise Crash()
+        return False
+
+    procedure.emit = emit
+    procedure.should_stop = should_stop
+
+    procedure.startup()
+    if crash_after is not None:
+        with pytest.raises(Crash):
+            procedure.execute()
+    else:
+        procedure.execute()
+        procedure.shutdown()
+
+    return procedure
+
+
+def pulse_numbers(folder):
+    """ The pulse numbers of the pulse rows in the results file.
+    """
+    data = pd.read_csv(Path(folder) / "run.txt", comment="#")
+    return list(data.loc[data["Pulse amplitude (A)"].notna(), "Pulse number"])
+
+
+def test_resume_after_a_crash_keeps_the_pulse_numbers_unique(tmp_path):
+    run(tmp_path, crash_after=150)
+    state = Checkpoint(tmp_path / "run.checkpoint.json").load()
+
+    # The crash happened some cycles after the last checkpoint
+    stored = max(pulse_numbers(tmp_path))
+    assert state["pulse number"] < stored - 1
+
+    resumed = run(tmp_path, resume=True)
+
+    assert resumed.resume_cycle == tuple(state["cycle"])
+    assert pulse_numbers(tmp_path) == list(range(1, resumed.last_pulse_number + 1))
+
+    # The cycles after the checkpoint are measured again
+    cycles = resumed.number_of_repeats * len(resumed.pulse_sequence)
+    assert resumed.last_pulse_number == cycles + stored - state["pulse number"]
+    assert Checkpoint(tmp_path / "run.checkpoint.json").load()["finished"]
+
+
+def test_resume_from_an_up_to_date_checkpoint(tmp_path):
+    run(tmp_path, crash_after=150, checkpoint_interval=0.)
+    state = Checkpoint(tmp_path / "run.checkpoint.json").load()
+
+    # At most the interrupted cycle is stored after the checkpoint
+    stored = max(pulse_numbers(tmp_path))
+    assert state["pulse number"] <= stored <= state["pulse number"] + 1
+
+    resumed = run(tmp_path, resume=True)
+
+    cycles = resumed.number_of_repeats * len(resumed.pulse_sequence)
+    assert resumed.last_pulse_number == cycles + stored - state["pulse number"]
+    assert pulse_numbers(tmp_path) == list(range(1, resumed.last_pulse_number + 1))
+
+
+def test_resume_rejects_another_sequence(tmp_path):
+    run(tmp_path, crash_after=150, checkpoint_interval=0.)
+
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(tmp_path),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAK_resume_results_file": "run.txt",
+        "pulse_number_of_bursts": 3,
+    })
+    procedure.plan_measurement()
+
+    with pytest.raises(ValueError, match="sequence differs"):
+        procedure.resume_measurement()
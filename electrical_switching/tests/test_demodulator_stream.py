@@ -0,0 +1,87 @@
+import numpy as np
+
+from addons import DemodulatorStream
+
+
+class FakeDAQ(object):
+    """ Data server session that returns prepared blocks of samples.
+    """
+
+    clockbase = 1000.
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        self.subscribed = list()
+
+    def getInt(self, path):
+        assert path.endswith("/clockbase")
+        return self.clockbase
+
+    def subscribe(self, paths):
+        self.subscribed.extend(paths)
+
+    def unsubscribe(self, paths):
+        for path in paths:
+            self.subscribed.remove(path)
+
+    def sync(self):
+        pass
+
+    def poll(self, recording_time, timeout, flags=0, flat=False):
+        return self.blocks.pop(0) if len(self.blocks) > 0 else dict()
+
+
+def samples(ticks, x):
+    return {"timestamp": np.asarray(ticks), "x": np.asarray(x, dtype=float),
+            "y": -np.asarray(x, dtype=float)}
+
+
+def test_read_anchors_the_device_clock_to_the_host_clock(clock):
+    daq = FakeDAQ([
+        {"/dev1/demods/0/sample": samples([1000, 2000, 3000], [1, 2, 3])},
+        {"/dev1/demods/0/sample": samples([4000, 5000], [4, 5])},
+    ])
+    stream = DemodulatorStream(daq, "dev1", demods=(0, 1), clock=clock)
+    stream.subscribe()
+    assert daq.subscribed == ["/dev1/demods/0/sample", "/dev1/demods/1/sample"]
+
+    first = stream.read()
+    np.testing.assert_allclose(first[0]["timestamp"], clock.time() + np.array([-2, -1, 0]))
+    np.testing.assert_array_equal(first[0]["y"], [-1, -2, -3])
+    assert len(first[1]["timestamp"]) == 0
+
+    # The offset is kept, such that later blocks continue the device time
+    clock.advance(10)
+    second = stream.read()
+    np.testing.assert_allclose(second[0]["timestamp"], first[0]["timestamp"][-1] + [1, 2])
+
+    stream.unsubscribe()
+    assert daq.subscribed == []
+
+
+def test_aligned_matches_the_nearest_sample_within_half_an_interval():
+    block = {
+        0: {"timestamp": np.array([0., 1., 2., 3.]), "x": np.zeros(4), "y": np.zeros(4)},
+        1: {"timestamp": np.array([0.1, 1.6, 3.05]), "x": np.array([10., 11., 12.]),
+            "y": np.array([20., 21., 22.])},
+        2: {"timestamp": np.empty(0), "x": np.empty(0), "y": np.empty(0)},
+    }
+
+    aligned = DemodulatorStream.aligned(block, 0)
+
+    assert aligned[0] is block[0]
+    np.testing.assert_array_equal(aligned[1]["timestamp"], block[0]["timestamp"])
+    np.testing.assert_array_equal(aligned[1]["x"], [10., np.nan, 11., 12.])
+    np.testing.assert_array_equal(aligned[1]["y"], [20., np.nan, 21., 22.])
+    assert np.all(np.isnan(aligned[2]["x"])) and len(aligned[2]["x"]) == 4
+
+
+def test_aligned_with_a_single_reference_sample_takes_the_nearest():
+    block = {
+        0: {"timestamp": np.array([5.]), "x": np.zeros(1), "y": np.zeros(1)},
+        1: {"timestamp": np.array([1., 4.]), "x": np.array([1., 2.]), "y": np.array([3., 4.])},
+    }
+
+    aligned = DemodulatorStream.aligned(block, 0)
+
+    np.testing.assert_array_equal(aligned[1]["x"], [2.])
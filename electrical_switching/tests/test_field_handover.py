@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+
+from addons import SequencePlanner
+from electrical_switching import MeasurementProcedure
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yml"
+
+
+@pytest.fixture(autouse=True)
+def no_handed_over_field():
+    MeasurementProcedure.field_handed_over = None
+    yield
+    MeasurementProcedure.field_handed_over = None
+
+
+def procedure(folder, **parameters):
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(folder),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAF_simulation": True,
+        "AAG_results_format": "binary",
+        "number_of_repeats": 1,
+        "pulse_number_of_bursts": 1,
+        "probe_duration": 0.5,
+        "field_control": True,
+        "field_mT": 100.,
+        **parameters,
+    })
+    procedure.results_filename = str(Path(folder) / "run.txt")
+    procedure.emit = lambda topic, record: None
+    procedure.should_stop = lambda: False
+    return procedure
+
+
+def run(procedure):
+    procedure.startup()
+    try:
+        procedure.execute()
+    finally:
+        procedure.shutdown()
+
+
+def test_handover_is_opt_in(tmp_path):
+    defaults = procedure(tmp_path)
+    assert not defaults.field_handover
+    assert not defaults.sequence_reorder
+
+    first, _ = SequencePlanner(reorder=defaults.sequence_reorder,
+                               handover=defaults.field_handover).plan(
+        [procedure(tmp_path), procedure(tmp_path)])
+    run(first)
+
+    assert not first.field_to_next
+    assert first.source.current == 0
+    assert MeasurementProcedure.field_handed_over is None
+
+
+def test_field_is_handed_over_and_taken_over(tmp_path):
+    first, second = SequencePlanner(handover=True).plan(
+        [procedure(tmp_path), procedure(tmp_path, field_mT=200.)])
+
+    run(first)
+    assert first.source.current > 0
+    assert MeasurementProcedure.field_handed_over == (first.source, first.field_ramp_rate)
+
+    second.startup()
+    assert MeasurementProcedure.field_handed_over is None
+    assert first.source.current > 0
+    second.shutdown()
+
+
+def test_field_is_ramped_down_if_the_next_measurement_does_not_take_it(tmp_path):
+    first, _ = SequencePlanner(handover=True).plan([procedure(tmp_path), procedure(tmp_path)])
+    run(first)
+
+    # E.g. the next measurement was removed from the queue
+    other = procedure(tmp_path, field_control=False)
+    other.startup()
+
+    assert first.source.current == 0
+    assert MeasurementProcedure.field_handed_over is None
+    other.shutdown()
+
+
+def test_release_at_the_end_of_the_queue(tmp_path):
+    first, _ = SequencePlanner(handover=True).plan([procedure(tmp_path), procedure(tmp_path)])
+    run(first)
+
+    MeasurementProcedure.release_field()
+    MeasurementProcedure.release_field()
+
+    assert first.source.current == 0
+
+
+def test_stopped_measurement_does_not_hand_over(tmp_path):
+    first, _ = SequencePlanner(handover=True).plan([procedure(tmp_path), procedure(tmp_path)])
+    first.startup()
+    first.execute()
+    first.should_stop = lambda: True
+    first.shutdown()
+
+    assert first.source.current == 0
+    assert MeasurementProcedure.field_handed_over is None
@@ -0,0 +1,73 @@
+import logging
+
+import pytest
+
+import headless
+from electrical_switching import MeasurementProcedure
+
+SIMULATION = ["--set", "AAF_simulation=true", "--set", "number_of_repeats=1",
+              "--set", "probe_duration=0.5"]
+
+
+@pytest.fixture(autouse=True)
+def restore_logging():
+    """ Remove the log handlers that are added by the runner.
+    """
+    root = logging.getLogger("")
+    handlers, level = list(root.handlers), root.level
+    yield
+    for handler in root.handlers:
+        if handler not in handlers:
+            root.removeHandler(handler)
+            handler.close()
+    root.setLevel(level)
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    """ Run from an empty working directory, which should stay empty.
+    """
+    cwd = tmp_path / "cwd"
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    yield tmp_path / "data"
+    assert list(cwd.iterdir()) == []
+
+
+def test_run_without_config_file(folder, tmp_path):
+    status = headless.main(SIMULATION + [
+        "--set", f"AAC_folder={folder}", "--set", "AAE_yaml_config_file=missing.yml",
+        "--log-file", str(tmp_path / "run.log")])
+
+    assert status == 0
+    assert (folder / "electrical_switching_1.txt").is_file()
+    assert (folder / "missing.yml").is_file()
+    assert "Finished measurement" in (tmp_path / "run.log").read_text()
+
+
+def failing_startup(procedure):
+    raise RuntimeError("Instrument not found")
+
+
+def test_failed_startup_skips_the_remaining_measurements(folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(MeasurementProcedure, "connect_simulated_instruments", failing_startup)
+    parameters = tmp_path / "measurements.yml"
+    parameters.write_text(f"- AAC_folder: {folder}\n- AAC_folder: {folder}\n")
+
+    status = headless.main([str(parameters), "--log-file", str(tmp_path / "run.log")] + SIMULATION)
+
+    assert status == 1
+    assert sorted(path.name for path in folder.glob("*.txt")) == ["electrical_switching_1.txt"]
+    assert "skipping the remaining 1 measurements" in (tmp_path / "run.log").read_text()
+
+
+def test_failed_startup_keep_going(folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(MeasurementProcedure, "connect_simulated_instruments", failing_startup)
+    parameters = tmp_path / "measurements.yml"
+    parameters.write_text(f"- AAC_folder: {folder}\n- AAC_folder: {folder}\n")
+
+    status = headless.main([str(parameters), "--keep-going",
+                            "--log-file", str(tmp_path / "run.log")] + SIMULATION)
+
+    assert status == 1
+    assert len(list(folder.glob("*.txt"))) == 2
@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import pytest
+
+from addons import PulseSource
+from electrical_switching import MeasurementProcedure
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yml"
+
+
+@pytest.mark.parametrize("length, delay, number, expected", [
+    (1e-3, 9e-3, 3, (1e-2, 1, 10, 2.1)),
+    (2e-3, 2e-3, 2, (4e-3, 1, 2, 1.5)),
+    (0.25, 0.75, 4, (1., 1, 4, 3.25)),
+    (3e-3, 0.2, 2, (0.203, 3, 203, 1.015)),
+    (3e-3, 5., 4, (5.004, 1, 1668, 3.001)),  # The default pulse
+])
+def test_burst_schedule_keeps_the_requested_timing(length, delay, number, expected):
+    period, high, points, cycles = PulseSource.burst_schedule(length, delay, number)
+
+    assert period == pytest.approx(expected[0])
+    assert (high, points) == expected[1:3]
+    assert cycles == pytest.approx(expected[3])
+    assert period == pytest.approx(length + delay, rel=PulseSource.PERIOD_TOLERANCE)
+
+    # The pulse length is exact, and the burst ends after the last pulse
+    assert period * high / points == pytest.approx(length)
+    assert cycles * period >= (number - 1) * period + length
+
+
+@pytest.mark.parametrize("length, delay", [
+    (3e-3, 200.),  # Too many points
+    (1e-3, 0.),  # No delay between the pulses
+    (1e-7, 4.9e-6),  # The frequency is too high
+    (1., 1000.),  # The frequency is too low
+])
+def test_burst_schedule_rejects_timing_it_cannot_represent(length, delay):
+    assert PulseSource.burst_schedule(length, delay, 3) is None
+
+
+def test_arbitrary_waveform_is_only_written_when_changed(simulation):
+    pulse_source = PulseSource(simulation.k6221)
+
+    pulse_source.configure(waveform_arbitrary=(1, 250), waveform_offset=0)
+    assert simulation.k6221.waveform_function == "arbitrary1"
+    assert list(simulation.k6221.arbitrary[1]) == [1] + [0] * 249
+    assert pulse_source.armed and simulation.k6221.armed
+
+    simulation.k6221.arbitrary.clear()
+    assert not pulse_source.configure(waveform_arbitrary=(1, 250), waveform_offset=0)
+    assert simulation.k6221.arbitrary == {}
+
+    # Returning to the square wave selects it again
+    pulse_source.configure(waveform_function="square", waveform_offset=0)
+    assert simulation.k6221.waveform_function == "square"
+
+
+def test_hardware_timed_burst_is_armed_before_routing(tmp_path):
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(tmp_path),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAF_simulation": True,
+        "number_of_repeats": 1,
+        "pulse_number_of_bursts": 1,
+        "pulse_burst_length": 3,
+        "pulse_hardware_timed": True,
+        "probe_duration": 0.5,
+    })
+    procedure.results_filename = str(tmp_path / "run.txt")
+    procedure.emit = lambda topic, record: None
+    procedure.should_stop = lambda: False
+    procedure.startup()
+
+    k6221 = procedure.k6221
+    routed = list()
+    route = procedure.matrix.route
+
+    def record_route(rows=(), columns=()):
+        if procedure.row_pulse_hi in rows:
+            routed.append((k6221.armed, k6221.waveform_function, k6221.waveform_offset))
+        route(rows=rows, columns=columns)
+
+    procedure.matrix.route = record_route
+    procedure.execute()
+    procedure.shutdown()
+
+    assert len(routed) == len(procedure.pulse_sequence)
+    assert set(routed) == {(True, "arbitrary1", 0)}
+    assert not k6221.armed
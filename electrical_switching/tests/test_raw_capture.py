@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from addons import RawCapture, read_raw_index
+from electrical_switching import MeasurementProcedure
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yml"
+
+
+def test_raw_capture_streams_without_changing_the_parameters(tmp_path):
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(tmp_path),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAF_simulation": True,
+        "number_of_repeats": 1,
+        "pulse_number_of_bursts": 1,
+        "probe_duration": 0.5,
+        "probe_raw_capture": True,
+    })
+    procedure.results_filename = str(tmp_path / "run.txt")
+    procedure.emit = lambda topic, record: None
+    procedure.should_stop = lambda: False
+
+    procedure.startup()
+    procedure.execute()
+    procedure.shutdown()
+
+    assert procedure.streaming
+    assert not procedure.probe_streaming
+
+    with open(tmp_path / "run.raw" / RawCapture.METADATA, "r") as file:
+        metadata = json.load(file)
+    assert metadata["parameters"]["probe_streaming"] == "False"
+
+    index = read_raw_index(tmp_path / "run.raw")
+    assert len(index["pulse number"]) > 0
+    assert (index["count"] > 0).all()
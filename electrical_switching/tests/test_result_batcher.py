@@ -0,0 +1,76 @@
+from addons import BatchFormatter, ResultBatcher
+
+
+class Emitter(object):
+    def __init__(self):
+        self.records = list()
+
+    def __call__(self, topic, record):
+        assert topic == "results"
+        self.records.append(record)
+
+
+def test_single_rows_are_emitted_directly():
+    emit = Emitter()
+    batcher = ResultBatcher(emit, max_rows=1)
+
+    batcher.append({"a": 1})
+    batcher.append({"a": 2})
+
+    assert emit.records == [{"a": 1}, {"a": 2}]
+    assert (batcher.number_rows, batcher.number_blocks) == (2, 2)
+
+
+def test_rows_are_emitted_in_blocks():
+    emit = Emitter()
+    batcher = ResultBatcher(emit, max_rows=3)
+
+    for i in range(7):
+        batcher.append({"a": i})
+    assert emit.records == [[{"a": 0}, {"a": 1}, {"a": 2}], [{"a": 3}, {"a": 4}, {"a": 5}]]
+
+    batcher.flush()
+    batcher.flush()
+    assert emit.records[-1] == [{"a": 6}]
+    assert (batcher.number_rows, batcher.number_blocks) == (7, 3)
+
+
+def test_old_rows_are_emitted(clock):
+    emit = Emitter()
+    batcher = ResultBatcher(emit, max_rows=100, max_age=1., clock=clock)
+
+    batcher.append({"a": 0})
+    clock.advance(0.5)
+    batcher.append({"a": 1})
+    assert emit.records == []
+
+    clock.advance(0.5)
+    batcher.append({"a": 2})
+    assert emit.records == [[{"a": 0}, {"a": 1}, {"a": 2}]]
+
+
+def test_blocks_are_formatted_as_lines():
+    formatter = BatchFormatter(columns=["a", "b"])
+
+    assert formatter.format({"a": 1, "b": 2}) == "1,2"
+    assert formatter.format([{"a": 1, "b": 2}, {"a": 3, "b": 4}]).splitlines() == ["1,2", "3,4"]
+
+
+def test_rows_are_not_held_back_during_a_wait(clock):
+    emit = Emitter()
+    batcher = ResultBatcher(emit, max_rows=100, max_age=1., clock=clock)
+
+    batcher.expire(5.)
+    batcher.append({"a": 0})
+    batcher.expire(0.5)
+    assert emit.records == []
+
+    # The row would exceed the maximum age before the wait ends
+    batcher.expire(5.)
+    assert emit.records == [[{"a": 0}]]
+
+    # Without a maximum age, the rows are kept until the block is full
+    batcher = ResultBatcher(emit, max_rows=100, clock=clock)
+    batcher.append({"a": 1})
+    batcher.expire(1e6)
+    assert len(emit.records) == 1
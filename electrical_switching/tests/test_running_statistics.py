@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from addons import RunningStatistics
+
+
+def test_blocks_give_the_statistics_of_all_values():
+    rng = np.random.default_rng(1)
+    values = rng.normal(5, 2, 1000)
+
+    statistics = RunningStatistics()
+    for block in np.split(values, [1, 10, 11, 500]):
+        statistics.add(block)
+
+    assert statistics.count == 1000
+    assert statistics.mean == pytest.approx(values.mean())
+    assert statistics.variance == pytest.approx(values.var(ddof=1))
+    assert statistics.standard_error() == pytest.approx(values.std(ddof=1) / np.sqrt(1000))
+
+
+def test_merge_and_nan_values():
+    first, second = RunningStatistics(), RunningStatistics()
+    first.add([1., np.nan, 2.])
+    second.add(np.array([3., 4., np.nan]))
+    second.add(np.nan)
+
+    first.merge(second)
+    first.merge(RunningStatistics())
+
+    assert first.count == 4
+    assert first.mean == pytest.approx(2.5)
+    assert first.variance == pytest.approx(np.var([1, 2, 3, 4], ddof=1))
+
+
+def test_standard_error_with_correlated_values():
+    statistics = RunningStatistics()
+    statistics.add(np.arange(100.))
+
+    assert statistics.standard_error(25) == pytest.approx(np.sqrt(statistics.variance / 25))
+    assert statistics.standard_error(1000) == pytest.approx(statistics.standard_error())
+    assert statistics.standard_error(0) == pytest.approx(np.sqrt(statistics.variance))
+
+
+def test_fewer_than_two_values():
+    statistics = RunningStatistics()
+    assert np.isnan(statistics.mean) and np.isnan(statistics.standard_error())
+
+    statistics.add(3.)
+    assert statistics.mean == 3.
+    assert np.isnan(statistics.variance)
@@ -0,0 +1,120 @@
+import pytest
+
+from addons import SequenceCompiler
+
+ROWS = {
+    "pulse high": 5,
+    "pulse low": 6,
+    "lock-in input A": 1,
+    "lock-in input B": 2,
+    "lock-in output A": 3,
+    "lock-in output B": 4,
+}
+
+
+def probe(current_high, current_low, voltage_high, voltage_low, frequency=79):
+    return {"current high": current_high, "current low": current_low,
+            "voltage high": voltage_high, "voltage low": voltage_low,
+            "time constant": 0.1, "frequency": frequency, "amplitude": 5, "harmonics": []}
+
+
+def compiler(pulses=None, probes=None, rows=None, number_of_bursts=2, reorder=False,
+             keep_routing=False):
+    pulses = {"1": {"high": 1, "low": 2}, "2": {"high": 3, "low": 4}} \
+        if pulses is None else pulses
+    probes = {1: probe(1, 3, 2, 4), 2: probe(1, 3, 2, 4, frequency=1000),
+              3: probe(1, 3, 2, 5)} if probes is None else probes
+    names = {1: "Rxy", 2: "Rxy2f", 3: "Rxx"}
+    return SequenceCompiler(ROWS if rows is None else rows, pulses, probes,
+                            {number: names[number] for number in probes}, number_of_bursts,
+                            reorder=reorder, keep_routing=keep_routing)
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"rows": {**ROWS, "pulse low": 7}}, "Invalid row 7"),
+    ({"rows": {**ROWS, "pulse low": 5}}, "more than one connection"),
+    ({"pulses": {"1": {"high": [1, 2], "low": 2}}}, "both the high and the low side"),
+    ({"pulses": {"1": {"high": 9, "low": 2}}}, "Invalid column 9"),
+    ({"pulses": {"1": {"high": 1}}}, "no \"low\" columns"),
+    ({"probes": {1: probe(1, 1, 2, 4)}}, "both the"),
+    ({"probes": {1: {"current high": 1}}}, "has no \"current low\" column"),
+])
+def test_invalid_routing_is_rejected(kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        compiler(**kwargs).compile()
+
+
+@pytest.mark.parametrize("sequence, message", [
+    ({"pulse": 1}, "list of steps"),
+    ([{"bursts": 1}], "has no pulse"),
+    ([{"pulse": 3}], "Unknown pulse 3"),
+    ([{"pulse": 1, "probes": ["Ryy"]}], "Unknown probe 'Ryy'"),
+    ([{"pulse": 1, "bursts": 0}], "Invalid number of bursts"),
+    ([{"pulse": 1, "repeat": 2}], "unknown keys"),
+])
+def test_invalid_sequence_is_rejected(sequence, message):
+    with pytest.raises(ValueError, match=message):
+        compiler().compile(sequence)
+
+
+def test_default_sequence_applies_every_pulse_followed_by_all_probes():
+    pulses = {"1": {"high": 1, "low": 2, "number of bursts": 1}, "2": {"high": 3, "low": 4}}
+    cycles = compiler(pulses=pulses).compile()
+
+    assert [pulse for pulse, _ in cycles] == ["1", "2", "2"]
+    assert all(probes == (1, 2, 3) for _, probes in cycles)
+
+
+def test_listed_probe_order_is_kept_unless_reordering():
+    sequence = [{"pulse": 1, "bursts": 2, "probes": ["Rxy2f", "Rxx", "probe Rxy"]}]
+
+    assert compiler().compile(sequence) == [("1", (2, 3, 1)), ("1", (2, 3, 1))]
+    assert compiler(reorder=True).compile(sequence) != compiler().compile(sequence)
+
+
+def test_probes_are_grouped_by_lockin_settings_then_by_routing():
+    sequence = [
+        {"pulse": 1, "bursts": 2, "probes": ["Rxy2f", "Rxx", "probe Rxy"]},
+        {"pulse": "pulse 2", "probes": []},
+    ]
+    cycles = compiler(reorder=True, keep_routing=True).compile(sequence)
+
+    # Rxy and Rxx share the lock-in settings (and most of their routing);
+    # after Rxx, the lock-in is already set up for the next cycle, which
+    # starts from the disconnected matrix
+    assert cycles == [("1", (2, 1, 3)), ("1", (3, 1, 2)), ("2", ()), ("2", ())]
+
+
+def test_report_counts_the_reconfigurations_of_all_repeats():
+    compiled = compiler(reorder=True)
+    cycles = compiled.compile([
+        {"pulse": 1, "bursts": 1, "probes": ["Rxy", "Rxy2f"]},
+        {"pulse": 2, "bursts": 1},
+    ])
+
+    report = compiled.report(cycles, number_of_repeats=5,
+                             pulsing_time=lambda pulse: 1., probing_time=lambda probe: 0.5)
+    single = compiled.count(cycles * 5, frozenset(), None)
+
+    assert report["cycles"] == 10
+    assert report["lock-in changes"] == 5 * 2 + 1
+    assert (report["relay switches"], report["lock-in changes"]) == single[:2]
+    assert report["dead time"] == pytest.approx(5 * (2 * 1. + 5 * 0.5))
+
+
+def test_report_of_open_ended_measurements_is_fast():
+    compiled = compiler()
+    report = compiled.report(compiled.compile(), number_of_repeats=10**9)
+
+    assert report["cycles"] == 4 * 10**9
+
+
+@pytest.mark.parametrize("keep_routing", [False, True])
+def test_report_counts_the_relay_switches_of_the_routing(keep_routing):
+    compiled = compiler(keep_routing=keep_routing)
+    cycles = compiled.compile([{"pulse": 1, "bursts": 1, "probes": ["Rxy", "Rxx"]}])
+
+    # Rxy and Rxx have 4 crosspoints each, of which 3 are shared; the pulse
+    # has 2 crosspoints, which are closed and opened
+    probes = 4 + 2 + 4 if keep_routing else 4 * 4
+    assert compiled.report(cycles)["relay switches"] == 2 * 2 + probes
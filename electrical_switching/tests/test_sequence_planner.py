@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+from addons import SequencePlanner
+
+
+def measurement(name, temperature=None, field=None):
+    return SimpleNamespace(
+        name=name,
+        temperature_control=temperature is not None,
+        temperature_sp=temperature,
+        field_control=field is not None,
+        field_mT=field,
+        field_ramp_rate=0.1,
+        field_calibration=10.,
+    )
+
+
+def names(procedures):
+    return [procedure.name for procedure in procedures]
+
+
+def test_temperatures_are_visited_monotonically_from_the_nearest_end():
+    procedures = [
+        measurement("a", 20), measurement("b", 300), measurement("c", 10),
+        measurement("d", 100), measurement("e"),
+    ]
+
+    planned = SequencePlanner().plan(procedures)
+
+    assert names(planned) == ["e", "c", "a", "d", "b"]
+    assert names(SequencePlanner().plan(procedures[1:4])) == ["b", "d", "c"]
+
+
+def test_fields_follow_a_nearest_neighbour_path_and_are_handed_over():
+    procedures = [
+        measurement("a", 10, 300), measurement("b", 10, 0), measurement("c", 10, 100),
+        measurement("d", 10, 100), measurement("e", 10),
+    ]
+
+    planned = SequencePlanner(handover=True).plan(procedures)
+
+    assert names(planned) == ["b", "e", "c", "d", "a"]
+    assert [p.field_to_next for p in planned] == [False, False, True, True, False]
+    assert [p.field_from_previous for p in planned] == [False, False, False, True, True]
+
+
+def test_without_reordering_and_handover_the_order_is_kept():
+    procedures = [measurement("a", 300, 300), measurement("b", 10, 0), measurement("c", 300, 200)]
+    procedures[0].field_to_next = True
+
+    planned = SequencePlanner(reorder=False, handover=False).plan(procedures)
+
+    assert names(planned) == ["a", "b", "c"]
+    assert not any(p.field_to_next or p.field_from_previous for p in planned)
+
+
+def test_cost_of_the_field_ramps_and_temperature_changes():
+    procedures = [measurement("a", 10, 100), measurement("b", 20, 300), measurement("c", 10)]
+    planner = SequencePlanner()
+
+    # Ramp rate of 1 mT/s: 0 -> 100 -> 0 -> 300 -> 0
+    assert planner.cost(procedures) == pytest.approx((800., 20.))
+    # 0 -> 100 -> 300 -> 0
+    assert planner.cost(procedures, handover=True) == pytest.approx((600., 20.))
@@ -0,0 +1,45 @@
+from addons import SessionPool
+import electrical_switching
+from electrical_switching import MeasurementProcedure
+
+
+class Session(object):
+
+    def __init__(self):
+        self.open = True
+        self.responding = True
+
+    def check(self):
+        if not self.responding:
+            raise ConnectionError()
+
+    def close(self):
+        self.open = False
+
+
+def get(pool, name, session):
+    return pool.get(name, lambda: session, check=Session.check, close=Session.close)
+
+
+def test_sessions_are_reused_until_they_do_not_respond():
+    pool = SessionPool()
+    first, second = Session(), Session()
+
+    assert get(pool, "k2700", first) is first
+    assert get(pool, "k2700", second) is first
+
+    first.responding = False
+    assert get(pool, "k2700", second) is second
+    assert not first.open
+    assert (pool.number_opened, pool.number_reused) == (2, 1)
+
+
+def test_close_connections_closes_all_sessions(monkeypatch):
+    pool = SessionPool()
+    monkeypatch.setattr(electrical_switching, "sessions", pool)
+    sessions = [get(pool, name, Session()) for name in ["k2700", "lockin"]]
+
+    MeasurementProcedure.close_connections()
+
+    assert pool.sessions == {}
+    assert not any(session.open for session in sessions)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from addons import SettlingDetector
+
+
+def step_response(timestamps, time_constant):
+    return 1 - np.exp(-timestamps / time_constant)
+
+
+def feed(detector, timestamps, values, block=10):
+    for start in range(0, len(timestamps), block):
+        detector.add(timestamps[start:start + block], values[start:start + block])
+        if detector.settled():
+            return detector.settled_at
+    return None
+
+
+def test_step_response_settles_once_within_tolerance():
+    time_constant = 0.1
+    timestamps = np.arange(0, 3, 1e-3)
+    values = step_response(timestamps, time_constant)
+
+    detector = SettlingDetector(tolerance=1e-3, window=time_constant)
+    settled_at = feed(detector, timestamps, values)
+
+    # The remaining deviation is about 1.6 times the change between windows
+    assert settled_at is not None
+    assert 1 - step_response(settled_at, time_constant) < 2e-3
+    assert 1 - step_response(settled_at - 2 * time_constant, time_constant) > 1e-3
+
+
+def test_noise_does_not_prevent_settling():
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(0, 1, 1e-3)
+    values = 1 + rng.normal(0, 0.05, len(timestamps))
+
+    detector = SettlingDetector(tolerance=1e-4, window=0.1)
+    settled_at = feed(detector, timestamps, values)
+
+    assert settled_at is not None and settled_at < 0.5
+
+
+def test_two_full_windows_are_required():
+    detector = SettlingDetector(tolerance=1e-3, window=1.)
+    timestamps = np.arange(21) / 10
+    detector.add(timestamps[:15], np.ones(15))
+    assert not detector.settled()
+
+    detector.add(timestamps[15:], np.ones(6))
+    assert detector.settled()
+    assert detector.settled()
+    assert detector.settled_at == detector.timestamps[-1]
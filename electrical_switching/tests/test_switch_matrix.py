@@ -0,0 +1,133 @@
+from pathlib import Path
+
+import pytest
+
+from addons import SwitchMatrix
+from addons.Simulation import SimulatedKeithley2700
+from electrical_switching import MeasurementProcedure
+
+CONFIG = Path(__file__).resolve().parents[1] / "config.yml"
+
+
+class RecordingKeithley2700(object):
+    """ Matrix that records the relay operations in the order they are sent.
+    """
+
+    channels_from_rows_columns = staticmethod(SimulatedKeithley2700.channels_from_rows_columns)
+
+    def __init__(self):
+        self.operations = list()
+        self.fail = False
+
+    def open_all_channels(self):
+        self.operations.append(("open all",))
+
+    @property
+    def open_channels(self):
+        raise AttributeError("open_channels can only be set")
+
+    @open_channels.setter
+    def open_channels(self, channels):
+        self.operations.append(("open", list(channels)))
+
+    @property
+    def closed_channels(self):
+        raise AttributeError("closed_channels is not read by the SwitchMatrix")
+
+    @closed_channels.setter
+    def closed_channels(self, channels):
+        if self.fail:
+            raise IOError("GPIB timeout")
+        self.operations.append(("close", list(channels)))
+
+
+def test_route_opens_before_it_closes_and_only_sends_changes():
+    k2700 = RecordingKeithley2700()
+    matrix = SwitchMatrix(k2700)
+    matrix.reset()
+
+    matrix.route(rows=[1, 2], columns=[1, 2])
+    matrix.route(rows=[1, 2], columns=[1, 3])
+
+    assert k2700.operations == [
+        ("open all",),
+        ("close", [1, 10]),
+        ("open", [10]),
+        ("close", [11]),
+    ]
+    assert matrix.closed == {1, 11}
+    assert (matrix.number_opened, matrix.number_closed) == (1, 3)
+
+
+def test_unchanged_routing_sends_nothing():
+    k2700 = RecordingKeithley2700()
+    matrix = SwitchMatrix(k2700)
+
+    matrix.route(rows=[1], columns=[[1, 2]])
+    k2700.operations.clear()
+    matrix.route(rows=[1], columns=[[2, 1]])
+
+    assert k2700.operations == []
+
+
+def test_disconnect_opens_the_closed_channels():
+    k2700 = RecordingKeithley2700()
+    matrix = SwitchMatrix(k2700)
+    matrix.route(rows=[5, 6], columns=[1, 2])
+    k2700.operations.clear()
+
+    matrix.disconnect()
+
+    assert k2700.operations == [("open", [33, 42])]
+    assert matrix.closed == set()
+
+
+def test_failed_command_resets_the_matrix_on_the_next_route():
+    k2700 = RecordingKeithley2700()
+    matrix = SwitchMatrix(k2700)
+    matrix.route(rows=[1], columns=[1])
+
+    k2700.fail = True
+    with pytest.raises(IOError):
+        matrix.route(rows=[1], columns=[2])
+    assert matrix.closed is None
+
+    k2700.fail = False
+    k2700.operations.clear()
+    matrix.route(rows=[1], columns=[2])
+
+    assert k2700.operations == [("open all",), ("close", [2])]
+
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_probe_channels_are_disconnected_after_probing(tmp_path, pipelined):
+    procedure = MeasurementProcedure()
+    procedure.set_parameters({
+        "AAC_folder": str(tmp_path),
+        "AAE_yaml_config_file": str(CONFIG),
+        "AAF_simulation": True,
+        "number_of_repeats": 1,
+        "pulse_number_of_bursts": 1,
+        "probe_duration": 0.5,
+        "probe_pipelined": pipelined,
+    })
+    procedure.results_filename = str(tmp_path / "run.txt")
+    procedure.emit = lambda topic, record: None
+    procedure.should_stop = lambda: False
+    procedure.startup()
+
+    # The routing that is closed when a pulse is routed
+    closed = list()
+    route = procedure.matrix.route
+
+    def record_route(rows=(), columns=()):
+        if procedure.row_pulse_hi in rows:
+            closed.append(set(procedure.matrix.closed))
+        route(rows=rows, columns=columns)
+
+    procedure.matrix.route = record_route
+    procedure.execute()
+
+    assert closed == [set()] * len(procedure.pulse_sequence)
+    assert procedure.matrix.closed == set()
+    procedure.shutdown()